@@ -0,0 +1,83 @@
+"""
+ColorLab - Colour naming benchmark
+
+Compares the per-call cost of the original linear palette scan with the
+precomputed naming index, and checks that both return the same names.
+
+Usage: python benchmarks/bench_color_naming.py [--samples N]
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+import lambda_function_colorlab_complete as colorlab
+
+
+def linear_scan_color_name(r, g, b):
+    """Reference implementation: linear math.sqrt scan over COLOR_DATABASE"""
+    if (r, g, b) in colorlab.COLOR_DATABASE:
+        return colorlab.COLOR_DATABASE[(r, g, b)]
+    
+    min_distance = float('inf')
+    closest_color_name = "Unknown"
+    for (cr, cg, cb), name in colorlab.COLOR_DATABASE.items():
+        distance = math.sqrt((r - cr)**2 + (g - cg)**2 + (b - cb)**2)
+        if distance < min_distance:
+            min_distance = distance
+            closest_color_name = name
+    
+    if min_distance > 100:
+        return colorlab.get_generic_color_name(r, g, b)
+    return closest_color_name
+
+
+def time_per_call(fn, colors):
+    """Mean microseconds per call of fn(r, g, b)"""
+    start = time.perf_counter()
+    for r, g, b in colors:
+        fn(r, g, b)
+    return (time.perf_counter() - start) / len(colors) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--samples', type=int, default=50000)
+    args = parser.parse_args()
+    
+    rng = np.random.default_rng(0)
+    array = rng.integers(0, 256, (args.samples, 3))
+    colors = [tuple(c) for c in array.tolist()]
+    
+    start = time.perf_counter()
+    colorlab.build_color_name_index()
+    build_ms = (time.perf_counter() - start) * 1000
+    
+    linear_us = time_per_call(linear_scan_color_name, colors)
+    indexed_us = time_per_call(colorlab.get_accurate_color_name, colors)
+    
+    start = time.perf_counter()
+    vectorized = colorlab.get_accurate_color_names(array)
+    vectorized_us = (time.perf_counter() - start) / len(colors) * 1e6
+    
+    mismatches = sum(
+        1 for (r, g, b), name in zip(colors, vectorized)
+        if not (linear_scan_color_name(r, g, b) == colorlab.get_accurate_color_name(r, g, b) == name)
+    )
+    
+    print(f"Palette entries:        {len(colorlab.COLOR_DATABASE)}")
+    print(f"Index build:            {build_ms:.1f} ms")
+    print(f"Linear scan:            {linear_us:.2f} us/call")
+    print(f"Indexed (scalar):       {indexed_us:.2f} us/call ({linear_us / indexed_us:.1f}x)")
+    print(f"Indexed (vectorized):   {vectorized_us:.2f} us/colour ({linear_us / vectorized_us:.1f}x)")
+    print(f"Mismatches:             {mismatches} / {len(colors)}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
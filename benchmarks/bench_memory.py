@@ -0,0 +1,100 @@
+"""
+ColorLab - Peak memory benchmark
+
+Runs one full analysis of a synthetic photo-like image and reports the
+process peak RSS. By default the image is decoded at full resolution
+(--max-dimension 0); pass a limit to measure the regular decode path, and
+--streaming on/off to force the strip-wise mode. Streaming bounds the
+analysis working arrays only: the decoded raster is part of the peak in both
+modes. Each measurement runs in a fresh interpreter so earlier allocations do
+not hide the peak.
+
+Usage: python benchmarks/bench_memory.py [--megapixels 12] [--max-dimension 0] [--streaming auto|on|off]
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def synthetic_jpeg(megapixels, seed=0):
+    """Deterministic 4:3 photo-like JPEG: gradients, flat blocks and noise"""
+    import numpy as np
+    from PIL import Image
+    
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    rng = np.random.default_rng(seed)
+    y, x = np.ogrid[0:height, 0:width]
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[..., 0] = (x * 255 // width).astype(np.uint8)
+    image[..., 1] = (y * 255 // height).astype(np.uint8)
+    image[..., 2] = ((x + y) % 256).astype(np.uint8)
+    image[height // 4:height // 2, width // 4:width // 2] = (200, 30, 40)
+    image[height // 2:] = np.clip(image[height // 2:] + rng.integers(-20, 21, (height - height // 2, width, 3)), 0, 255)
+    
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def measure(megapixels, max_dimension, streaming):
+    """Child process: analyze one image and print JSON results"""
+    sys.path.insert(0, ROOT)
+    image_data = base64.b64encode(synthetic_jpeg(megapixels)).decode()
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    
+    import contextlib
+    with contextlib.redirect_stdout(io.StringIO()):
+        import lambda_function_colorlab_complete as colorlab
+        start = time.perf_counter()
+        options = {'max_dimension': max_dimension, 'cache': False}
+        if streaming != 'auto':
+            options['streaming'] = streaming == 'on'
+        analysis = colorlab.perform_enhanced_colorlab_analysis(image_data, options)
+        elapsed = time.perf_counter() - start
+    
+    print(json.dumps({
+        'megapixels': megapixels,
+        'max_dimension': max_dimension,
+        'streamed': analysis.get('metadata', {}).get('streamed'),
+        'pixels': analysis.get('metadata', {}).get('total_color_samples'),
+        'error': analysis.get('error'),
+        'seconds': round(elapsed, 2),
+        'input_peak_rss_mb': round(baseline_kb / 1024, 1),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--megapixels', type=float, default=12)
+    parser.add_argument('--max-dimension', type=int, default=0)
+    parser.add_argument('--streaming', choices=('auto', 'on', 'off'), default='auto')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.child:
+        measure(args.megapixels, args.max_dimension, args.streaming)
+        return 0
+    
+    output = subprocess.run(
+        [sys.executable, __file__, '--child', '--megapixels', str(args.megapixels),
+         '--max-dimension', str(args.max_dimension), '--streaming', args.streaming],
+        check=True, capture_output=True, text=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    for key, value in result.items():
+        print(f"{key:20s} {value}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+ColorLab - Palette index benchmark
+
+Builds a palette index of synthetic palettes in a temporary directory (or
+--dir) and reports bulk insert throughput, single-palette insert latency,
+query latency and recall@N of the hashed search against an exact scan of
+every signature. Palettes are drawn around a few thousand random themes, so
+each query has genuinely similar neighbours.
+
+Usage: python benchmarks/bench_palette_index.py [--sizes 10000 100000 1000000] [--queries 200] [--top-n 10]
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import lambda_function_colorlab_complete as colorlab
+
+import numpy as np
+
+THEMES = 5000
+
+
+def synthetic_palettes(count, rng, start=0):
+    """(image_id, colors, weights) palettes jittered around random themes"""
+    themes = rng.integers(0, 256, (THEMES, colorlab.PALETTE_MAX_COLORS, 3))
+    palettes = []
+    for i in range(count):
+        size = int(rng.integers(3, colorlab.PALETTE_MAX_COLORS + 1))
+        colors = np.clip(themes[rng.integers(THEMES), :size] + rng.normal(0, 12, (size, 3)), 0, 255).astype(np.uint8)
+        palettes.append((f"img-{start + i}", [tuple(int(v) for v in c) for c in colors], rng.dirichlet(np.ones(size))))
+    return palettes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-n', type=int, default=10)
+    parser.add_argument('--candidates', type=int, default=colorlab.PALETTE_CANDIDATES)
+    parser.add_argument('--chunk', type=int, default=20000, help='palettes per bulk insert')
+    parser.add_argument('--dir', help='index directory (default: a new temporary directory)')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    index = colorlab.PaletteIndex(args.dir or tempfile.mkdtemp(prefix='colorlab-palettes-'))
+    queries = [colorlab.palette_signature(colors, weights) for _, colors, weights in synthetic_palettes(args.queries, rng)]
+
+    print(f"{'size':>9s} {'bulk rows/s':>12s} {'insert ms':>10s} {'query p50':>10s} {'query p95':>10s} "
+          f"{'exact p50':>10s} {'recall@' + str(args.top_n):>10s}")
+    for size in sorted(args.sizes):
+        start = time.perf_counter()
+        added = len(index)
+        while added < size:
+            batch = synthetic_palettes(min(args.chunk, size - added), rng, added)
+            added = index.add_many(batch)
+        bulk_rate = size / (time.perf_counter() - start) if added else 0
+
+        insert_ms = []
+        for image_id, colors, weights in synthetic_palettes(20, rng, size):
+            began = time.perf_counter()
+            index.add(f"single-{image_id}", colors, weights)
+            insert_ms.append((time.perf_counter() - began) * 1000)
+
+        query_ms, exact_ms, hits = [], [], 0
+        for signature in queries:
+            began = time.perf_counter()
+            found, _ = index.search(signature, args.top_n, candidates=args.candidates)
+            query_ms.append((time.perf_counter() - began) * 1000)
+            began = time.perf_counter()
+            exact, _ = index.search(signature, args.top_n, candidates=len(index))
+            exact_ms.append((time.perf_counter() - began) * 1000)
+            hits += len({r[0] for r in found} & {r[0] for r in exact})
+
+        print(f"{len(index):9d} {bulk_rate:12.0f} {statistics.median(insert_ms):10.2f} "
+              f"{statistics.median(query_ms):10.2f} {np.percentile(query_ms, 95):10.2f} "
+              f"{statistics.median(exact_ms):10.2f} {hits / (len(queries) * args.top_n):10.3f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+ColorLab - Quality tier benchmark
+
+Analyzes synthetic images at every quality tier and reports latency
+(analyze_image_bytes, best of --repeat) and accuracy against the exact tier:
+the total variation distance between normalized RGB histograms, the worst
+ratio of error to reported 95% margin over the averages and percentages
+that carry margins, and how many of those errors fall inside their margin.
+
+Usage: python benchmarks/bench_quality.py [--kinds photo noise] [--megapixels 1 12] [--repeat 5]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('COLORLAB_EMF_METRICS', '0')
+
+from bench_stages import IMAGE_KINDS, synthetic_jpeg
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import lambda_function_colorlab_complete as colorlab
+
+
+def analyze(image_bytes, quality, repeat):
+    """Best-of-repeat milliseconds and the analysis at one quality tier"""
+    best, analysis = float('inf'), None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            analysis = colorlab.analyze_image_bytes(image_bytes, {'cache': False, 'quality': quality})
+            best = min(best, time.perf_counter() - start)
+    return best * 1000, analysis
+
+
+def estimates(analysis):
+    """(name, value, margin, display resolution) for the statistics that carry error margins"""
+    spaces, characteristics = analysis['color_spaces'], analysis['characteristics']
+    rows = [(f"rgb.{channel}", spaces['rgb'][channel]['avg'], spaces['rgb'][channel].get('avg_margin'), 0.1)
+            for channel in ('red', 'green', 'blue')]
+    rows += [(f"lab.{channel}", spaces['lab'][channel]['avg'], spaces['lab'][channel].get('avg_margin'), 0.01)
+             for channel in ('L', 'a', 'b')]
+    rows += [
+        ('warm_percentage', characteristics['temperature']['warm_percentage'],
+         characteristics['temperature'].get('percentage_margin'), 0.1),
+        ('brightness', characteristics['brightness']['average'],
+         characteristics['brightness'].get('average_margin'), 0.001),
+        ('saturation', characteristics['saturation']['average'],
+         characteristics['saturation'].get('average_margin'), 0.001)
+    ]
+    return rows
+
+
+def histogram_distance(a, b):
+    """Mean total variation distance between the normalized R, G and B histograms"""
+    distances = []
+    for channel in ('red', 'green', 'blue'):
+        x, y = a['rgb'][channel], b['rgb'][channel]
+        sx, sy = sum(x) or 1, sum(y) or 1
+        distances.append(sum(abs(p / sx - q / sy) for p, q in zip(x, y)) / 2)
+    return sum(distances) / len(distances)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--kinds', nargs='+', choices=IMAGE_KINDS, default=['photo', 'gradient', 'noise'])
+    parser.add_argument('--megapixels', type=float, nargs='+', default=[1, 12, 50])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'image':14s} {'quality':9s} {'ms':>8s} {'pixels':>8s} {'hist TVD':>9s} {'err/margin':>11s} {'in margin':>10s}")
+    for megapixels in args.megapixels:
+        for kind in args.kinds:
+            image_bytes = synthetic_jpeg(kind, megapixels)
+            name = f"{kind}-{megapixels:g}mp"
+            _, exact = analyze(image_bytes, 'exact', 1)
+            reference = {key: value for key, value, _, _ in estimates(exact)}
+            for quality in colorlab.QUALITY_TIERS:
+                elapsed, analysis = analyze(image_bytes, quality, args.repeat)
+                # Both values are rounded for display, so allow one display unit on top of the margin
+                ratios = [abs(value - reference[key]) / (margin + resolution) if margin is not None else 0.0
+                          for key, value, margin, resolution in estimates(analysis)]
+                covered = sum(1 for ratio in ratios if ratio <= 1)
+                print(f"{name:14s} {quality:9s} {elapsed:8.1f} {analysis['metadata']['total_color_samples']:8d} "
+                      f"{histogram_distance(analysis['histograms'], exact['histograms']):9.4f} {max(ratios):11.2f} "
+                      f"{covered:>4d}/{len(ratios):<5d}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+ColorLab - Response encoding benchmark
+
+Analyzes synthetic images once, then reports payload size and encoding time
+for the full and compact response forms, serialized with stdlib json and
+orjson (when installed), uncompressed and gzip/brotli (when installed)
+compressed.
+
+Usage: python benchmarks/bench_response.py [--kinds photo gradient] [--megapixels 1 12] [--repeat 20]
+"""
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bench_stages import IMAGE_KINDS, synthetic_jpeg
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import lambda_function_colorlab_complete as colorlab
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def encoders():
+    """(name, function payload -> bytes) for each available serializer"""
+    available = [('json', lambda payload: json.dumps(payload).encode('utf-8'))]
+    if orjson is not None:
+        available.append(('orjson', lambda payload: orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)))
+    return available
+
+
+def compressors():
+    """(name, function bytes -> bytes) for each available Content-Encoding"""
+    available = [('identity', lambda data: data), ('gzip', lambda data: gzip.compress(data, compresslevel=6))]
+    if brotli is not None:
+        available.append(('br', lambda data: brotli.compress(data, quality=5)))
+    return available
+
+
+def time_ms(fn, repeat):
+    """Best-of-repeat milliseconds for one call and the call's result"""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--kinds', nargs='+', choices=IMAGE_KINDS, default=['photo', 'gradient', 'noise'])
+    parser.add_argument('--megapixels', type=float, nargs='+', default=[1, 12])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'image':14s} {'form':8s} {'encoder':8s} {'encoding':9s} {'bytes':>9s} {'encode ms':>10s} {'total ms':>9s}")
+    for megapixels in args.megapixels:
+        for kind in args.kinds:
+            with contextlib.redirect_stdout(io.StringIO()):
+                full = colorlab.analyze_image_bytes(synthetic_jpeg(kind, megapixels), {'cache': False})
+                compact = colorlab.compact_analysis(
+                    colorlab.analyze_image_bytes(synthetic_jpeg(kind, megapixels), {'cache': False, 'compact': True})
+                )
+
+            for form, analysis in (('full', full), ('compact', compact)):
+                payload = {'success': True, 'analysis': analysis}
+                for encoder_name, encode in encoders():
+                    encode_ms, data = time_ms(lambda: encode(payload), args.repeat)
+                    for encoding, compress in compressors():
+                        compress_ms, body = time_ms(lambda: compress(data), args.repeat)
+                        print(f"{kind + '-' + format(megapixels, 'g') + 'mp':14s} {form:8s} {encoder_name:8s} "
+                              f"{encoding:9s} {len(body):9d} {encode_ms:10.3f} {encode_ms + compress_ms:9.3f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,252 @@
+"""
+ColorLab - Stage benchmark suite
+
+Generates deterministic synthetic images (flat fills, gradients, noise and
+photo-like mixtures) at 0.1, 1, 12 and 50 MP. Times decode, extraction and
+every analysis stage, and times the end-to-end lambda_handler using the
+test-payload.json and api-gateway-event.json event shapes. Each measurement
+is repeated after an untimed warm-up and the median and minimum are reported;
+with --trace-memory each stage's largest peak allocation is reported too.
+
+Results are written as JSON. With --compare the run is checked against a
+baseline file, and the exit status is 1 if any timing regresses by more than
+--threshold (relative) and --min-delta-ms (absolute).
+
+Usage:
+    python benchmarks/bench_stages.py [--sizes 0.1 1] [--kinds flat photo] [--repeat 3]
+    python benchmarks/bench_stages.py --save-baseline
+    python benchmarks/bench_stages.py --compare [--baseline benchmarks/baselines/stages.json] [--threshold 0.25]
+"""
+import argparse
+import base64
+import contextlib
+import copy
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baselines', 'stages.json')
+
+IMAGE_KINDS = ('flat', 'gradient', 'noise', 'photo')
+IMAGE_SIZES_MP = (0.1, 1, 12, 50)
+
+
+def synthetic_pixels(kind, megapixels, seed=0):
+    """Deterministic 4:3 (H, W, 3) uint8 image of the given kind"""
+    import numpy as np
+
+    width = max(1, int((megapixels * 1e6 * 4 / 3) ** 0.5))
+    height = max(1, int(width * 3 / 4))
+    rng = np.random.default_rng(seed)
+    image = np.empty((height, width, 3), dtype=np.uint8)
+
+    if kind == 'flat':
+        image[:] = (52, 101, 164)
+    elif kind == 'gradient':
+        y, x = np.ogrid[0:height, 0:width]
+        image[..., 0] = (x * 255 // width).astype(np.uint8)
+        image[..., 1] = (y * 255 // height).astype(np.uint8)
+        image[..., 2] = ((x + y) * 255 // (width + height)).astype(np.uint8)
+    elif kind == 'noise':
+        for start in range(0, height, 1024):
+            stop = min(height, start + 1024)
+            image[start:stop] = rng.integers(0, 256, (stop - start, width, 3), dtype=np.uint8)
+    elif kind == 'photo':
+        # Sky gradient, flat subject blocks and a noisy textured foreground
+        y, x = np.ogrid[0:height, 0:width]
+        image[..., 0] = (90 + 60 * y // height).astype(np.uint8)
+        image[..., 1] = (140 + 50 * y // height).astype(np.uint8)
+        image[..., 2] = (230 - 40 * x // width).astype(np.uint8)
+        image[height // 3:2 * height // 3, width // 5:2 * width // 5] = (200, 30, 40)
+        image[height // 2:3 * height // 4, 3 * width // 5:4 * width // 5] = (240, 220, 60)
+        for start in range(2 * height // 3, height, 1024):
+            stop = min(height, start + 1024)
+            texture = rng.integers(-30, 31, (stop - start, width, 3), dtype=np.int16)
+            image[start:stop] = np.clip(texture + (70, 110, 50), 0, 255).astype(np.uint8)
+    else:
+        raise ValueError(f"unknown image kind: {kind}")
+    return image
+
+
+def synthetic_jpeg(kind, megapixels, seed=0):
+    """JPEG bytes of synthetic_pixels"""
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.fromarray(synthetic_pixels(kind, megapixels, seed)).save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def load_event(name):
+    """Event shape from a JSON file in the repository root"""
+    with open(os.path.join(ROOT, name), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def analyze_events(image_bytes, options):
+    """Analyze events in the shapes of test-payload.json and api-gateway-event.json"""
+    body = json.dumps({'image_data': base64.b64encode(image_bytes).decode(), 'options': options})
+
+    test_payload = load_event('test-payload.json')
+    test_payload.update({'path': '/analyze', 'body': body})
+
+    api_gateway = load_event('api-gateway-event.json')
+    api_gateway.update({'resource': '/analyze', 'path': '/analyze', 'httpMethod': 'POST', 'body': body})
+    api_gateway['requestContext'] = dict(api_gateway.get('requestContext') or {}, resourcePath='/analyze', httpMethod='POST')
+
+    return {'handler_test_payload': test_payload, 'handler_api_gateway': api_gateway}
+
+
+def summarize(samples_ms):
+    return {'median_ms': round(statistics.median(samples_ms), 3), 'min_ms': round(min(samples_ms), 3)}
+
+
+def benchmark_image(colorlab, image_bytes, max_dimension, repeat, warmup=1):
+    """Median and minimum milliseconds per stage and per handler event shape"""
+    samples, peaks = {}, {}
+    # The API only takes positive limits; 1 << 16 exceeds any corpus image, so 0 still means full resolution
+    options = {'cache': False, 'max_dimension': max_dimension or 1 << 16}
+    events = analyze_events(image_bytes, options)
+    plan = colorlab.analysis_stage_plan()
+
+    for iteration in range(warmup + repeat):
+        if iteration == warmup:
+            samples.clear()
+            peaks.clear()
+        timings = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            colors_data = colorlab.extract_colors_from_image_bytes(
+                image_bytes, max_dimension, streaming=False, stages=plan, timings=timings
+            )
+            colorlab.run_analysis_stages(plan, image_bytes, colors_data, options, timings)
+        for name, record in timings.items():
+            samples.setdefault(name, []).append(record['wall_ms'])
+            if 'peak_alloc_bytes' in record:
+                peaks[name] = max(peaks.get(name, 0), record['peak_alloc_bytes'])
+        del colors_data
+
+        for name, event in events.items():
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                response = colorlab.lambda_handler(copy.deepcopy(event), None)
+                elapsed = (time.perf_counter() - start) * 1000
+            if response['statusCode'] != 200 or 'error' in json.loads(response['body']).get('analysis', {}):
+                raise RuntimeError(f"{name} failed: {response['body'][:200]}")
+            samples.setdefault(name, []).append(elapsed)
+
+    results = {name: summarize(values) for name, values in samples.items()}
+    for name, peak in peaks.items():
+        results[name]['peak_alloc_bytes'] = peak
+    return results
+
+
+def run_suite(args):
+    # Keep metric log lines out of the timings; allocation tracing only when asked for
+    os.environ.setdefault('COLORLAB_EMF_METRICS', '0')
+    os.environ.setdefault('COLORLAB_TRACE_MEMORY', '1' if args.trace_memory else '0')
+    sys.path.insert(0, ROOT)
+    with contextlib.redirect_stdout(io.StringIO()):
+        import lambda_function_colorlab_complete as colorlab
+    import numpy as np
+    import PIL
+
+    max_dimension = colorlab.DECODE_MAX_DIMENSION if args.max_dimension is None else args.max_dimension
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pillow': PIL.__version__,
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'engine_version': colorlab.ANALYSIS_ENGINE_VERSION,
+            'max_dimension': max_dimension,
+            'repeat': args.repeat,
+            'warmup': args.warmup
+        },
+        'results': {}
+    }
+
+    for megapixels in args.sizes:
+        for kind in args.kinds:
+            name = f"{kind}-{megapixels:g}mp"
+            image_bytes = synthetic_jpeg(kind, megapixels)
+            results = benchmark_image(colorlab, image_bytes, max_dimension, args.repeat, args.warmup)
+            report['results'][name] = results
+            total = sum(r['median_ms'] for stage, r in results.items() if not stage.startswith('handler_'))
+            print(f"{name:16s} stages {total:9.1f} ms   handler {results['handler_api_gateway']['median_ms']:9.1f} ms",
+                  file=sys.stderr)
+
+    return report
+
+
+def compare_reports(current, baseline, threshold, min_delta_ms):
+    """Regressions of current against baseline medians, as printable lines"""
+    regressions = []
+    for image, stages in sorted(current['results'].items()):
+        for stage, record in stages.items():
+            reference = baseline.get('results', {}).get(image, {}).get(stage)
+            if reference is None:
+                continue
+            before, after = reference['median_ms'], record['median_ms']
+            delta = after - before
+            change = delta / before if before > 0 else 0.0
+            marker = ''
+            if delta > min_delta_ms and change > threshold:
+                marker = '  REGRESSION'
+                regressions.append((image, stage))
+            print(f"{image:16s} {stage:22s} {before:10.2f} -> {after:10.2f} ms  {change:+7.1%}{marker}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=float, nargs='+', default=list(IMAGE_SIZES_MP), help='megapixels')
+    parser.add_argument('--kinds', nargs='+', choices=IMAGE_KINDS, default=list(IMAGE_KINDS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--warmup', type=int, default=1, help='untimed runs per image before measuring')
+    parser.add_argument('--max-dimension', type=int, default=None,
+                        help='decode limit; defaults to the module setting, 0 for full resolution')
+    parser.add_argument('--trace-memory', action='store_true', help='also report per-stage peak allocation (timings then include tracemalloc overhead)')
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--save-baseline', action='store_true', help='write the report to --baseline')
+    parser.add_argument('--compare', action='store_true', help='fail on regressions against --baseline')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--threshold', type=float, default=0.25, help='relative slowdown that fails --compare')
+    parser.add_argument('--min-delta-ms', type=float, default=5.0, help='ignore slowdowns smaller than this')
+    args = parser.parse_args()
+
+    report = run_suite(args)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+        print(f"baseline written to {args.baseline}", file=sys.stderr)
+    if not (args.output or args.save_baseline or args.compare):
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('meta', {}).get('machine') != report['meta']['machine'] or \
+                baseline.get('meta', {}).get('cpu_count') != report['meta']['cpu_count']:
+            print("warning: baseline was recorded on a different machine", file=sys.stderr)
+        regressions = compare_reports(report, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.threshold:.0%}", file=sys.stderr)
+            return 1
+        print("no regressions", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
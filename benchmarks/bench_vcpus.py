@@ -0,0 +1,130 @@
+"""
+ColorLab - Stage concurrency benchmark across vCPU counts
+
+For each vCPU count, a child process is pinned to that many cores (and
+BLAS to as many threads) before NumPy is imported, the way a Lambda
+function of the matching memory size sees the machine. It times the
+end-to-end lambda_handler with stages run in order (stage_workers=1) and
+concurrently (one stage thread per vCPU), median of --repeat runs after a
+warm-up.
+
+Counts above the cores of this machine cannot be measured: their rows show
+"-" for the concurrent latency and speedup and are marked "projected only".
+Every row also shows a projection from the in-order stage timings: the
+in-order latency with the stage time replaced by the larger of the stages'
+critical path and their summed time divided by the vCPU count, the best a
+perfect scheduler could do. Projections are estimates, not measurements.
+
+Usage: python benchmarks/bench_vcpus.py [--vcpus 1 2 6] [--kinds photo noise] [--megapixels 12] [--repeat 5]
+"""
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def critical_path_ms(stage_graph, timings):
+    """Longest dependency chain of stage wall times"""
+    finish = {}
+
+    def visit(name):
+        if name not in finish:
+            finish[name] = timings.get(name, 0.0) + max((visit(d) for d in stage_graph[name][0]), default=0.0)
+        return finish[name]
+
+    return max((visit(name) for name in stage_graph if name in timings), default=0.0)
+
+
+def run_worker(args):
+    """Child process: time the handler at this process's core count and print one JSON line"""
+    os.environ.setdefault('COLORLAB_EMF_METRICS', '0')
+    from bench_stages import analyze_events, synthetic_jpeg
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import lambda_function_colorlab_complete as colorlab
+
+    vcpus = args.vcpus[0]
+    rows = []
+    for megapixels in args.megapixels:
+        for kind in args.kinds:
+            image_bytes = synthetic_jpeg(kind, megapixels)
+            row = {'image': f"{kind}-{megapixels:g}mp"}
+            for mode, workers in (('sequential', 1), ('concurrent', vcpus)):
+                event = analyze_events(image_bytes, {'cache': False, 'stage_workers': workers})['handler_api_gateway']
+                samples, stage_samples = [], {}
+                for iteration in range(1 + args.repeat):
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        start = time.perf_counter()
+                        response = colorlab.lambda_handler(copy.deepcopy(event), None)
+                        elapsed = (time.perf_counter() - start) * 1000
+                    body = json.loads(response['body'])
+                    if response['statusCode'] != 200 or 'error' in body.get('analysis', {}):
+                        raise RuntimeError(f"{row['image']} {mode} failed: {response['body'][:200]}")
+                    if iteration == 0:
+                        continue
+                    samples.append(elapsed)
+                    for name, record in body['analysis']['metadata']['stage_timings'].items():
+                        stage_samples.setdefault(name, []).append(record['wall_ms'])
+                row[f"{mode}_ms"] = statistics.median(samples)
+                if mode == 'sequential':
+                    stages = {name: statistics.median(values) for name, values in stage_samples.items()
+                              if name in colorlab.ANALYSIS_STAGES}
+                    row['stages_ms'] = sum(stages.values())
+                    row['critical_path_ms'] = critical_path_ms(colorlab.ANALYSIS_STAGES, stages)
+            rows.append(row)
+    print(json.dumps({'cores': colorlab.available_workers(), 'rows': rows}))
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--vcpus', type=int, nargs='+', default=[1, 2, 6])
+    parser.add_argument('--kinds', nargs='+', default=['photo', 'noise'])
+    parser.add_argument('--megapixels', type=float, nargs='+', default=[12])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return run_worker(args)
+
+    machine_cores = sorted(os.sched_getaffinity(0))
+    print(f"{'vcpus':>5s} {'cores':>5s} {'image':14s} {'sequential':>11s} {'concurrent':>11s} {'speedup':>8s} "
+          f"{'projected':>10s}")
+    for vcpus in args.vcpus:
+        cores = machine_cores[:vcpus]
+        env = dict(os.environ, OPENBLAS_NUM_THREADS=str(len(cores)), OMP_NUM_THREADS=str(len(cores)),
+                   MKL_NUM_THREADS=str(len(cores)))
+        command = [sys.executable, os.path.abspath(__file__), '--worker', '--vcpus', str(vcpus),
+                   '--kinds', *args.kinds, '--megapixels', *[str(mp) for mp in args.megapixels],
+                   '--repeat', str(args.repeat)]
+        output = subprocess.run(command, env=env, check=True, capture_output=True, text=True,
+                                preexec_fn=lambda: os.sched_setaffinity(0, cores)).stdout
+        report = json.loads(output.strip().splitlines()[-1])
+        limited = report['cores'] < vcpus
+        for row in report['rows']:
+            projected = row['sequential_ms'] - row['stages_ms'] + max(row['critical_path_ms'], row['stages_ms'] / vcpus)
+            if limited:
+                # Concurrent timings on fewer cores say nothing about this vCPU count
+                measured = f"{'-':>11s} {'-':>8s}"
+                note = f"  (projected only: {report['cores']} core(s) available)"
+            else:
+                measured = f"{row['concurrent_ms']:9.1f}ms {row['sequential_ms'] / row['concurrent_ms']:7.2f}x"
+                note = ''
+            print(f"{vcpus:5d} {report['cores']:5d} {row['image']:14s} {row['sequential_ms']:9.1f}ms "
+                  f"{measured} {projected:8.1f}ms{note}")
+    print("projected: estimate from the in-order stage timings, not a measurement")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,15 +1,65 @@
 """
 ColorLab - Enhanced Lambda Function with Accurate Color Names & Regional Analysis
 """
+import time
+# Start of module load, for cold-start accounting (wall, CPU)
+_MODULE_LOAD_STARTED = (time.perf_counter(), time.process_time())
+
 import json
 import base64
+import binascii
+import contextlib
+import gzip
+import hashlib
 import io
 import math
-import random
+import os
+import re
+import tempfile
+import importlib
+import sys
+import threading
+import tracemalloc
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from datetime import datetime
-from collections import Counter
+from functools import cached_property
 import statistics
 
+class LazyModule:
+    """Stand-in for a heavy module, imported on first attribute access
+    
+    The first access also rebinds the module-level name to the real module, so
+    later calls pay nothing. Routes like /health never import NumPy or Pillow.
+    """
+    
+    def __init__(self, module_name, global_name):
+        self._module_name = module_name
+        self._global_name = global_name
+    
+    def __getattr__(self, attribute):
+        module = importlib.import_module(self._module_name)
+        globals()[self._global_name] = module
+        return getattr(module, attribute)
+
+np = LazyModule('numpy', 'np')
+Image = LazyModule('PIL.Image', 'Image')
+
+# Optional accelerators: faster JSON encoding and brotli response compression
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# ===== IMAGE DECODING =====
+
+# Longest side (in pixels) images are reduced to before analysis
+DECODE_MAX_DIMENSION = int(os.environ.get('COLORLAB_DECODE_MAX_DIMENSION', '512'))
+
 # ===== COLOR IMPROVEMENTS INTEGRATION =====
 
 # Comprehensive color database with accurate names
@@ -74,11 +124,24 @@ def lambda_handler(event, context):
     headers = {
         'Content-Type': 'application/json',
         'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
+        'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,X-ColorLab-Options',
         'Access-Control-Allow-Methods': 'GET,POST,OPTIONS'
     }
     
     try:
+        if _COLD_START['pending']:
+            _COLD_START['pending'] = False
+            emit_stage_metrics({'module_load': INIT_TIMINGS['module_load']})
+        
+        # Scheduled pings ({"warmup": true}) exercise every hot path
+        if event.get('warmup'):
+            return handle_warmup(headers)
+        # Job ids delivered by an SQS event source mapping
+        if event.get('Records') and event['Records'][0].get('eventSource') == 'aws:sqs':
+            return handle_job_queue_event(event)
+        if event.get('process_jobs'):
+            return {'processed': [job_status(job) for job in run_queued_jobs(time_budget_ms=event.get('time_budget_ms'))]}
+        
         method = event.get('httpMethod', 'GET')
         path = event.get('path', '/')
         
@@ -89,6 +152,13 @@ def lambda_handler(event, context):
             return handle_root(headers)
         elif path == '/health' or path.endswith('/health'):
             return handle_health(headers)
+        elif JOB_ROUTE.search(path):
+            job_id, result = JOB_ROUTE.search(path).groups()
+            return handle_jobs(event, headers, job_id, bool(result))
+        elif path.endswith('/palettes/search'):
+            return handle_palette_search(event, headers)
+        elif path.endswith('/analyze/batch'):
+            return handle_batch_analysis(event, context, headers)
         elif 'analyze' in path:
             return handle_enhanced_analysis(event, headers)
         else:
@@ -131,66 +201,1868 @@ def handle_health(headers):
             "accuracy_level": "professional_grade",
             "color_database": f"{len(COLOR_DATABASE)} accurate color names",
             "regional_analysis": "enhanced_3x3_grid_with_balance",
-            "processing_type": "actual_image_bytes"
+            "processing_type": "actual_image_bytes",
+            "init": init_report()
+        })
+    }
+
+# ===== COLD START =====
+
+# Build the palette and naming index during module load instead of on first use
+EAGER_INIT = os.environ.get('COLORLAB_EAGER_INIT', '0') == '1'
+# Cold-start timings: module_load, then analysis_state once built
+INIT_TIMINGS = OrderedDict()
+_INIT_STATE = {'color_index_source': None}
+_COLD_START = {'pending': True}
+
+def init_report():
+    """Cold-start timings and which heavy modules this container has loaded"""
+    return {
+        "timings": INIT_TIMINGS,
+        "color_index_source": _INIT_STATE['color_index_source'],
+        "modules_loaded": {name: name in sys.modules for name in ('numpy', 'PIL.Image')}
+    }
+
+def warmup_image_bytes():
+    """Small gradient JPEG for warm-up runs (large enough to take the draft/reduce decode path)"""
+    y, x = np.mgrid[0:96, 0:128]
+    pixels = np.stack([x * 2, y * 2, (x + y) % 256], axis=-1).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+def handle_warmup(headers):
+    """Import heavy modules, build analysis state and run every stage and encoder once"""
+    started = time.perf_counter()
+    initialize_analysis_state()
+    
+    options = {'max_dimension': 64, 'grid': [2, 2], 'compact': True, 'sections': list(ANALYSIS_SECTIONS)}
+    image_bytes = warmup_image_bytes()
+    colors_data = extract_colors_from_image_bytes(image_bytes, options['max_dimension'], options['grid'])
+    analysis = generate_enhanced_colorlab_analysis(image_bytes, colors_data, options)
+    dumps_json(compact_analysis(analysis))
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({
+            "success": 'error' not in analysis,
+            "warmup": True,
+            "warmup_ms": round((time.perf_counter() - started) * 1000, 3),
+            "init": init_report()
         })
     }
 
+def parse_json_body(event):
+    """Parse the JSON request body, or return None when there is none"""
+    if not event.get('body'):
+        return None
+    body = event['body']
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body).decode('utf-8')
+    return json.loads(body)
+
+# ===== BINARY UPLOADS =====
+# Besides the JSON {"image_data": base64} contract, /analyze accepts the image
+# file itself as application/octet-stream (or image/*) or as a
+# multipart/form-data file field. Options then come from the
+# X-ColorLab-Options JSON header and/or query parameters. API Gateway must
+# list these types under binaryMediaTypes so the body arrives base64-encoded.
+
+BINARY_CONTENT_TYPES = ('application/octet-stream', 'image/')
+# Multipart fields that may carry the image file
+MULTIPART_IMAGE_FIELDS = ('image', 'file', 'image_data')
+# Query parameters are strings; these options are converted to their JSON types
+INTEGER_OPTIONS = ('max_dimension', 'histogram_bins', 'stage_workers', 'frame_stride', 'max_frames')
+BOOLEAN_OPTIONS = ('cache', 'streaming', 'compact', 'index', 'multi_frame')
+
+def request_header(event, name):
+    """Case-insensitive request header lookup"""
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+def is_binary_upload(content_type):
+    """Whether a Content-Type carries a raw or multipart image upload rather than JSON"""
+    content_type = (content_type or '').lower()
+    return content_type.startswith('multipart/form-data') or content_type.startswith(BINARY_CONTENT_TYPES)
+
+def raw_body_bytes(event):
+    """Request body as bytes, decoding API Gateway's base64 once"""
+    body = event.get('body') or ''
+    if event.get('isBase64Encoded'):
+        return binascii.a2b_base64(body)
+    return body.encode('latin-1') if isinstance(body, str) else bytes(body)
+
+def parse_option_value(name, value):
+    """Convert a query parameter string to the type the option expects"""
+    if name in INTEGER_OPTIONS:
+        return int(value)
+    if name in BOOLEAN_OPTIONS:
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    if name == 'clusters':
+        return value if value.strip().lower() == 'auto' else int(value)
+    if name == 'grid':
+        # "8x8" or "8,8"
+        return [int(part) for part in value.lower().replace(',', 'x').split('x')]
+    return value
+
+def options_object(text, source):
+    """JSON object of analysis options; raises ValueError for anything else"""
+    options = json.loads(text)
+    if not isinstance(options, dict):
+        raise ValueError(f"{source} must be a JSON object")
+    return options
+
+def options_from_request(event, form_options=None):
+    """Analysis options from query parameters, form options and the X-ColorLab-Options header
+    
+    Later sources win: query parameters, then the multipart `options` field, then the header.
+    """
+    options = {}
+    for name, value in (event.get('queryStringParameters') or {}).items():
+        options[name] = parse_option_value(name, value)
+    if form_options:
+        options.update(form_options)
+    header = request_header(event, 'X-ColorLab-Options')
+    if header:
+        options.update(options_object(header, 'X-ColorLab-Options header'))
+    return options
+
+def multipart_boundary(content_type):
+    """Boundary parameter of a multipart Content-Type"""
+    for parameter in content_type.split(';')[1:]:
+        key, _, value = parameter.strip().partition('=')
+        if key.lower() == 'boundary':
+            return value.strip('"')
+    raise ValueError("multipart boundary missing")
+
+def parse_multipart(body, boundary):
+    """Yield (field name, part headers, memoryview of content) for each multipart part
+    
+    Parts are memoryview slices of the body, so the file is not copied.
+    """
+    delimiter = b'--' + boundary.encode('latin-1')
+    view = memoryview(body)
+    position = body.find(delimiter)
+    while position != -1:
+        start = position + len(delimiter)
+        if body[start:start + 2] == b'--':
+            return
+        header_end = body.find(b'\r\n\r\n', start)
+        next_position = body.find(b'\r\n' + delimiter, header_end)
+        if header_end == -1 or next_position == -1:
+            raise ValueError("malformed multipart body")
+        
+        part_headers = {}
+        for line in bytes(view[start:header_end]).decode('utf-8', 'replace').split('\r\n'):
+            key, _, value = line.partition(':')
+            if key.strip():
+                part_headers[key.strip().lower()] = value.strip()
+        name = None
+        for parameter in part_headers.get('content-disposition', '').split(';')[1:]:
+            key, _, value = parameter.strip().partition('=')
+            if key.lower() == 'name':
+                name = value.strip('"')
+        
+        yield name, part_headers, view[header_end + 4:next_position]
+        position = next_position + 2
+
+def read_binary_upload(event, content_type):
+    """(image bytes, options) from a raw or multipart upload; raises ValueError for bad requests"""
+    body = raw_body_bytes(event)
+    
+    if not content_type.lower().startswith('multipart/form-data'):
+        if not body:
+            raise ValueError("Body required")
+        return body, options_from_request(event)
+    
+    image = None
+    form_options = None
+    for name, part_headers, content in parse_multipart(body, multipart_boundary(content_type)):
+        if name == 'options':
+            form_options = options_object(bytes(content), "multipart options field")
+        elif image is None and (name in MULTIPART_IMAGE_FIELDS or 'filename=' in part_headers.get('content-disposition', '')):
+            image = content
+    if image is None or not len(image):
+        raise ValueError(f"multipart body needs an image file field ({', '.join(MULTIPART_IMAGE_FIELDS)})")
+    return image, options_from_request(event, form_options)
+
 def handle_enhanced_analysis(event, headers):
     """Handle enhanced color analysis with accurate naming"""
     try:
-        if event.get('body'):
-            body = event['body']
-            if event.get('isBase64Encoded'):
-                body = base64.b64decode(body).decode('utf-8')
-            request_data = json.loads(body)
+        content_type = request_header(event, 'Content-Type') or ''
+        if is_binary_upload(content_type):
+            try:
+                image_bytes, options = read_binary_upload(event, content_type)
+                validate_options(options)
+            except ValueError as e:
+                return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': str(e)})}
+            
+            print(f"🎨 Starting ColorLab Enhanced Analysis...")
+            print(f"📊 Binary upload: {len(image_bytes)} bytes")
+            
+            analysis_result = analyze_image_bytes(image_bytes, options)
+        else:
+            request_data = parse_json_body(event)
+            if request_data is None:
+                return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'Body required'})}
+            
+            options = request_data.get('options') or {}
+            try:
+                validate_options(options)
+                reference = None if 'image_data' in request_data else parse_image_reference(request_data)
+            except ValueError as e:
+                return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': str(e)})}
+            
+            if 'image_data' in request_data:
+                image_data = request_data['image_data']
+                
+                print(f"🎨 Starting ColorLab Enhanced Analysis...")
+                print(f"📊 Image data length: {len(image_data)} characters")
+                
+                # Enhanced image processing
+                analysis_result = perform_enhanced_colorlab_analysis(image_data, options)
+            elif reference is not None:
+                try:
+                    image_bytes, source = fetch_image_object(*reference)
+                except FileNotFoundError as e:
+                    return {'statusCode': 404, 'headers': headers, 'body': json.dumps({'error': str(e)})}
+                except ValueError as e:
+                    return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': str(e)})}
+                
+                print(f"🎨 Starting ColorLab Enhanced Analysis of {source['bucket']}/{source['key']}...")
+                analysis_result = analyze_image_bytes(image_bytes, options)
+                if 'metadata' in analysis_result:
+                    analysis_result['metadata']['source'] = source
+            else:
+                return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'image_data, bucket/key or image_uri required'})}
+        
+        timings = analysis_result.get('metadata', {}).get('stage_timings')
+        if timings:
+            headers = dict(headers, **{'Server-Timing': server_timing_header(timings), 'Timing-Allow-Origin': '*'})
+        
+        if options.get('compact') and 'error' not in analysis_result:
+            analysis_result = compact_analysis(analysis_result)
+        
+        return encoded_response(200, headers, {
+            'success': True,
+            'analysis': analysis_result,
+            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'version': '18.0.0-colorlab-enhanced',
+            'analysis_type': 'enhanced_colorlab_processing',
+            'improvements': ['accurate_color_names', 'enhanced_regional_analysis']
+        }, event)
+        
+    except Exception as e:
+        print(f"❌ Enhanced analysis error: {str(e)}")
+        return {'statusCode': 500, 'headers': headers, 'body': json.dumps({'error': str(e)})}
+
+# ===== RESPONSE ENCODING =====
+# options.compact drops the static placeholder sections and packs every
+# colour into one 0xRRGGBB integer (under "rgb", replacing "hex" and the
+# r/g/b dict). Responses are compressed per Accept-Encoding when
+# COLORLAB_RESPONSE_COMPRESSION=1, which needs API Gateway binaryMediaTypes
+# to pass the base64 body through as binary.
+
+# Placeholder sections left out of compact responses unless asked for by name
+COMPACT_DROPPED_SECTIONS = ('ai_training_data', 'cnn_analysis')
+RESPONSE_COMPRESSION = os.environ.get('COLORLAB_RESPONSE_COMPRESSION', '0') == '1'
+# Bodies smaller than this are sent uncompressed
+COMPRESSION_MIN_BYTES = 1024
+
+def dumps_json(payload):
+    """Serialize a response payload, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY).decode('utf-8')
+    return json.dumps(payload, separators=(',', ':'))
+
+def compact_colors(value):
+    """Copy of value with every "#rrggbb" colour (and its r/g/b dict) packed into one integer"""
+    if isinstance(value, list):
+        return [compact_colors(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    
+    compact = {}
+    hex_color = value.get('hex')
+    for key, item in value.items():
+        if key == 'hex' and isinstance(item, str) and len(item) == 7 and item.startswith('#'):
+            compact['rgb'] = int(item[1:], 16)
+        elif key == 'rgb' and isinstance(hex_color, str):
+            continue
+        elif key == 'color' and isinstance(item, str) and len(item) == 7 and item.startswith('#'):
+            compact[key] = int(item[1:], 16)
+        else:
+            compact[key] = compact_colors(item)
+    return compact
+
+def compact_analysis(analysis):
+    """Compact form of an analysis response: no placeholder sections, integer-packed colours"""
+    requested = analysis.get('metadata', {}).get('sections') or []
+    compact = compact_colors({
+        name: section for name, section in analysis.items()
+        if name not in COMPACT_DROPPED_SECTIONS or name in requested
+    })
+    compact['metadata']['encoding'] = {'compact': True, 'color_format': '0xRRGGBB'}
+    return compact
+
+def accepted_encoding(event):
+    """Best supported Content-Encoding the client accepts: br, gzip or None"""
+    accepted = {}
+    for entry in (request_header(event, 'Accept-Encoding') or '').split(','):
+        coding, _, parameters = entry.strip().partition(';')
+        quality = 1.0
+        if parameters.strip().startswith('q='):
+            try:
+                quality = float(parameters.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+def encoded_response(status_code, headers, payload, event=None):
+    """Lambda proxy response for a JSON payload, compressed when enabled and accepted"""
+    body = dumps_json(payload)
+    encoding = accepted_encoding(event or {}) if RESPONSE_COMPRESSION and len(body) >= COMPRESSION_MIN_BYTES else None
+    if encoding is None:
+        return {'statusCode': status_code, 'headers': headers, 'body': body}
+    
+    data = body.encode('utf-8')
+    # gzip level 6 and brotli quality 5 keep compression well under serialization time
+    compressed = brotli.compress(data, quality=5) if encoding == 'br' else gzip.compress(data, compresslevel=6)
+    return {
+        'statusCode': status_code,
+        'headers': dict(headers, **{'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'}),
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+# ===== IMAGE STORAGE =====
+# Images can be analyzed by reference ({bucket, key} or an s3:// image_uri)
+# instead of inline. Objects are read through a pluggable storage backend:
+# S3 in production, a local directory or an in-memory stub for development
+# and tests (COLORLAB_STORAGE_BACKEND=s3|local|memory, or set_storage).
+
+STORAGE_BACKEND = os.environ.get('COLORLAB_STORAGE_BACKEND', 's3')
+# Directory holding <bucket>/<key> files for the local backend
+LOCAL_STORAGE_ROOT = os.environ.get('COLORLAB_LOCAL_STORAGE_ROOT', '.')
+# First ranged read: enough for the format header and dimensions of common formats
+HEADER_PROBE_BYTES = int(os.environ.get('COLORLAB_HEADER_PROBE_BYTES', '65536'))
+# Read size when streaming the rest of an object
+STORAGE_CHUNK_BYTES = 1 << 20
+# Connections per S3 client; batch threads share one client
+S3_MAX_POOL_CONNECTIONS = 16
+
+_S3_CLIENT = {'client': None, 'pid': None}
+_S3_CLIENT_LOCK = threading.Lock()
+_STORAGE = {'backend': None}
+
+def get_s3_client():
+    """S3 client shared across warm invocations, one per process (connection pools do not survive fork)"""
+    with _S3_CLIENT_LOCK:
+        if _S3_CLIENT['client'] is None or _S3_CLIENT['pid'] != os.getpid():
+            import boto3
+            from botocore.config import Config
+            _S3_CLIENT['client'] = boto3.client('s3', config=Config(
+                max_pool_connections=S3_MAX_POOL_CONNECTIONS, retries={'max_attempts': 3, 'mode': 'standard'}
+            ))
+            _S3_CLIENT['pid'] = os.getpid()
+        return _S3_CLIENT['client']
+
+class S3Storage:
+    """Objects in S3, read with ranged GETs through the pooled client"""
+    
+    def _get(self, bucket, key, byte_range):
+        try:
+            return get_s3_client().get_object(Bucket=bucket, Key=key, Range=byte_range)
+        except Exception as e:
+            code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+            if code in ('NoSuchKey', 'NoSuchBucket', '404'):
+                raise FileNotFoundError(f"s3://{bucket}/{key} not found")
+            raise
+    
+    def read_range(self, bucket, key, start, length):
+        """(bytes from start, up to length, total object size)"""
+        response = self._get(bucket, key, f"bytes={start}-{start + length - 1}")
+        data = response['Body'].read()
+        content_range = response.get('ContentRange')
+        return data, int(content_range.rsplit('/', 1)[1]) if content_range else len(data)
+    
+    def stream(self, bucket, key, start):
+        """Readable stream of the object from byte start"""
+        return self._get(bucket, key, f"bytes={start}-")['Body']
+
+class LocalStorage:
+    """Objects as files under root/<bucket>/<key>"""
+    
+    def __init__(self, root):
+        self.root = os.path.realpath(root)
+    
+    def _path(self, bucket, key):
+        path = os.path.realpath(os.path.join(self.root, bucket, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError("object key escapes the storage root")
+        return path
+    
+    def read_range(self, bucket, key, start, length):
+        path = self._path(bucket, key)
+        with open(path, 'rb') as f:
+            f.seek(start)
+            return f.read(length), os.fstat(f.fileno()).st_size
+    
+    def stream(self, bucket, key, start):
+        f = open(self._path(bucket, key), 'rb')
+        f.seek(start)
+        return f
+
+class MemoryStorage:
+    """In-memory stub backend: put() objects, then analyze them by reference"""
+    
+    def __init__(self, objects=None):
+        self.objects = dict(objects or {})
+    
+    def put(self, bucket, key, data):
+        self.objects[(bucket, key)] = bytes(data)
+    
+    def _object(self, bucket, key):
+        if (bucket, key) not in self.objects:
+            raise FileNotFoundError(f"{bucket}/{key} not found")
+        return self.objects[(bucket, key)]
+    
+    def read_range(self, bucket, key, start, length):
+        data = self._object(bucket, key)
+        return data[start:start + length], len(data)
+    
+    def stream(self, bucket, key, start):
+        return io.BufferedReader(BufferReader(memoryview(self._object(bucket, key))[start:]))
+
+STORAGE_BACKENDS = {
+    's3': S3Storage,
+    'local': lambda: LocalStorage(LOCAL_STORAGE_ROOT),
+    'memory': MemoryStorage
+}
+
+def get_storage():
+    """Configured storage backend, created once per container"""
+    if _STORAGE['backend'] is None:
+        _STORAGE['backend'] = STORAGE_BACKENDS[STORAGE_BACKEND]()
+    return _STORAGE['backend']
+
+def set_storage(backend):
+    """Replace the storage backend (e.g. a MemoryStorage in tests)"""
+    _STORAGE['backend'] = backend
+
+def parse_image_reference(request):
+    """(bucket, key) from {bucket, key} or an s3:// image_uri; None when the request has neither"""
+    uri = request.get('image_uri')
+    if uri:
+        if not uri.startswith('s3://'):
+            raise ValueError("image_uri must be an s3:// URI")
+        bucket, _, key = uri[len('s3://'):].partition('/')
+        if not bucket or not key:
+            raise ValueError("image_uri must be s3://bucket/key")
+        return bucket, key
+    if request.get('bucket') and request.get('key'):
+        return request['bucket'], request['key']
+    return None
+
+def probe_image_header(header):
+    """(format, width, height) from the first bytes of an image file, or None if they do not suffice"""
+    try:
+        with Image.open(io.BytesIO(header)) as image:
+            return image.format, image.size[0], image.size[1]
+    except Image.DecompressionBombError as e:
+        raise ValueError(f"Image too large: {str(e)}")
+    except Exception:
+        return None
+
+def fetch_image_object(bucket, key, storage=None):
+    """Bytes of a stored image and a description of its source
+    
+    A first ranged read of HEADER_PROBE_BYTES gives the format, dimensions
+    and object size, so oversized images are rejected before the download.
+    The rest is streamed into a buffer preallocated to the object size.
+    """
+    storage = storage or get_storage()
+    header, total = storage.read_range(bucket, key, 0, HEADER_PROBE_BYTES)
+    source = {'bucket': bucket, 'key': key, 'bytes': total}
+    probe = probe_image_header(header)
+    if probe is not None:
+        source.update(format=probe[0], width=probe[1], height=probe[2])
+    if total <= len(header):
+        return header, source
+    
+    buffer = bytearray(total)
+    view = memoryview(buffer)
+    view[:len(header)] = header
+    position = len(header)
+    stream = storage.stream(bucket, key, position)
+    try:
+        while position < total:
+            chunk = stream.read(min(STORAGE_CHUNK_BYTES, total - position))
+            if not chunk:
+                raise IOError(f"{bucket}/{key} ended after {position} of {total} bytes")
+            view[position:position + len(chunk)] = chunk
+            position += len(chunk)
+    finally:
+        stream.close()
+    
+    print(f"📥 Fetched {bucket}/{key}: {total} bytes")
+    return buffer, source
+
+def load_image_reference(item):
+    """Raw image bytes for a request given inline (image_data) or by reference (bucket/key, image_uri)"""
+    if item.get('image_data'):
+        return base64.b64decode(item['image_data'])
+    reference = parse_image_reference(item)
+    if reference is not None:
+        return fetch_image_object(*reference)[0]
+    raise ValueError("image_data, bucket/key or image_uri required")
+
+# ===== BATCH ANALYSIS =====
+
+# Maximum images accepted by one /analyze/batch request
+BATCH_MAX_ITEMS = int(os.environ.get('COLORLAB_BATCH_MAX_ITEMS', '50'))
+# Time kept back from the Lambda deadline to assemble and return the response
+BATCH_DEADLINE_MARGIN_MS = 1500
+
+def analyze_batch_item(item, options):
+    """Analyze one batch item; runs in a worker process or thread"""
+    try:
+        item_options = dict(options, **(item.get('options') or {}))
+        analysis = analyze_image_bytes(load_image_reference(item), item_options)
+        if 'error' in analysis:
+            return {'success': False, 'error': analysis['error']}
+        if item_options.get('compact'):
+            analysis = compact_analysis(analysis)
+        return {'success': True, 'analysis': analysis}
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+def available_workers():
+    """CPU cores available to this container (Lambda scales vCPUs with memory size)"""
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return max(1, os.cpu_count() or 1)
+
+def create_batch_executor(workers):
+    """Process pool for multi-core fan-out, falling back to threads where processes are unavailable"""
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        try:
+            return ProcessPoolExecutor(max_workers=workers), 'process'
+        except (OSError, NotImplementedError) as e:
+            # Lambda has no /dev/shm, which multiprocessing semaphores need
+            print(f"⚠️ Process pool unavailable ({str(e)}), using threads")
+    return ThreadPoolExecutor(max_workers=workers), 'thread'
+
+def batch_item_options(options, workers):
+    """Batch options with the vCPUs not used for fanning out items left to each item's stages"""
+    return dict(options, stage_workers=max(1, available_workers() // workers))
+
+def run_batch_analysis(items, options, time_budget_ms):
+    """Fan items out across a worker pool and collect results within the time budget
+    
+    Items not yet started when the budget runs out are cancelled. Items already
+    running cannot be interrupted: they are reported as timed out, but their
+    worker keeps computing after the response is sent. Lambda freezes the
+    container once the handler returns, so that work resumes (and competes for
+    CPU) when the container thaws for a later invocation, and its result is
+    discarded. This matters mostly in thread mode, where the stragglers share
+    the handler's process.
+    """
+    started = time.monotonic()
+    workers = min(len(items), available_workers())
+    executor, executor_type = create_batch_executor(workers)
+    options = batch_item_options(options, workers)
+    
+    try:
+        futures = [executor.submit(analyze_batch_item, item, options) for item in items]
+        done, _ = wait(futures, timeout=max(0.0, time_budget_ms / 1000.0))
+    finally:
+        # Return partial results now; queued items are cancelled, running ones
+        # are abandoned but run to completion in the background
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    results = []
+    for index, (item, future) in enumerate(zip(items, futures)):
+        if future in done:
+            try:
+                outcome = future.result()
+            except Exception as e:
+                outcome = {'success': False, 'error': str(e)}
         else:
+            outcome = {'success': False, 'error': 'Time budget exceeded', 'timed_out': True}
+        results.append(dict({'index': index, 'id': item.get('id', index)}, **outcome))
+    
+    return results, {
+        "total": len(items),
+        "succeeded": sum(1 for r in results if r['success']),
+        "failed": sum(1 for r in results if not r['success'] and not r.get('timed_out')),
+        "timed_out": sum(1 for r in results if r.get('timed_out')),
+        "workers": workers,
+        "executor": executor_type,
+        "time_budget_ms": int(time_budget_ms),
+        "elapsed_ms": round((time.monotonic() - started) * 1000, 1)
+    }
+
+def handle_batch_analysis(event, context, headers):
+    """Handle /analyze/batch: many images per invocation, analyzed in parallel"""
+    try:
+        request_data = parse_json_body(event)
+        if request_data is None:
             return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'Body required'})}
         
-        if 'image_data' not in request_data:
-            return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'image_data required'})}
+        items = request_data.get('images')
+        if not isinstance(items, list) or not items:
+            return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'images list required'})}
+        if len(items) > BATCH_MAX_ITEMS:
+            return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': f'At most {BATCH_MAX_ITEMS} images per batch'})}
         
-        image_data = request_data['image_data']
+        # Requested budget, capped by what is left of this invocation
+        try:
+            time_budget_ms = float(request_data.get('time_budget_ms', 60000))
+        except (TypeError, ValueError):
+            time_budget_ms = None
+        if time_budget_ms is None or not math.isfinite(time_budget_ms) or time_budget_ms <= 0:
+            return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'time_budget_ms must be a positive number'})}
+        if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+            time_budget_ms = min(time_budget_ms, context.get_remaining_time_in_millis() - BATCH_DEADLINE_MARGIN_MS)
         
-        print(f"🎨 Starting ColorLab Enhanced Analysis...")
-        print(f"📊 Image data length: {len(image_data)} characters")
+        print(f"📦 Starting batch analysis of {len(items)} images ({int(time_budget_ms)} ms budget)")
+        results, summary = run_batch_analysis(items, request_data.get('options') or {}, time_budget_ms)
+        print(f"✅ Batch completed: {summary['succeeded']}/{summary['total']} succeeded")
         
-        # Enhanced image processing
-        analysis_result = perform_enhanced_colorlab_analysis(image_data)
+        return encoded_response(200, headers, {
+            'success': True,
+            'results': results,
+            'summary': summary,
+            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'version': '18.0.0-colorlab-enhanced',
+            'analysis_type': 'enhanced_colorlab_batch_processing'
+        }, event)
         
-        return {
-            'statusCode': 200,
-            'headers': headers,
-            'body': json.dumps({
-                'success': True,
-                'analysis': analysis_result,
-                'timestamp': datetime.utcnow().isoformat() + 'Z',
-                'version': '18.0.0-colorlab-enhanced',
-                'analysis_type': 'enhanced_colorlab_processing',
-                'improvements': ['accurate_color_names', 'enhanced_regional_analysis']
-            })
+    except Exception as e:
+        print(f"❌ Batch analysis error: {str(e)}")
+        return {'statusCode': 500, 'headers': headers, 'body': json.dumps({'error': str(e)})}
+
+# ===== ASYNC JOBS =====
+# Analyses too slow for the synchronous API window run as jobs:
+#   POST /jobs               same body as /analyze or /analyze/batch -> 202 {job_id}
+#   GET  /jobs/{id}          status and per-section (or per-item) progress
+#   GET  /jobs/{id}/result   the finished analysis
+# Job records live in a pluggable store and job ids travel through a
+# pluggable queue (COLORLAB_JOB_BACKEND=memory|sqlite, or set_job_backends).
+# With COLORLAB_JOB_QUEUE_URL set, ids are sent to SQS and this function,
+# subscribed to that queue, runs them; the store must then be shared between
+# containers (e.g. SQLite on an EFS mount). Locally, {"process_jobs": true}
+# events or run_queued_jobs() drain the queue.
+#
+# Workers checkpoint every finished section (batch jobs: every finished
+# item), so a retried job resumes where the failed attempt stopped.
+
+JOB_BACKEND = os.environ.get('COLORLAB_JOB_BACKEND', 'memory')
+# SQLite database file for the sqlite backend
+JOB_DB_PATH = os.environ.get('COLORLAB_JOB_DB', os.path.join(tempfile.gettempdir(), 'colorlab-jobs.sqlite3'))
+# SQS queue for job ids; when unset the store's local queue is used
+JOB_QUEUE_URL = os.environ.get('COLORLAB_JOB_QUEUE_URL', '')
+# Attempts before a job that keeps failing is marked failed
+JOB_MAX_ATTEMPTS = int(os.environ.get('COLORLAB_JOB_MAX_ATTEMPTS', '3'))
+# Run submitted jobs on a background thread of the submitting process (local development)
+JOB_INLINE_WORKER = os.environ.get('COLORLAB_JOB_INLINE_WORKER', '0') == '1'
+
+JOB_ROUTE = re.compile(r'/jobs(?:/([0-9a-f]{32})(/result)?)?/?$')
+
+_JOBS = {'store': None, 'queue': None}
+_JOBS_LOCK = threading.Lock()
+
+def job_timestamp():
+    return datetime.utcnow().isoformat() + "Z"
+
+class MemoryJobStore:
+    """Job records, checkpoints and results in process memory, stored as JSON like the disk cache"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._checkpoints = {}
+        self._results = {}
+    
+    def create(self, job, request):
+        with self._lock:
+            self._jobs[job['job_id']] = (json.dumps(job), json.dumps(request))
+            self._checkpoints[job['job_id']] = {}
+    
+    def get(self, job_id):
+        with self._lock:
+            record = self._jobs.get(job_id)
+        return json.loads(record[0]) if record else None
+    
+    def request(self, job_id):
+        with self._lock:
+            return json.loads(self._jobs[job_id][1])
+    
+    def update(self, job_id, **fields):
+        """Merge fields into the job record and return it"""
+        with self._lock:
+            record, request = self._jobs[job_id]
+            job = dict(json.loads(record), **fields)
+            self._jobs[job_id] = (json.dumps(job), request)
+        return job
+    
+    def save_checkpoint(self, job_id, name, result):
+        with self._lock:
+            self._checkpoints[job_id][name] = dumps_json(result)
+    
+    def checkpoints(self, job_id):
+        with self._lock:
+            saved = dict(self._checkpoints.get(job_id, {}))
+        return {name: json.loads(payload) for name, payload in saved.items()}
+    
+    def save_result(self, job_id, result):
+        with self._lock:
+            self._results[job_id] = dumps_json(result)
+    
+    def result(self, job_id):
+        with self._lock:
+            payload = self._results.get(job_id)
+        return json.loads(payload) if payload is not None else None
+
+class MemoryJobQueue:
+    """FIFO of job ids within this process"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = []
+    
+    def enqueue(self, job_id):
+        with self._lock:
+            self._ids.append(job_id)
+    
+    def dequeue(self):
+        """Next job id, or None when the queue is empty"""
+        with self._lock:
+            return self._ids.pop(0) if self._ids else None
+
+class SqliteJobStore:
+    """Job records, checkpoints and results in a SQLite database file
+    
+    Each call opens its own connection, so worker threads and processes can
+    share the file; WAL mode lets status polls read while a worker writes.
+    """
+    
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, record TEXT NOT NULL, request TEXT NOT NULL, result TEXT)",
+        "CREATE TABLE IF NOT EXISTS checkpoints (job_id TEXT NOT NULL, name TEXT NOT NULL, result TEXT NOT NULL, "
+        "PRIMARY KEY (job_id, name))",
+        "CREATE TABLE IF NOT EXISTS job_queue (seq INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL)"
+    )
+    
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            for statement in self.SCHEMA:
+                db.execute(statement)
+    
+    @contextlib.contextmanager
+    def _connect(self):
+        import sqlite3
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            yield db
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+    
+    def create(self, job, request):
+        with self._connect() as db:
+            db.execute("INSERT INTO jobs (job_id, record, request) VALUES (?, ?, ?)",
+                       (job['job_id'], json.dumps(job), json.dumps(request)))
+    
+    def get(self, job_id):
+        with self._connect() as db:
+            row = db.execute("SELECT record FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def request(self, job_id):
+        with self._connect() as db:
+            return json.loads(db.execute("SELECT request FROM jobs WHERE job_id = ?", (job_id,)).fetchone()[0])
+    
+    def update(self, job_id, **fields):
+        with self._connect() as db:
+            row = db.execute("SELECT record FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            job = dict(json.loads(row[0]), **fields)
+            db.execute("UPDATE jobs SET record = ? WHERE job_id = ?", (json.dumps(job), job_id))
+        return job
+    
+    def save_checkpoint(self, job_id, name, result):
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO checkpoints (job_id, name, result) VALUES (?, ?, ?)",
+                       (job_id, name, dumps_json(result)))
+    
+    def checkpoints(self, job_id):
+        with self._connect() as db:
+            rows = db.execute("SELECT name, result FROM checkpoints WHERE job_id = ?", (job_id,)).fetchall()
+        return {name: json.loads(payload) for name, payload in rows}
+    
+    def save_result(self, job_id, result):
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET result = ? WHERE job_id = ?", (dumps_json(result), job_id))
+    
+    def result(self, job_id):
+        with self._connect() as db:
+            row = db.execute("SELECT result FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+class SqliteJobQueue:
+    """FIFO of job ids in the job_queue table of a SqliteJobStore database"""
+    
+    def __init__(self, store):
+        self.store = store
+    
+    def enqueue(self, job_id):
+        with self.store._connect() as db:
+            db.execute("INSERT INTO job_queue (job_id) VALUES (?)", (job_id,))
+    
+    def dequeue(self):
+        with self.store._connect() as db:
+            row = db.execute("SELECT seq, job_id FROM job_queue ORDER BY seq LIMIT 1").fetchone()
+            if row is None:
+                return None
+            db.execute("DELETE FROM job_queue WHERE seq = ?", (row[0],))
+        return row[1]
+
+class SqsJobQueue:
+    """Job ids sent to SQS; this function's SQS event source mapping consumes them"""
+    
+    def __init__(self, queue_url):
+        self.queue_url = queue_url
+    
+    def enqueue(self, job_id):
+        import boto3
+        boto3.client('sqs').send_message(QueueUrl=self.queue_url, MessageBody=json.dumps({'job_id': job_id}))
+    
+    def dequeue(self):
+        # Messages are delivered to lambda_handler as SQS events, not polled
+        return None
+
+def _sqlite_job_backends():
+    store = SqliteJobStore(JOB_DB_PATH)
+    return store, SqliteJobQueue(store)
+
+JOB_BACKENDS = {
+    'memory': lambda: (MemoryJobStore(), MemoryJobQueue()),
+    'sqlite': _sqlite_job_backends
+}
+
+def get_job_backends():
+    """(store, queue) for jobs, created once per container"""
+    with _JOBS_LOCK:
+        if _JOBS['store'] is None:
+            _JOBS['store'], _JOBS['queue'] = JOB_BACKENDS[JOB_BACKEND]()
+            if JOB_QUEUE_URL:
+                _JOBS['queue'] = SqsJobQueue(JOB_QUEUE_URL)
+        return _JOBS['store'], _JOBS['queue']
+
+def set_job_backends(store, queue):
+    """Replace the job store and queue (e.g. in-memory ones in tests)"""
+    with _JOBS_LOCK:
+        _JOBS['store'], _JOBS['queue'] = store, queue
+
+def job_steps(request):
+    """Checkpoint names of a job in order: its sections, or one per batch item"""
+    if 'images' in request:
+        return [f"item:{index}" for index in range(len(request['images']))]
+    return requested_sections(request.get('options') or {}) or list(ANALYSIS_SECTIONS)
+
+def validate_job_request(request):
+    """Raise ValueError unless request is a valid /analyze or /analyze/batch body"""
+    if 'images' in request:
+        items = request['images']
+        if not isinstance(items, list) or not items:
+            raise ValueError("images list required")
+        if len(items) > BATCH_MAX_ITEMS:
+            raise ValueError(f"At most {BATCH_MAX_ITEMS} images per batch")
+        for item in items:
+            validate_options(dict(request.get('options') or {}, **(item.get('options') or {})))
+        return
+    validate_options(request.get('options') or {})
+    if 'image_data' not in request and parse_image_reference(request) is None:
+        raise ValueError("image_data, bucket/key or image_uri required")
+
+def submit_job(request):
+    """Store a new job for request, queue it and return its record"""
+    import uuid
+    store, queue = get_job_backends()
+    now = job_timestamp()
+    job = {
+        'job_id': uuid.uuid4().hex,
+        'kind': 'batch' if 'images' in request else 'analysis',
+        'status': 'queued',
+        'progress': {name: 'pending' for name in job_steps(request)},
+        'attempts': 0,
+        'error': None,
+        'created_at': now,
+        'updated_at': now
+    }
+    store.create(job, request)
+    queue.enqueue(job['job_id'])
+    print(f"🗂️ Job {job['job_id']} queued ({job['kind']}, {len(job['progress'])} steps)")
+    if JOB_INLINE_WORKER:
+        threading.Thread(target=run_queued_jobs, daemon=True).start()
+    return job
+
+def run_analysis_job(request, completed, checkpoint):
+    """Single-image job: analyze, skipping sections checkpointed by earlier attempts"""
+    options = request.get('options') or {}
+    analysis = analyze_image_bytes(load_image_reference(request), options, completed, checkpoint)
+    if 'error' in analysis:
+        raise RuntimeError(analysis['error'])
+    reference = parse_image_reference(request) if 'image_data' not in request else None
+    if reference is not None:
+        analysis['metadata']['source'] = {'bucket': reference[0], 'key': reference[1]}
+    return compact_analysis(analysis) if options.get('compact') else analysis
+
+def run_batch_job(request, completed, checkpoint):
+    """Batch job: analyze unfinished items in a worker pool, checkpointing each as it completes"""
+    items, options = request['images'], request.get('options') or {}
+    outcomes = dict(completed)
+    pending = [index for index in range(len(items)) if f"item:{index}" not in outcomes]
+    
+    if pending:
+        workers = min(len(pending), available_workers())
+        executor, _ = create_batch_executor(workers)
+        options = batch_item_options(options, workers)
+        try:
+            futures = {executor.submit(analyze_batch_item, items[index], options): index for index in pending}
+            for future in as_completed(futures):
+                name = f"item:{futures[future]}"
+                outcomes[name] = future.result()
+                checkpoint(name, outcomes[name])
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    results = [dict({'index': index, 'id': item.get('id', index)}, **outcomes[f"item:{index}"])
+               for index, item in enumerate(items)]
+    return {
+        'results': results,
+        'summary': {
+            "total": len(items),
+            "succeeded": sum(1 for r in results if r['success']),
+            "failed": sum(1 for r in results if not r['success'])
         }
+    }
+
+def run_job(job_id):
+    """Run (or resume) one job to completion; returns its final record
+    
+    Raises when the attempt fails but may be retried, leaving the job queued
+    for the caller (SQS redelivery or run_queued_jobs) to retry.
+    """
+    store, _ = get_job_backends()
+    job = store.get(job_id)
+    if job is None:
+        raise KeyError(f"job {job_id} not found")
+    if job['status'] in ('succeeded', 'failed'):
+        # Duplicate delivery of a finished job
+        return job
+    
+    request = store.request(job_id)
+    completed = store.checkpoints(job_id)
+    progress = dict(job['progress'], **{name: 'done' for name in completed})
+    job = store.update(job_id, status='running', attempts=job['attempts'] + 1, progress=progress,
+                       updated_at=job_timestamp())
+    print(f"🏃 Job {job_id} attempt {job['attempts']}: {len(completed)}/{len(progress)} steps restored")
+    
+    def checkpoint(name, result):
+        store.save_checkpoint(job_id, name, result)
+        progress[name] = 'done'
+        store.update(job_id, progress=progress, updated_at=job_timestamp())
+    
+    runner = run_batch_job if job['kind'] == 'batch' else run_analysis_job
+    try:
+        result = runner(request, completed, checkpoint)
+    except Exception as e:
+        retry = job['attempts'] < JOB_MAX_ATTEMPTS
+        print(f"❌ Job {job_id} attempt {job['attempts']} failed: {str(e)}")
+        job = store.update(job_id, status='queued' if retry else 'failed', error=str(e), updated_at=job_timestamp())
+        if retry:
+            raise
+        return job
+    
+    store.save_result(job_id, result)
+    print(f"✅ Job {job_id} succeeded")
+    return store.update(job_id, status='succeeded', error=None, updated_at=job_timestamp())
+
+def run_queued_jobs(max_jobs=None, time_budget_ms=None):
+    """Drain the local job queue, re-queueing failed attempts; returns the final records"""
+    _, queue = get_job_backends()
+    started = time.monotonic()
+    finished = []
+    while max_jobs is None or len(finished) < max_jobs:
+        if time_budget_ms is not None and (time.monotonic() - started) * 1000 >= time_budget_ms:
+            break
+        job_id = queue.dequeue()
+        if job_id is None:
+            break
+        try:
+            finished.append(run_job(job_id))
+        except Exception:
+            queue.enqueue(job_id)
+    return finished
+
+def handle_job_queue_event(event):
+    """Run jobs delivered by an SQS event source, reporting failed messages for redelivery"""
+    failures = []
+    for record in event['Records']:
+        try:
+            run_job(json.loads(record['body'])['job_id'])
+        except Exception:
+            failures.append({'itemIdentifier': record['messageId']})
+    return {'batchItemFailures': failures}
+
+def job_status(job):
+    """Public view of a job record"""
+    status = dict(job, status_url=f"/jobs/{job['job_id']}")
+    if job['status'] == 'succeeded':
+        status['result_url'] = f"/jobs/{job['job_id']}/result"
+    return status
+
+def handle_jobs(event, headers, job_id, want_result):
+    """Handle POST /jobs, GET /jobs/{id} and GET /jobs/{id}/result"""
+    try:
+        method = event.get('httpMethod', 'GET')
+        if job_id is None:
+            if method != 'POST':
+                return {'statusCode': 405, 'headers': headers, 'body': json.dumps({'error': 'POST a job to /jobs'})}
+            request_data = parse_json_body(event)
+            if request_data is None:
+                return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'Body required'})}
+            try:
+                validate_job_request(request_data)
+            except ValueError as e:
+                return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': str(e)})}
+            return {'statusCode': 202, 'headers': headers, 'body': json.dumps(job_status(submit_job(request_data)))}
+        
+        store, _ = get_job_backends()
+        job = store.get(job_id)
+        if job is None:
+            return {'statusCode': 404, 'headers': headers, 'body': json.dumps({'error': f'Job {job_id} not found'})}
+        if not want_result:
+            return {'statusCode': 200, 'headers': headers, 'body': json.dumps(job_status(job))}
+        if job['status'] != 'succeeded':
+            return {'statusCode': 409, 'headers': headers, 'body': json.dumps(job_status(job))}
+        
+        payload = {'success': True, 'job_id': job_id, 'timestamp': job_timestamp(), 'version': '18.0.0-colorlab-enhanced'}
+        payload.update(store.result(job_id) if job['kind'] == 'batch' else {'analysis': store.result(job_id)})
+        return encoded_response(200, headers, payload, event)
         
     except Exception as e:
-        print(f"❌ Enhanced analysis error: {str(e)}")
+        print(f"❌ Job request error: {str(e)}")
         return {'statusCode': 500, 'headers': headers, 'body': json.dumps({'error': str(e)})}
 
-def perform_enhanced_colorlab_analysis(image_data):
+# ===== INSTRUMENTATION =====
+
+# Record per-stage peak allocation with tracemalloc. Off by default: tracing slows
+# every allocation inside the stages it measures, so turn it on when profiling
+# (benchmarks/bench_stages.py --trace-memory). It sees Python and NumPy
+# allocations, not Pillow's internal decode buffers.
+TRACE_MEMORY = os.environ.get('COLORLAB_TRACE_MEMORY', '0') == '1'
+# Log per-stage metrics as CloudWatch Embedded Metric Format JSON lines
+EMF_METRICS = os.environ.get('COLORLAB_EMF_METRICS', '1') == '1'
+METRICS_NAMESPACE = os.environ.get('COLORLAB_METRICS_NAMESPACE', 'ColorLab')
+
+# tracemalloc slows every Python allocation (stdlib json encoding ~20x), so it
+# runs only while at least one timed stage is active, in any thread.
+# _TRACE_STARTS counts traced blocks ever begun, so a block can tell whether
+# another one began while it was running. Tracing started by someone else (a
+# profiler or test) is left running.
+_TRACE_LOCK = threading.Lock()
+_TRACE_USERS = 0
+_TRACE_STARTS = 0
+_TRACE_OWNED = False
+
+def _begin_tracing():
+    """Start tracing for one block; returns (start number or None if it overlaps another block, baseline)"""
+    global _TRACE_USERS, _TRACE_STARTS, _TRACE_OWNED
+    with _TRACE_LOCK:
+        if _TRACE_USERS == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _TRACE_OWNED = True
+        _TRACE_USERS += 1
+        _TRACE_STARTS += 1
+        baseline = tracemalloc.get_traced_memory()[0]
+        if _TRACE_USERS > 1:
+            # Resetting would lower the peak of the block already running
+            return None, baseline
+        tracemalloc.reset_peak()
+        return _TRACE_STARTS, baseline
+
+def _end_tracing(start):
+    """Stop tracing for one block; returns (peak, exact) where exact means no other block overlapped it"""
+    global _TRACE_USERS, _TRACE_OWNED
+    with _TRACE_LOCK:
+        peak = tracemalloc.get_traced_memory()[1]
+        exact = start is not None and start == _TRACE_STARTS and _TRACE_USERS == 1
+        _TRACE_USERS -= 1
+        if _TRACE_USERS == 0 and _TRACE_OWNED:
+            tracemalloc.stop()
+            _TRACE_OWNED = False
+        return peak, exact
+
+@contextlib.contextmanager
+def timed_stage(timings, name, trace_memory=None):
+    """Record wall time, CPU time and peak allocation of the enclosed block as timings[name]
+    
+    CPU time is the calling thread's. tracemalloc is process-wide, so when
+    another timed block overlaps this one (stage or batch threads) the peak
+    includes its allocations too: it is then an upper bound and is recorded
+    with 'peak_alloc_approximate': True. trace_memory overrides TRACE_MEMORY
+    for this block.
+    """
+    if timings is None:
+        yield
+        return
+    
+    trace_memory = TRACE_MEMORY if trace_memory is None else trace_memory
+    if trace_memory:
+        trace_start, baseline = _begin_tracing()
+    wall_start, cpu_start = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        record = {
+            'wall_ms': round((time.perf_counter() - wall_start) * 1000, 3),
+            'cpu_ms': round((time.thread_time() - cpu_start) * 1000, 3)
+        }
+        if trace_memory:
+            peak, exact = _end_tracing(trace_start)
+            record['peak_alloc_bytes'] = max(0, peak - baseline)
+            if not exact:
+                record['peak_alloc_approximate'] = True
+        timings[name] = record
+
+def total_wall_ms(timings):
+    """Summed wall time of all recorded stages"""
+    return round(sum(record['wall_ms'] for record in timings.values()), 3)
+
+def server_timing_header(timings):
+    """Server-Timing header value listing each stage's wall time"""
+    entries = [f"{name};dur={record['wall_ms']:.1f}" for name, record in timings.items()]
+    entries.append(f"total;dur={total_wall_ms(timings):.1f}")
+    return ', '.join(entries)
+
+def stage_metrics_record(name, record, timestamp):
+    """CloudWatch EMF record of one stage's timings, with a Stage dimension
+    
+    PeakAllocation is present (and declared) only for exact peaks; approximate
+    ones from overlapping stages are left out.
+    """
+    metrics = [{"Name": "WallTime", "Unit": "Milliseconds"}, {"Name": "CpuTime", "Unit": "Milliseconds"}]
+    values = {"WallTime": record['wall_ms'], "CpuTime": record['cpu_ms']}
+    if 'peak_alloc_bytes' in record and not record.get('peak_alloc_approximate'):
+        metrics.append({"Name": "PeakAllocation", "Unit": "Bytes"})
+        values["PeakAllocation"] = record['peak_alloc_bytes']
+    return dict({
+        "_aws": {
+            "Timestamp": timestamp,
+            "CloudWatchMetrics": [{
+                "Namespace": METRICS_NAMESPACE,
+                "Dimensions": [["Stage"]],
+                "Metrics": metrics
+            }]
+        },
+        "Stage": name
+    }, **values)
+
+def emit_stage_metrics(timings):
+    """Print one CloudWatch EMF line per stage"""
+    if not EMF_METRICS or not timings:
+        return
+    timestamp = int(time.time() * 1000)
+    for name, record in timings.items():
+        print(json.dumps(stage_metrics_record(name, record, timestamp)))
+
+# ===== ANALYSIS RESULT CACHE =====
+
+# Part of every cache key; bump whenever analysis output changes
+ANALYSIS_ENGINE_VERSION = "18.4.6"
+# In-memory LRU tier, per warm container
+CACHE_MAX_ENTRIES = int(os.environ.get('COLORLAB_CACHE_SIZE', '64'))
+# Optional on-disk tier (e.g. /tmp/colorlab-cache), survives across invocations in a container
+CACHE_DIR = os.environ.get('COLORLAB_CACHE_DIR', '')
+CACHE_DISK_MAX_ENTRIES = int(os.environ.get('COLORLAB_CACHE_DISK_ENTRIES', '512'))
+
+# Results are stored as JSON text so cached entries can never be mutated by callers
+_RESULT_CACHE = OrderedDict()
+_CACHE_STATS = {'hits': 0, 'misses': 0, 'memory_hits': 0, 'disk_hits': 0}
+# Batch and job workers may share the cache from several threads
+_CACHE_LOCK = threading.RLock()
+
+# Options that change how an analysis runs but not its result
+EXECUTION_OPTIONS = ('cache', 'stage_workers', 'index', 'image_id')
+
+def analysis_cache_key(image_bytes, options):
+    """Content address of an analysis: image bytes, options, engine version and seeding"""
+    digest = hashlib.sha256()
+    settings = {k: v for k, v in options.items() if k not in EXECUTION_OPTIONS}
+    digest.update(json.dumps({
+        'engine': ANALYSIS_ENGINE_VERSION,
+        'kmeans_seed': KMEANS_SEED,
+        'decode_max_dimension': DECODE_MAX_DIMENSION,
+        'default_quality': DEFAULT_QUALITY,
+        'default_clusters': KMEANS_DEFAULT_CLUSTERS,
+        'default_frames': (MULTI_FRAME, FRAME_STRIDE, MAX_FRAMES),
+        'options': settings
+    }, sort_keys=True, default=str).encode('utf-8'))
+    digest.update(image_bytes)
+    return digest.hexdigest()
+
+def cache_get(key):
+    """Look up a cached analysis in memory, then on disk; returns (analysis, tier) or (None, None)"""
+    with _CACHE_LOCK:
+        payload = _RESULT_CACHE.get(key)
+        if payload is not None:
+            _RESULT_CACHE.move_to_end(key)
+            _CACHE_STATS['hits'] += 1
+            _CACHE_STATS['memory_hits'] += 1
+    if payload is not None:
+        return json.loads(payload), 'memory'
+    
+    if CACHE_DIR:
+        path = os.path.join(CACHE_DIR, f"{key}.json")
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                payload = f.read()
+            os.utime(path)
+            analysis = json.loads(payload)
+            with _CACHE_LOCK:
+                _store_in_memory(key, payload)
+                _CACHE_STATS['hits'] += 1
+                _CACHE_STATS['disk_hits'] += 1
+            return analysis, 'disk'
+        except (OSError, ValueError):
+            pass
+    
+    with _CACHE_LOCK:
+        _CACHE_STATS['misses'] += 1
+    return None, None
+
+def cache_put(key, analysis):
+    """Store an analysis in the memory tier and, if enabled, the disk tier"""
+    payload = json.dumps(analysis)
+    with _CACHE_LOCK:
+        _store_in_memory(key, payload)
+    
+    if CACHE_DIR:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            # Write then rename, so concurrent readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(payload)
+            os.replace(tmp_path, os.path.join(CACHE_DIR, f"{key}.json"))
+            _prune_disk_cache()
+        except OSError as e:
+            print(f"⚠️ Disk cache write failed: {str(e)}")
+
+def _store_in_memory(key, payload):
+    """Insert into the LRU tier; caller holds _CACHE_LOCK"""
+    _RESULT_CACHE[key] = payload
+    _RESULT_CACHE.move_to_end(key)
+    while len(_RESULT_CACHE) > CACHE_MAX_ENTRIES:
+        _RESULT_CACHE.popitem(last=False)
+
+def _prune_disk_cache():
+    """Evict least recently used disk entries beyond CACHE_DISK_MAX_ENTRIES"""
+    entries = [e for e in os.scandir(CACHE_DIR) if e.name.endswith('.json')]
+    if len(entries) <= CACHE_DISK_MAX_ENTRIES:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime)
+    for entry in entries[:len(entries) - CACHE_DISK_MAX_ENTRIES]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+def cache_metadata(tier):
+    """Cache hit/miss summary for response metadata"""
+    with _CACHE_LOCK:
+        return {
+            "hit": tier is not None,
+            "tier": tier,
+            "hits": _CACHE_STATS['hits'],
+            "misses": _CACHE_STATS['misses'],
+            "memory_hits": _CACHE_STATS['memory_hits'],
+            "disk_hits": _CACHE_STATS['disk_hits'],
+            "memory_entries": len(_RESULT_CACHE),
+            "disk_enabled": bool(CACHE_DIR)
+        }
+
+# ===== PALETTE INDEX =====
+# Every analyzed image's palette (k-means clusters, else dominant colours)
+# can be added to a persistent index and searched for similar palettes.
+#
+# A palette becomes a fixed-length signature: each colour's weight is spread
+# over PALETTE_ANCHOR_LEVELS^3 anchor colours of an sRGB grid by a Gaussian
+# of its LAB distance to them, and the square root of that histogram is
+# stored, so the dot product of two signatures is their Bhattacharyya
+# similarity (1 for identical palettes). Search ranks the index by Hamming
+# distance between PALETTE_HASH_BITS-bit random-hyperplane hashes of the
+# signatures, first on each hash's first 64 bits (keeping
+# PALETTE_PREFILTER_FACTOR x PALETTE_CANDIDATES rows), then on all bits, and
+# re-ranks the nearest PALETTE_CANDIDATES exactly. This finds ~98% of the
+# exact top 10 among 1M palettes.
+#
+# The index is a directory of fixed-width row files, read through memory maps
+# and extended with positioned writes: hashes (codes.u64) and their first
+# words (prefixes.u64), id hashes (ids.u64), float16 signatures
+# (vectors.f16) and records with the id and palette (records.bin), plus
+# header.json holding the row count. Rows are
+# written before the count, so readers never see a partial row; writers in
+# several processes are serialized by a lock file.
+
+# Index directory on local disk (e.g. /tmp/colorlab-palettes); empty disables indexing
+PALETTE_INDEX_DIR = os.environ.get('COLORLAB_PALETTE_INDEX_DIR', '')
+# Anchor grid levels per sRGB channel (signature length is levels^3)
+PALETTE_ANCHOR_LEVELS = 5
+# Width (LAB distance) of the Gaussian spreading a colour over the anchors
+PALETTE_ANCHOR_SIGMA = 18.0
+# Hash length, a multiple of 64
+PALETTE_HASH_BITS = 256
+PALETTE_HASH_SEED = 20240601
+# Exactly scored rows per query; more raises recall and cost
+PALETTE_CANDIDATES = int(os.environ.get('COLORLAB_PALETTE_CANDIDATES', '2000'))
+# Rows kept by the coarse first-word pass, as a multiple of PALETTE_CANDIDATES
+PALETTE_PREFILTER_FACTOR = 10
+PALETTE_MAX_COLORS = 8
+PALETTE_MAX_RESULTS = 100
+PALETTE_ID_BYTES = 64
+# Rows allocated when an index is created; capacity doubles when full
+PALETTE_INITIAL_CAPACITY = 1024
+# Part of every index header; bump whenever signatures change
+PALETTE_SIGNATURE_VERSION = 1
+
+_PALETTE_TABLES = {}
+
+def palette_tables():
+    """(anchor LAB colours, hyperplanes, hyperplane origin) shared by every signature, built once"""
+    if not _PALETTE_TABLES:
+        levels = np.linspace(0, 255, PALETTE_ANCHOR_LEVELS).round().astype(np.uint8)
+        anchors = np.stack(np.meshgrid(levels, levels, levels, indexing='ij'), axis=-1).reshape(-1, 3)
+        _PALETTE_TABLES['anchors'] = rgb_to_lab_array(anchors)
+        _PALETTE_TABLES['planes'] = np.random.default_rng(PALETTE_HASH_SEED).standard_normal(
+            (PALETTE_HASH_BITS, len(anchors))
+        )
+        # Signatures all lie in the positive orthant; planes through the
+        # uniform signature rather than the origin split them evenly
+        _PALETTE_TABLES['origin'] = np.full(len(anchors), 1 / math.sqrt(len(anchors)))
+    return _PALETTE_TABLES['anchors'], _PALETTE_TABLES['planes'], _PALETTE_TABLES['origin']
+
+def palette_signatures(colors, weights):
+    """Unit-length float32 signatures of (N, K, 3) sRGB palettes with (N, K) weights
+    
+    Shorter palettes are padded with zero-weight colours. Palettes are
+    processed in blocks, bounding the (block, K, anchors) temporaries.
+    """
+    anchors = palette_tables()[0]
+    colors = np.asarray(colors, dtype=np.uint8)
+    weights = np.asarray(weights, dtype=np.float64)
+    signatures = np.empty((len(colors), len(anchors)), dtype=np.float32)
+    for start in range(0, len(colors), 2048):
+        block = colors[start:start + 2048]
+        lab = rgb_to_lab_array(block.reshape(-1, 3)).reshape(block.shape)
+        distances = (lab ** 2).sum(axis=2)[..., None] - 2 * lab @ anchors.T + (anchors ** 2).sum(axis=1)
+        spread = np.exp(-np.maximum(distances, 0) / (2 * PALETTE_ANCHOR_SIGMA ** 2))
+        spread /= spread.sum(axis=2, keepdims=True)
+        block_weights = weights[start:start + 2048]
+        histogram = np.einsum('nk,nkd->nd', block_weights / block_weights.sum(axis=1, keepdims=True), spread)
+        signatures[start:start + 2048] = np.sqrt(histogram)
+    return signatures
+
+def palette_signature(colors, weights):
+    """Signature of one palette of (K, 3) sRGB colours with weights"""
+    return palette_signatures(
+        np.asarray(colors, dtype=np.uint8).reshape(1, -1, 3), np.asarray(weights, dtype=np.float64).reshape(1, -1)
+    )[0]
+
+def palette_hash(signatures):
+    """Random-hyperplane hashes of (N, D) signatures as (N, PALETTE_HASH_BITS / 64) uint64 words"""
+    _, planes, origin = palette_tables()
+    bits = (np.atleast_2d(signatures) - origin) @ planes.T > 0
+    return np.packbits(bits, axis=1, bitorder='little').view('<u8')
+
+def popcount(words):
+    """Set bits of each element of a uint64 array (np.bitwise_count on NumPy 2, a byte table before it)"""
+    bitwise_count = getattr(np, 'bitwise_count', None)
+    if bitwise_count is not None:
+        return bitwise_count(words)
+    if 'popcount' not in _PALETTE_TABLES:
+        _PALETTE_TABLES['popcount'] = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1, dtype=np.uint8)
+    words = np.ascontiguousarray(words, dtype='<u8')
+    return _PALETTE_TABLES['popcount'][words.view(np.uint8).reshape(words.shape + (8,))].sum(axis=-1, dtype=np.uint8)
+
+def nearest_hashes(distances, n):
+    """Positions of the n smallest Hamming distances: all below the distance that reaches n, then the first at it"""
+    cutoff = int(np.searchsorted(np.cumsum(np.bincount(distances, minlength=PALETTE_HASH_BITS + 1)), n))
+    below = np.flatnonzero(distances < cutoff)
+    return np.concatenate([below, np.flatnonzero(distances == cutoff)[:n - len(below)]])
+
+def palette_id_hash(image_id):
+    return int.from_bytes(hashlib.blake2b(image_id.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def palette_from_analysis(analysis):
+    """(colors, weights) of an analysis: k-means clusters by pixel share, else dominant colours; None if neither"""
+    clusters = (analysis.get('kmeans_analysis') or {}).get('clusters') or []
+    entries = [(c['center_color']['rgb'], c['percentage']) for c in clusters]
+    if not entries:
+        entries = [(c['rgb'], c.get('percentage', 1)) for c in analysis.get('dominant_colors') or []]
+    entries = sorted((e for e in entries if e[1] > 0), key=lambda e: -e[1])[:PALETTE_MAX_COLORS]
+    if not entries:
+        return None
+    colors = [(rgb['r'], rgb['g'], rgb['b']) for rgb, _ in entries]
+    weights = np.array([weight for _, weight in entries], dtype=np.float64)
+    return colors, weights / weights.sum()
+
+def heaviest_colors(colors, weights):
+    """(colors, weights) as (K, 3) uint8 and (K,) float64 arrays, keeping the PALETTE_MAX_COLORS heaviest"""
+    colors = np.asarray(colors, dtype=np.uint8).reshape(-1, 3)
+    weights = np.asarray(weights, dtype=np.float64).reshape(-1)
+    if len(colors) != len(weights) or not len(colors):
+        raise ValueError("palette needs one weight per colour")
+    if not np.all(weights >= 0) or weights.sum() <= 0:
+        raise ValueError("palette weights must be non-negative and not all zero")
+    if len(colors) > PALETTE_MAX_COLORS:
+        keep = np.argsort(-weights, kind='stable')[:PALETTE_MAX_COLORS]
+        colors, weights = colors[keep], weights[keep]
+    return colors, weights
+
+def parse_palette(palette):
+    """(colors, weights) from a request palette: hex strings or {"hex", "weight"} objects
+    
+    Longer palettes keep their PALETTE_MAX_COLORS heaviest colours.
+    """
+    if not isinstance(palette, list) or not palette:
+        raise ValueError("palette must be a non-empty list of colours")
+    colors, weights = [], []
+    for entry in palette:
+        if not isinstance(entry, (str, dict)):
+            raise ValueError(f"Invalid palette colour: {entry}")
+        hex_value, weight = (entry, 1.0) if isinstance(entry, str) else (entry.get('hex'), entry.get('weight', 1.0))
+        if not isinstance(hex_value, str) or not re.fullmatch(r'#?[0-9a-fA-F]{6}', hex_value):
+            raise ValueError(f"Invalid palette colour: {hex_value}")
+        if not isinstance(weight, (int, float)) or weight < 0:
+            raise ValueError(f"Invalid palette weight: {weight}")
+        value = int(hex_value.lstrip('#'), 16)
+        colors.append((value >> 16, (value >> 8) & 0xFF, value & 0xFF))
+        weights.append(float(weight))
+    colors, weights = heaviest_colors(colors, weights)
+    return colors, weights / weights.sum()
+
+def palette_image_id(options):
+    """The image_id option, if valid; None when absent"""
+    image_id = (options or {}).get('image_id')
+    if image_id is None:
+        return None
+    if not isinstance(image_id, str) or not image_id or len(image_id.encode('utf-8')) > PALETTE_ID_BYTES:
+        raise ValueError(f"image_id must be a string of 1 to {PALETTE_ID_BYTES} bytes")
+    return image_id
+
+class PaletteIndex:
+    """Memory-mapped palette signature index in a directory, with incremental inserts"""
+    
+    RECORD_DTYPE = [('id', f'S{PALETTE_ID_BYTES}'), ('colors', 'u1', (PALETTE_MAX_COLORS, 3)),
+                    ('weights', '<f4', (PALETTE_MAX_COLORS,)), ('size', 'u1')]
+    
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._capacity = None
+        self._arrays = None
+        
+    def _files(self):
+        dims = PALETTE_ANCHOR_LEVELS ** 3
+        return {
+            'codes': ('codes.u64', np.dtype('<u8'), (PALETTE_HASH_BITS // 64,)),
+            'prefixes': ('prefixes.u64', np.dtype('<u8'), ()),
+            'ids': ('ids.u64', np.dtype('<u8'), ()),
+            'vectors': ('vectors.f16', np.dtype('<f2'), (dims,)),
+            'records': ('records.bin', np.dtype(self.RECORD_DTYPE), ())
+        }
+    
+    def _read_header(self):
+        try:
+            with open(os.path.join(self.path, 'header.json'), 'r', encoding='utf-8') as f:
+                header = json.load(f)
+        except FileNotFoundError:
+            return None
+        expected = {'signature': PALETTE_SIGNATURE_VERSION, 'dims': PALETTE_ANCHOR_LEVELS ** 3,
+                    'hash_bits': PALETTE_HASH_BITS, 'hash_seed': PALETTE_HASH_SEED}
+        if any(header.get(key) != value for key, value in expected.items()):
+            raise ValueError(f"Palette index at {self.path} was built with different signature settings; "
+                             "rebuild it or use another COLORLAB_PALETTE_INDEX_DIR")
+        return header
+    
+    def _write_header(self, count, capacity):
+        header = {'signature': PALETTE_SIGNATURE_VERSION, 'dims': PALETTE_ANCHOR_LEVELS ** 3,
+                  'hash_bits': PALETTE_HASH_BITS, 'hash_seed': PALETTE_HASH_SEED,
+                  'count': count, 'capacity': capacity}
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(header, f)
+        os.replace(tmp_path, os.path.join(self.path, 'header.json'))
+    
+    def _map(self, capacity):
+        """Read-only memory maps of every file at capacity rows, reused until the capacity changes"""
+        if self._capacity != capacity:
+            self._arrays = {
+                name: np.memmap(os.path.join(self.path, filename), dtype=dtype, mode='r', shape=(capacity,) + shape)
+                for name, (filename, dtype, shape) in self._files().items()
+            }
+            self._capacity = capacity
+        return self._arrays
+    
+    def _grow(self, capacity):
+        """Extend every file to capacity rows"""
+        for filename, dtype, shape in self._files().values():
+            with open(os.path.join(self.path, filename), 'ab') as f:
+                f.truncate(capacity * dtype.itemsize * int(np.prod(shape, dtype=np.int64)))
+    
+    def _write_rows(self, rows, columns):
+        """Write {file: values} at rows, one positioned write per run of consecutive rows
+        
+        Writes go through the page cache, which the read-only maps share, so
+        they are visible to every process once the header count covers them.
+        """
+        order = np.argsort(rows, kind='stable')
+        runs = np.split(order, np.flatnonzero(np.diff(rows[order]) != 1) + 1)
+        for name, values in columns.items():
+            filename, dtype, shape = self._files()[name]
+            row_bytes = dtype.itemsize * int(np.prod(shape, dtype=np.int64))
+            data = np.ascontiguousarray(values, dtype=dtype)
+            with open(os.path.join(self.path, filename), 'r+b') as f:
+                for run in runs:
+                    os.pwrite(f.fileno(), data[run].tobytes(), int(rows[run[0]]) * row_bytes)
+    
+    @contextlib.contextmanager
+    def _exclusive(self):
+        """Hold this process's lock and the index's lock file"""
+        import fcntl
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            with open(os.path.join(self.path, 'lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def _snapshot(self):
+        """(row count, arrays) for reading; (0, None) for an empty index"""
+        with self._lock:
+            header = self._read_header()
+            if header is None or header['count'] == 0:
+                return 0, None
+            return header['count'], self._map(header['capacity'])
+    
+    def __len__(self):
+        return self._snapshot()[0]
+    
+    def add(self, image_id, colors, weights):
+        """Insert or replace image_id's palette; returns the index size"""
+        return self.add_many([(image_id, colors, weights)])
+    
+    def add_many(self, palettes):
+        """Insert or replace (image_id, colors, weights) palettes under one lock; returns the index size
+        
+        Palettes longer than PALETTE_MAX_COLORS keep their heaviest colours.
+        """
+        latest = {image_id: heaviest_colors(colors, weights) for image_id, colors, weights in palettes}
+        records = np.zeros(len(latest), dtype=self.RECORD_DTYPE)
+        for record, (image_id, (colors, weights)) in zip(records, latest.items()):
+            record['id'] = image_id.encode('utf-8')
+            record['colors'][:len(colors)] = colors
+            record['weights'][:len(colors)] = weights / weights.sum()
+            record['size'] = len(colors)
+        signatures = palette_signatures(records['colors'], records['weights'])
+        id_hashes = np.array([palette_id_hash(image_id) for image_id in latest], dtype=np.uint64)
+        
+        with self._exclusive():
+            header = self._read_header()
+            if header is None:
+                count, capacity = 0, PALETTE_INITIAL_CAPACITY
+                self._grow(capacity)
+            else:
+                count, capacity = header['count'], header['capacity']
+            
+            # Existing rows are replaced; id hashes narrow the check to possible
+            # matches (one scan per palette for small batches, a set test for bulk)
+            rows = np.full(len(records), -1, dtype=np.int64)
+            if count:
+                arrays = self._map(capacity)
+                stored = arrays['ids'][:count]
+                maybe = range(len(records)) if len(records) <= 64 else np.flatnonzero(np.isin(id_hashes, stored))
+                for i in maybe:
+                    for row in np.flatnonzero(stored == id_hashes[i]):
+                        if arrays['records'][row]['id'] == records[i]['id']:
+                            rows[i] = row
+            new = rows < 0
+            rows[new] = np.arange(count, count + int(new.sum()))
+            count += int(new.sum())
+            
+            if count > capacity:
+                while capacity < count:
+                    capacity *= 2
+                self._grow(capacity)
+            codes = palette_hash(signatures)
+            self._write_rows(rows, {'codes': codes, 'prefixes': codes[:, 0], 'ids': id_hashes,
+                                    'vectors': signatures, 'records': records})
+            self._write_header(count, capacity)
+        return count
+    
+    def get(self, image_id):
+        """Signature and record stored for image_id, or None"""
+        count, arrays = self._snapshot()
+        if not count:
+            return None
+        encoded = image_id.encode('utf-8')
+        for row in np.flatnonzero(arrays['ids'][:count] == np.uint64(palette_id_hash(image_id))):
+            if arrays['records'][row]['id'] == encoded:
+                return np.asarray(arrays['vectors'][row], dtype=np.float32), arrays['records'][row]
+        return None
+    
+    def search(self, signature, top_n=10, exclude_id=None, candidates=None):
+        """Most similar stored palettes: ([(image_id, similarity, record)], rows scored)"""
+        count, arrays = self._snapshot()
+        if not count:
+            return [], 0
+        candidates = PALETTE_CANDIDATES if candidates is None else candidates
+        rows = np.arange(count)
+        if count > candidates:
+            code = palette_hash(signature)[0]
+            if count > PALETTE_PREFILTER_FACTOR * candidates:
+                # Coarse pass over every code's first word, stored contiguously
+                prefix_distances = popcount(arrays['prefixes'][:count] ^ code[0])
+                rows = nearest_hashes(prefix_distances, PALETTE_PREFILTER_FACTOR * candidates)
+            distances = popcount(arrays['codes'][rows] ^ code).sum(axis=1, dtype=np.int32)
+            rows = rows[nearest_hashes(distances, candidates)]
+        similarities = arrays['vectors'][rows].astype(np.float32) @ signature
+        limit = min(top_n + (exclude_id is not None), len(rows))
+        best = np.argpartition(-similarities, limit - 1)[:limit]
+        best = best[np.argsort(-similarities[best], kind='stable')]
+        
+        results = []
+        for i in best:
+            record = arrays['records'][rows[i]]
+            image_id = record['id'].decode('utf-8')
+            if image_id != exclude_id and len(results) < top_n:
+                results.append((image_id, min(1.0, float(similarities[i])), record))
+        return results, len(rows)
+
+def palette_record_colors(record):
+    """[{"hex", "rgb", "weight"}] of a stored palette record"""
+    return [
+        {"hex": f"#{r:02x}{g:02x}{b:02x}", "rgb": {"r": int(r), "g": int(g), "b": int(b)}, "weight": round(float(w), 4)}
+        for (r, g, b), w in zip(record['colors'][:record['size']], record['weights'][:record['size']])
+    ]
+
+_PALETTE_INDEX = {}
+
+def get_palette_index():
+    """This container's PaletteIndex over PALETTE_INDEX_DIR, or None when indexing is disabled"""
+    if not PALETTE_INDEX_DIR:
+        return None
+    index = _PALETTE_INDEX.get(PALETTE_INDEX_DIR)
+    if index is None:
+        index = _PALETTE_INDEX.setdefault(PALETTE_INDEX_DIR, PaletteIndex(PALETTE_INDEX_DIR))
+    return index
+
+def index_analysis_palette(analysis, image_bytes, options):
+    """Add an analysis's palette to the palette index, recording the outcome in its metadata
+    
+    The image is indexed under the image_id option, else the SHA-256 of its
+    bytes; options.index = false skips indexing. Index failures are reported,
+    never raised, so they cannot fail the analysis.
+    """
+    index = get_palette_index()
+    if 'metadata' not in analysis:
+        return
+    analysis['metadata'].pop('palette_index', None)
+    if index is None or not options.get('index', True):
+        return
+    palette = palette_from_analysis(analysis)
+    if palette is None:
+        return
+    image_id = palette_image_id(options) or hashlib.sha256(image_bytes).hexdigest()
+    try:
+        size = index.add(image_id, *palette)
+        analysis['metadata']['palette_index'] = {"indexed": True, "image_id": image_id, "size": size}
+    except Exception as e:
+        print(f"⚠️ Palette indexing failed: {str(e)}")
+        analysis['metadata']['palette_index'] = {"indexed": False, "image_id": image_id, "error": str(e)}
+
+def handle_palette_search(event, headers):
+    """Handle /palettes/search: stored palettes most similar to a palette, an indexed image or a new image"""
+    index = get_palette_index()
+    if index is None:
+        return {'statusCode': 404, 'headers': headers,
+                'body': json.dumps({'error': 'Palette index is not enabled (set COLORLAB_PALETTE_INDEX_DIR)'})}
+    request_data = parse_json_body(event)
+    if request_data is None:
+        return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'Body required'})}
+    
+    started = time.perf_counter()
+    exclude_id = None
+    try:
+        top_n = int(request_data.get('top_n', 10))
+        if not 1 <= top_n <= PALETTE_MAX_RESULTS:
+            raise ValueError(f"top_n must be between 1 and {PALETTE_MAX_RESULTS}")
+        if request_data.get('palette') is not None:
+            signature = palette_signature(*parse_palette(request_data['palette']))
+        elif request_data.get('image_id') is not None:
+            exclude_id = palette_image_id(request_data)
+            stored = index.get(exclude_id)
+            if stored is None:
+                return {'statusCode': 404, 'headers': headers,
+                        'body': json.dumps({'error': f"Image {exclude_id} is not in the palette index"})}
+            signature = stored[0]
+        else:
+            # Palette of a new image; searching does not add it to the index
+            options = dict(request_data.get('options') or {}, sections=['kmeans_analysis'], index=False)
+            validate_options(options)
+            analysis = analyze_image_bytes(load_image_reference(request_data), options)
+            if 'error' in analysis:
+                return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': analysis['error']})}
+            signature = palette_signature(*palette_from_analysis(analysis))
+    except FileNotFoundError as e:
+        return {'statusCode': 404, 'headers': headers, 'body': json.dumps({'error': str(e)})}
+    except (ValueError, TypeError) as e:
+        return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': str(e)})}
+    
+    search_started = time.perf_counter()
+    matches, scored = index.search(signature, top_n, exclude_id)
+    finished = time.perf_counter()
+    return encoded_response(200, headers, {
+        'success': True,
+        'results': [
+            {"image_id": image_id, "similarity": round(similarity, 4), "palette": palette_record_colors(record)}
+            for image_id, similarity, record in matches
+        ],
+        'index': {
+            "size": len(index),
+            "candidates_scored": scored,
+            "search_ms": round((finished - search_started) * 1000, 3),
+            "total_ms": round((finished - started) * 1000, 3)
+        },
+        'timestamp': datetime.utcnow().isoformat() + 'Z'
+    })
+
+def perform_enhanced_colorlab_analysis(image_data, options=None):
     """Perform enhanced ColorLab analysis with improvements"""
     try:
         print("🔬 Starting enhanced ColorLab processing...")
         
         # Decode base64 to get actual image bytes
         image_bytes = base64.b64decode(image_data)
+        
+        return analyze_image_bytes(image_bytes, options)
+        
+    except Exception as e:
+        print(f"❌ Enhanced analysis failed: {str(e)}")
+        return {"error": f"Enhanced analysis failed: {str(e)}"}
+
+def analyze_image_bytes(image_bytes, options=None, completed=None, checkpoint=None):
+    """Analyze raw image file bytes, serving repeats from the result cache
+    
+    completed maps sections to results saved by an earlier attempt; only the
+    remaining sections are computed, and checkpoint(name, result) is called
+    as each of them finishes.
+    """
+    try:
+        options = options or {}
         image_size = len(image_bytes)
+        initialize_analysis_state()
+        
+        # Canonical section order so equivalent requests share a cache entry
+        sections = requested_sections(options)
+        if sections is not None:
+            options = dict(options, sections=sections)
         
         print(f"📸 Image decoded: {image_size} bytes")
         
-        # Extract colors from image bytes
-        colors_data = extract_colors_from_image_bytes(image_bytes)
+        timings = OrderedDict()
+        
+        # Serve repeated submissions of the same image and options from cache
+        use_cache = options.get('cache', True) and CACHE_MAX_ENTRIES > 0
+        if use_cache:
+            with timed_stage(timings, 'cache_lookup'):
+                cache_key = analysis_cache_key(image_bytes, options)
+                cached, tier = cache_get(cache_key)
+            if cached is not None:
+                print(f"⚡ Analysis served from {tier} cache")
+                cached['metadata']['cache'] = cache_metadata(tier)
+                # Timings describe this request, not the run that filled the cache
+                cached['metadata']['stage_timings'] = timings
+                cached['metadata']['processing_time'] = f"{total_wall_ms(timings) / 1000:.3f} seconds"
+                index_analysis_palette(cached, image_bytes, options)
+                emit_stage_metrics(timings)
+                return cached
+        
+        # Extract colors from decoded image pixels, collecting only what unfinished sections need
+        completed = completed or {}
+        max_dimension = positive_int_option(options, 'max_dimension', DECODE_MAX_DIMENSION)
+        quality, sample_step = quality_tier(options)
+        colors_data = extract_colors_from_image_bytes(
+            image_bytes, max_dimension, grid_option(options), options.get('streaming'),
+            analysis_stage_plan(sections, completed), timings, sample_step, frame_sampling(options)
+        )
+        if colors_data['total_samples'] == 0:
+            return {"error": "Enhanced analysis failed: could not decode image data"}
         
         # Generate enhanced analysis with accurate color names
-        analysis = generate_enhanced_colorlab_analysis(image_bytes, colors_data)
+        context = AnalysisContext(image_bytes, colors_data, options, completed)
+        analysis = generate_enhanced_colorlab_analysis(
+            image_bytes, colors_data, options, timings, completed, checkpoint, context
+        )
+        
+        if colors_data.get('frames') and 'error' not in analysis:
+            analysis['frames'] = frame_timeline(colors_data['frames'], context.color_name)
+        
+        if quality != 'exact' and 'error' not in analysis:
+            # The decoded pixels the exact tier would analyze are the sampling population
+            sampling = {
+                "quality": quality,
+                "method": "stratified_sample",
+                "sample_step": sample_step,
+                "analyzed_pixels": colors_data['total_samples'],
+                "population_pixels": colors_data['decoded_pixels'],
+                "confidence": 0.95
+            }
+            sampling["sampling_fraction"] = round(sampling["analyzed_pixels"] / sampling["population_pixels"], 4)
+            sampling_margins(analysis, context, sampling)
+            analysis['metadata']['sampling'] = sampling
+        
+        if use_cache and 'error' not in analysis:
+            cache_put(cache_key, analysis)
+            analysis['metadata']['cache'] = cache_metadata(None)
         
+        if 'error' not in analysis:
+            index_analysis_palette(analysis, image_bytes, options)
+        
+        emit_stage_metrics(timings)
         print("✅ Enhanced ColorLab analysis completed")
         return analysis
         
@@ -198,41 +2070,516 @@ def perform_enhanced_colorlab_analysis(image_data):
         print(f"❌ Enhanced analysis failed: {str(e)}")
         return {"error": f"Enhanced analysis failed: {str(e)}"}
 
-def extract_colors_from_image_bytes(image_bytes):
-    """Extract color information from actual image bytes"""
+class BufferReader(io.RawIOBase):
+    """Seekable read-only file over a bytes-like object, without copying it (unlike BytesIO of a memoryview)"""
+    
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast('B')
+        self._position = 0
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return True
+    
+    def readinto(self, target):
+        chunk = self._view[self._position:self._position + len(target)]
+        target[:len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._view)}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+    
+    def tell(self):
+        return self._position
+
+def image_file(image_bytes):
+    """File object over image bytes or a memoryview slice of a request body"""
+    if isinstance(image_bytes, bytes):
+        # BytesIO shares an immutable bytes buffer until written to
+        return io.BytesIO(image_bytes)
+    return io.BufferedReader(BufferReader(image_bytes))
+
+def open_image_for_analysis(image_bytes, max_dimension=DECODE_MAX_DIMENSION):
+    """Open image bytes (or decode an already opened Pillow image) as an RGB image no larger than max_dimension"""
+    image = image_bytes if isinstance(image_bytes, Image.Image) else Image.open(image_file(image_bytes))
+    width, height, image_format = image.size + (image.format,)
+    image = fit_image(image, max_dimension)
+    print(f"🖼️ Decoded {width}x{height} {image_format or 'image'} to {image.size[0]}x{image.size[1]}")
+    return image
+
+def fit_image(image, max_dimension):
+    """Current frame of an opened Pillow image as RGB, no larger than max_dimension"""
+    width, height = image.size
+    
+    if max_dimension and max(width, height) > max_dimension:
+        scale = max_dimension / max(width, height)
+        # JPEG can decode straight to 1/2, 1/4 or 1/8 scale in the DCT domain,
+        # so the full-size bitmap is never materialised
+        if image.format == 'JPEG':
+            image.draft('RGB', (max(1, int(width * scale)), max(1, int(height * scale))))
+    
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    
+    # Box-reduce by the largest whole factor that stays at or above the
+    # target, then box-resample the remainder to exactly max_dimension
+    longest = max(image.size)
+    if max_dimension and longest > max_dimension:
+        factor = longest // max_dimension
+        if factor > 1:
+            image = image.reduce(factor)
+        width, height = image.size
+        scale = max_dimension / max(width, height)
+        if scale < 1:
+            size = (min(max_dimension, max(1, round(width * scale))), min(max_dimension, max(1, round(height * scale))))
+            image = image.resize(size, Image.BOX)
+    return image
+
+def decode_image_pixels(image_bytes, max_dimension=DECODE_MAX_DIMENSION):
+    """Decode image bytes into an (H, W, 3) uint8 RGB array no larger than max_dimension"""
+    return np.asarray(open_image_for_analysis(image_bytes, max_dimension), dtype=np.uint8)
+
+def extract_colors_from_image_bytes(image_bytes, max_dimension=DECODE_MAX_DIMENSION, grid=None, streaming=None,
+                                    stages=None, timings=None, sample_step=1, frames=None):
+    """Extract color information from decoded image pixels
+    
+    With streaming the decoded image is analyzed in row strips of about
+    STREAM_STRIP_PIXELS, so analysis working memory is bounded by the strip
+    rather than the image (the decoded raster itself is still held whole);
+    streaming=None enables it for images above STREAMING_AUTO_PIXELS.
+    stages (an analysis_stage_plan) limits which strip products are collected.
+    sample_step > 1 analyzes a stratified_sample of the decoded pixels.
+    frames, a frame_sampling (frame_stride, max_frames), analyzes animated
+    and multi-page images over a sample of their frames (see
+    extract_colors_from_frames); without it only the first frame is read.
+    Decode and extraction times are recorded in timings when given.
+    """
     try:
-        # Analyze byte patterns to extract color information
-        byte_values = list(image_bytes)
-        
-        # Group bytes into RGB-like triplets
-        colors = []
-        for i in range(0, len(byte_values) - 2, 3):
-            r = byte_values[i] % 256
-            g = byte_values[i + 1] % 256
-            b = byte_values[i + 2] % 256
-            colors.append((r, g, b))
+        with timed_stage(timings, 'decode'):
+            image = Image.open(image_file(image_bytes))
+            frame_count = image_frame_count(image) if frames is not None else 1
+            if frame_count == 1:
+                image = open_image_for_analysis(image, max_dimension)
+                image.load()
+        if frame_count > 1:
+            return extract_colors_from_frames(image, frame_count, max_dimension, grid, streaming, stages, timings,
+                                              sample_step, frames)
+        width, height = image.size
+        if streaming is None:
+            streaming = width * height > STREAMING_AUTO_PIXELS
+        # Whole sampling cells per strip
+        rows_per_strip = max(sample_step, STREAM_STRIP_PIXELS // width // sample_step * sample_step)
+        rng = np.random.default_rng(SAMPLING_SEED)
         
-        # Get unique colors and their frequencies
-        color_counter = Counter(colors)
-        unique_colors = list(color_counter.keys())
+        with timed_stage(timings, 'extraction'):
+            sampled_width, sampled_height = -(-width // sample_step), -(-height // sample_step)
+            accumulator = new_analysis_accumulator(sampled_width, sampled_height, grid, stages)
+            if streaming:
+                pixels = None
+                for start_y, strip in iter_image_strips(image, rows_per_strip):
+                    if sample_step > 1:
+                        strip = stratified_sample(strip, sample_step, rng)
+                    accumulate_analysis_strip(accumulator, strip, start_y // sample_step)
+            else:
+                # Release the decoder raster before analysis; the array is the only copy
+                pixels = np.asarray(image, dtype=np.uint8)
+                del image
+                if sample_step > 1:
+                    pixels = stratified_sample(pixels, sample_step, rng)
+                accumulate_analysis_strip(accumulator, pixels, 0)
+            
+            colors_data = finalize_analysis_accumulator(accumulator)
+            colors_data['decoded_dimensions'] = (width, height)
+            colors_data['decoded_pixels'] = width * height
+        # Row-major (N, 3) uint8 view, so pixel (x, y) is colors[y * width + x]
+        colors_data['pixels'] = pixels
+        colors_data['colors'] = pixels.reshape(-1, 3) if pixels is not None else None
+        colors_data['streamed'] = streaming
         
-        # Calculate statistics
-        total_colors = len(colors)
-        unique_count = len(unique_colors)
+        print(f"🎨 Extracted {colors_data['unique_count']} unique colors from {colors_data['total_samples']} pixels"
+              + (f" in {accumulator['strips']} strips" if streaming else ""))
         
-        print(f"🎨 Extracted {unique_count} unique colors from {total_colors} color samples")
+        return colors_data
         
+    except Exception as e:
+        print(f"❌ Color extraction failed: {str(e)}")
         return {
-            'colors': colors,
-            'unique_colors': unique_colors,
-            'color_counter': color_counter,
-            'total_samples': total_colors,
-            'unique_count': unique_count
+            'pixels': np.zeros((0, 0, 3), dtype=np.uint8), 'width': 0, 'height': 0, 'color_cube': None,
+            'colors': np.zeros((0, 3), dtype=np.uint8), 'unique_colors': np.zeros((0, 3), dtype=np.uint8),
+            'color_counts': count_colors(np.zeros((0, 3), dtype=np.uint8)), 'total_samples': 0, 'unique_count': 0
         }
+
+# ===== STREAMING ANALYSIS =====
+# Every extraction product is a mergeable partial (pixel statistics, colour
+# cube, colour counts, regional sums and counts), so an image can be
+# analyzed as a sequence of row strips. The in-memory path is one strip.
+#
+# This is chunked analysis, not incremental decoding: Pillow still decodes
+# the whole (max_dimension-reduced) raster at 3 bytes per pixel, and strips
+# are cropped from it. What streaming bounds is the analysis working memory
+# on top of the raster (pixel copies, packed codes, summed-area tables and
+# pending count tables), which is otherwise several times the raster size.
+#
+# Strip results match a single-strip run exactly for counts, histograms,
+# extrema and integer sums; floating-point sums (saturation, summed-area
+# region sums) differ only by summation order, well below the 3-decimal
+# rounding of the response (relative error < 1e-12).
+
+# Target pixels per strip when streaming
+STREAM_STRIP_PIXELS = int(os.environ.get('COLORLAB_STREAM_STRIP_PIXELS', str(1 << 20)))
+# Decoded images above this many pixels are always streamed; options.streaming
+# (true/false) forces the mode either way. It bounds the analysis working
+# arrays, not decode memory: the decoded raster is held whole in both modes.
+STREAMING_AUTO_PIXELS = int(os.environ.get('COLORLAB_STREAMING_AUTO_PIXELS', '16000000'))
+
+def iter_image_strips(image, rows_per_strip):
+    """Yield (start_y, (h, W, 3) uint8 array) row strips of a Pillow image"""
+    width, height = image.size
+    for start_y in range(0, height, rows_per_strip):
+        end_y = min(height, start_y + rows_per_strip)
+        yield start_y, np.asarray(image.crop((0, start_y, width, end_y)), dtype=np.uint8)
+
+def new_analysis_accumulator(width, height, grid=None, stages=None):
+    """Empty mergeable extraction state for a width x height image
+    
+    Colour counts are always collected; the pixel statistics, colour cube and
+    regional partials only when stages (default all) includes the stage
+    that reads them.
+    """
+    stages = ANALYSIS_STAGES if stages is None else stages
+    layout = regional_layout(width, height, grid) if 'regional_analysis' in stages else None
+    return {
+        'width': width,
+        'height': height,
+        'strips': 0,
+        'pixel_stats': compute_pixel_statistics(np.zeros((0, 3), dtype=np.uint8)) if 'pixel_stats' in stages else None,
+        'color_cube': None,
+        'collect_color_cube': 'color_cube' in stages,
+        'color_counts': [],
+        'regional_layout': layout,
+        'regional_partials': new_regional_partials(layout) if layout else None
+    }
+
+def accumulate_analysis_strip(accumulator, strip, start_y, offset=None):
+    """Fold an (h, W, 3) strip starting at image row start_y into the accumulator
+    
+    offset is the index of the strip's first pixel in pixel order (default
+    start_y * width), for colour tie-breaking across frames. Returns the
+    strip's count_colors table.
+    """
+    flat = strip.reshape(-1, 3)
+    offset = start_y * accumulator['width'] if offset is None else offset
+    accumulator['strips'] += 1
+    
+    if accumulator['pixel_stats'] is not None:
+        accumulator['pixel_stats'] = merge_pixel_statistics(accumulator['pixel_stats'], compute_pixel_statistics(flat))
+    
+    if accumulator['collect_color_cube']:
+        cube = build_color_cube(flat)
+        accumulator['color_cube'] = cube if accumulator['color_cube'] is None else accumulator['color_cube'] + cube
+    
+    color_counts = count_colors(flat, offset=offset)
+    append_color_counts(accumulator['color_counts'], color_counts)
+    
+    if accumulator['regional_partials'] is not None:
+        accumulate_regional_strip(accumulator['regional_partials'], accumulator['regional_layout'], strip, start_y,
+                                  offset=offset)
+    return color_counts
+
+def finalize_analysis_accumulator(accumulator):
+    """colors_data dict (without pixel arrays) from an accumulator"""
+    color_counts = merge_color_counts(accumulator['color_counts'])
+    unique_colors = unpack_rgb(color_counts['codes'])
+    return {
+        'width': accumulator['width'],
+        'height': accumulator['height'],
+        'color_cube': accumulator['color_cube'],
+        'color_counts': color_counts,
+        'unique_colors': unique_colors,
+        'pixel_stats': accumulator['pixel_stats'],
+        'regional_layout': accumulator['regional_layout'],
+        'regional_partials': accumulator['regional_partials'],
+        'total_samples': int(color_counts['counts'].sum()),
+        'unique_count': len(unique_colors)
+    }
+
+# ===== MULTI-FRAME IMAGES =====
+# Animated GIF, PNG and WebP images and multi-page TIFFs are analyzed over a
+# sample of their frames: every frame_stride-th frame, with the stride
+# widened so that at most max_frames are analyzed. Sampled frames are decoded
+# one at a time and folded into one analysis accumulator like strips of a
+# tall image, so colour counts, histograms and regional statistics merge
+# across frames while memory stays at one frame plus the merged partials.
+# Each sampled frame also adds an entry to the dominant-colour timeline.
+#
+# Analysis cost grows with the sampled frames only. GIF, APNG and WebP frames
+# are deltas drawn over the previous frame, so Pillow still decodes the
+# skipped frames up to the last sampled one, at native resolution and without
+# conversion or analysis; TIFF pages are seeked to directly. Frames whose size
+# differs from the first sampled frame (e.g. a TIFF thumbnail page) are
+# resized to it with nearest-neighbour resampling, which, unlike averaging,
+# adds no colours.
+
+# Formats whose extra frames are image content (MPO's are previews and depth maps)
+MULTI_FRAME_FORMATS = ('GIF', 'PNG', 'WEBP', 'TIFF')
+MULTI_FRAME = os.environ.get('COLORLAB_MULTI_FRAME', '1') == '1'
+FRAME_STRIDE = int(os.environ.get('COLORLAB_FRAME_STRIDE', '1'))
+MAX_FRAMES = int(os.environ.get('COLORLAB_MAX_FRAMES', '32'))
+# Dominant colours per timeline entry
+FRAME_TIMELINE_COLORS = 3
+
+def frame_sampling(options):
+    """(frame_stride, max_frames) of a request, or None when options.multi_frame is off"""
+    options = options or {}
+    if not options.get('multi_frame', MULTI_FRAME):
+        return None
+    sampling = []
+    for name, default in (('frame_stride', FRAME_STRIDE), ('max_frames', MAX_FRAMES)):
+        value = options.get(name)
+        try:
+            value = default if value is None else int(value)
+        except (TypeError, ValueError):
+            value = 0
+        if value < 1:
+            raise ValueError(f"{name} must be a positive integer")
+        sampling.append(value)
+    return tuple(sampling)
+
+def image_frame_count(image):
+    """Frames of an opened Pillow image that are analyzed as content"""
+    if image.format not in MULTI_FRAME_FORMATS:
+        return 1
+    return getattr(image, 'n_frames', 1)
+
+def iter_sampled_frames(image, indices, max_dimension):
+    """Yield (frame index, RGB frame, start ms, duration ms) for the given ascending frame indices
+    
+    Start times come from the decoder where it reports them (WebP) and
+    otherwise sum the preceding frames' durations (GIF, APNG); formats without
+    frame timing (TIFF) give None for both.
+    """
+    wanted = set(indices)
+    elapsed = 0
+    for index in range(indices[-1] + 1):
+        image.seek(index)
+        if index in wanted:
+            image.load()
+            duration = image.info.get('duration')
+            start = image.info.get('timestamp', elapsed if duration is not None else None)
+            yield (index, fit_image(image, max_dimension), None if start is None else int(start),
+                   None if duration is None else int(duration))
+        elapsed += image.info.get('duration') or 0
+
+def extract_colors_from_frames(image, frame_count, max_dimension=DECODE_MAX_DIMENSION, grid=None, streaming=None,
+                               stages=None, timings=None, sample_step=1, sampling=(1, MAX_FRAMES)):
+    """extract_colors_from_image_bytes over a sample of an opened multi-frame image's frames
+    
+    Returns the same colors_data (with no pixel arrays), totals over every
+    sampled frame, plus 'frames': the frame count, the requested and
+    effective stride and one timeline entry per sampled frame with its most
+    common colours.
+    """
+    requested_stride, max_frames = sampling
+    stride = max(requested_stride, -(-frame_count // max_frames))
+    indices = range(0, frame_count, stride)
+    rng = np.random.default_rng(SAMPLING_SEED)
+    accumulator, timeline = None, []
+    
+    with timed_stage(timings, 'extraction'):
+        for ordinal, (index, frame, start, duration) in enumerate(iter_sampled_frames(image, indices, max_dimension)):
+            if accumulator is None:
+                size = width, height = frame.size
+                if streaming is None:
+                    streaming = width * height > STREAMING_AUTO_PIXELS
+                rows_per_strip = max(sample_step, STREAM_STRIP_PIXELS // width // sample_step * sample_step)
+                sampled_width, sampled_height = -(-width // sample_step), -(-height // sample_step)
+                accumulator = new_analysis_accumulator(sampled_width, sampled_height, grid, stages)
+            elif frame.size != size:
+                frame = frame.resize(size, Image.NEAREST)
+            
+            # Frames follow each other in pixel order, so colour ties break towards earlier frames
+            offset = ordinal * sampled_width * sampled_height
+            strips = iter_image_strips(frame, rows_per_strip) if streaming else [(0, np.asarray(frame, dtype=np.uint8))]
+            frame_counts = []
+            for start_y, strip in strips:
+                if sample_step > 1:
+                    strip = stratified_sample(strip, sample_step, rng)
+                row = start_y // sample_step
+                frame_counts.append(accumulate_analysis_strip(accumulator, strip, row, offset + row * sampled_width))
+            del frame, strips, strip
+            
+            frame_counts = merge_color_counts(frame_counts)
+            timeline.append({
+                'frame': index,
+                'timestamp_ms': start,
+                'duration_ms': duration,
+                'pixels': int(frame_counts['counts'].sum()),
+                'top_colors': most_common_from_counts(frame_counts, FRAME_TIMELINE_COLORS)
+            })
         
-    except Exception as e:
-        print(f"❌ Color extraction failed: {str(e)}")
-        return {'colors': [], 'unique_colors': [], 'color_counter': Counter(), 'total_samples': 0, 'unique_count': 0}
+        colors_data = finalize_analysis_accumulator(accumulator)
+        colors_data['decoded_dimensions'] = size
+        colors_data['decoded_pixels'] = width * height * len(timeline)
+    
+    colors_data.update({'pixels': None, 'colors': None, 'streamed': streaming})
+    colors_data['frames'] = {
+        'frame_count': frame_count,
+        'requested_stride': requested_stride,
+        'frame_stride': stride,
+        'max_frames': max_frames,
+        'timeline': timeline
+    }
+    print(f"🎞️ Extracted {colors_data['unique_count']} unique colors from {len(timeline)} of {frame_count} "
+          f"{image.format or 'image'} frames ({width}x{height}, stride {stride})")
+    return colors_data
+
+def frame_timeline(frames, name_color=None):
+    """Response "frames" section: frame sampling and the per-frame dominant-colour timeline"""
+    name_color = name_color or get_accurate_color_name
+    timeline = []
+    for entry in frames['timeline']:
+        colors = []
+        for (r, g, b), count in entry['top_colors']:
+            colors.append({
+                "hex": f"#{r:02x}{g:02x}{b:02x}",
+                "rgb": {"r": r, "g": g, "b": b},
+                "name": name_color(r, g, b),
+                "percentage": round(count / max(entry['pixels'], 1) * 100, 2)
+            })
+        timeline.append({
+            "frame": entry['frame'],
+            "timestamp_ms": entry['timestamp_ms'],
+            "duration_ms": entry['duration_ms'],
+            "dominant_colors": colors
+        })
+    return {
+        "frame_count": frames['frame_count'],
+        "sampled_frames": len(timeline),
+        "frame_stride": frames['frame_stride'],
+        "requested_stride": frames['requested_stride'],
+        "max_frames": frames['max_frames'],
+        "timeline": timeline
+    }
+
+# ===== QUALITY TIERS =====
+# options.quality trades accuracy for latency by analyzing a stratified
+# spatial sample of the decoded pixels: one randomly placed pixel per
+# step x step cell. exact (the default) uses every pixel, balanced 1 in 4 and
+# fast 1 in 16. A coarser decode was not used for the lower tiers: averaging
+# pixels shifts saturation and colour counts in ways a sampling margin cannot
+# bound. Sampled responses carry 95% error margins next to percentages,
+# averages and histogram bins, estimated against the pixel count of the
+# exact path.
+
+# Sampling step (cell side in pixels) per tier
+QUALITY_TIERS = {'exact': 1, 'balanced': 2, 'fast': 4}
+DEFAULT_QUALITY = os.environ.get('COLORLAB_QUALITY', 'exact')
+# Normal quantile of the reported margins (95% confidence)
+SAMPLING_Z = 1.96
+# Fixed seed of the sample positions, so sampled analyses are reproducible and cacheable
+SAMPLING_SEED = 0
+
+def quality_tier(options):
+    """(name, sampling step) of the requested quality tier"""
+    name = str((options or {}).get('quality') or DEFAULT_QUALITY).lower()
+    if name not in QUALITY_TIERS:
+        raise ValueError(f"quality must be one of: {', '.join(QUALITY_TIERS)}")
+    return name, QUALITY_TIERS[name]
+
+def stratified_sample(pixels, step, rng):
+    """One pixel from every step x step cell of an (H, W, 3) array, at a random offset within the cell
+    
+    Returns the (ceil(H / step), ceil(W / step), 3) grid of chosen pixels, so
+    regional statistics still see the image layout. For strip-wise sampling
+    every strip must start on a multiple of step, so strips hold whole cells
+    and the strata are those of the whole image.
+    """
+    height, width = pixels.shape[:2]
+    rows, cols = -(-height // step), -(-width // step)
+    ys = np.minimum(np.arange(rows)[:, None] * step + rng.integers(0, step, (rows, cols)), height - 1)
+    xs = np.minimum(np.arange(cols)[None, :] * step + rng.integers(0, step, (rows, cols)), width - 1)
+    return pixels[ys, xs]
+
+def sampling_margins(analysis, context, sampling):
+    """Add 95% margins of error to the sampled statistics of analysis, in place
+    
+    Percentages that estimate pixel shares (dominant colours, most frequent
+    colour, k-means clusters, region colours, warm share) get
+    percentage_margin (percentage points) from the binomial standard error.
+    Averages get avg_margin from the weighted standard deviation over the
+    distinct colours, and histograms get bin_margins in pixels; all with the
+    finite-population correction for sampling analyzed_pixels out of
+    population_pixels.
+    """
+    n, population = sampling['analyzed_pixels'], sampling['population_pixels']
+    if n == 0:
+        return
+    fpc = math.sqrt(max(0.0, (population - n) / (population - 1))) if population > n else 0.0
+    
+    def percentage_margin(percentage, count=n):
+        p = min(max(percentage / 100, 0.0), 1.0)
+        return round(SAMPLING_Z * math.sqrt(p * (1 - p) / max(count, 1)) * fpc * 100, 2)
+    
+    def mean_margin(std, digits=3):
+        return round(SAMPLING_Z * std / math.sqrt(n) * fpc, digits)
+    
+    weights, unique = context.weights, context.unique_colors
+    
+    def weighted_std(values):
+        mean = np.average(values, weights=weights)
+        return float(np.sqrt(np.average((values - mean) ** 2, weights=weights)))
+    
+    most_frequent = (analysis.get('color_frequency') or {}).get('most_frequent')
+    if most_frequent:
+        most_frequent['percentage_margin'] = percentage_margin(most_frequent['percentage'])
+    
+    for color in analysis.get('dominant_colors') or []:
+        color['percentage_margin'] = percentage_margin(color['percentage'])
+    
+    for cluster in (analysis.get('kmeans_analysis') or {}).get('clusters') or []:
+        cluster['percentage_margin'] = percentage_margin(cluster['percentage'])
+    
+    for region in (analysis.get('regional_analysis') or {}).get('regions') or []:
+        region_pixels = region.get('statistics', {}).get('pixel_count', n)
+        for color in [region.get('dominant_color') or {}] + (region.get('top_colors') or []):
+            if 'percentage' in color:
+                color['percentage_margin'] = percentage_margin(color['percentage'], region_pixels)
+    
+    histograms = analysis.get('histograms')
+    if histograms and 'rgb' in histograms:
+        bins = {}
+        for group in ('rgb', 'hsv'):
+            for channel, counts in histograms[group].items():
+                if isinstance(counts, list):
+                    bins[channel] = [
+                        round(SAMPLING_Z * math.sqrt(count * (1 - count / n)) * fpc, 1) for count in counts
+                    ]
+        histograms['bin_margins'] = bins
+    
+    color_spaces = analysis.get('color_spaces')
+    if color_spaces:
+        for i, channel in enumerate(('red', 'green', 'blue')):
+            if channel in color_spaces.get('rgb', {}) and len(unique):
+                color_spaces['rgb'][channel]['avg_margin'] = mean_margin(weighted_std(unique[:, i].astype(np.float64)), 2)
+        for space in ('lab', 'lch', 'hsv'):
+            for values in (color_spaces.get(space) or {}).values():
+                if 'std' in values:
+                    values['avg_margin'] = mean_margin(values['std'])
+    
+    characteristics = analysis.get('characteristics')
+    if characteristics and len(unique):
+        temperature = characteristics.get('temperature', {})
+        if 'warm_percentage' in temperature:
+            temperature['percentage_margin'] = percentage_margin(temperature['warm_percentage'])
+        if 'average' in characteristics.get('brightness', {}):
+            characteristics['brightness']['average_margin'] = mean_margin(weighted_std(context.luminance))
+        if 'average' in characteristics.get('saturation', {}):
+            characteristics['saturation']['average_margin'] = mean_margin(weighted_std(context.saturation))
 
 def get_accurate_color_name(r, g, b):
     """Get accurate color name using comprehensive color database"""
@@ -242,23 +2589,48 @@ def get_accurate_color_name(r, g, b):
     if target_color in COLOR_DATABASE:
         return COLOR_DATABASE[target_color]
     
-    # Find closest color using Euclidean distance
+    # Find closest color by squared Euclidean distance, scanning only the
+    # palette entries that can be nearest anywhere in this colour's index cell
+    if _NAME_INDEX_CANDIDATES is None:
+        initialize_analysis_state()
     min_distance = float('inf')
-    closest_color_name = "Unknown"
+    closest_index = 0
     
-    for (cr, cg, cb), name in COLOR_DATABASE.items():
-        # Calculate Euclidean distance in RGB space
-        distance = math.sqrt((r - cr)**2 + (g - cg)**2 + (b - cb)**2)
+    for i in _NAME_INDEX_CANDIDATES[_name_index_cell(r, g, b)].tolist():
+        cr, cg, cb = _PALETTE_RGB[i]
+        distance = (r - cr)**2 + (g - cg)**2 + (b - cb)**2
         
         if distance < min_distance:
             min_distance = distance
-            closest_color_name = name
+            closest_index = i
     
-    # If distance is too large, use generic names
-    if min_distance > 100:
+    # If distance is too large (> 100), use generic names
+    if min_distance > 100**2:
         return get_generic_color_name(r, g, b)
     
-    return closest_color_name
+    return _PALETTE_NAMES[closest_index]
+
+def get_accurate_color_names(colors):
+    """Vectorized get_accurate_color_name for an (N, 3) array of colours"""
+    if _NAME_INDEX_CANDIDATES is None:
+        initialize_analysis_state()
+    pixels = np.asarray(colors).reshape(-1, 3)
+    names = np.empty(len(pixels), dtype=object)
+    
+    for start in range(0, len(pixels), 65536):
+        chunk = pixels[start:start + 65536]
+        candidates = _NAME_INDEX_CANDIDATES[_name_index_cells(chunk)]
+        d2 = ((_PALETTE_ARRAY[candidates] - chunk[:, None, :].astype(np.float64)) ** 2).sum(axis=-1)
+        # argmin keeps the first of equal distances, i.e. the earliest database entry
+        best = d2.argmin(axis=1)
+        rows = np.arange(len(chunk))
+        chunk_names = _PALETTE_NAME_ARRAY[candidates[rows, best]]
+        far = d2[rows, best] > 100**2
+        if far.any():
+            chunk_names[far] = get_generic_color_names(chunk[far])
+        names[start:start + len(chunk)] = chunk_names
+    
+    return names.tolist()
 
 def get_generic_color_name(r, g, b):
     """Fallback to generic color naming"""
@@ -296,141 +2668,767 @@ def get_generic_color_name(r, g, b):
     else:
         return "Red"
 
-def rgb_to_hsv_accurate(r, g, b):
-    """Convert RGB to HSV accurately"""
-    r, g, b = r/255.0, g/255.0, b/255.0
+def get_generic_color_names(colors):
+    """Vectorized get_generic_color_name for an (N, 3) array of colours"""
+    h, s, v = rgb_to_hsv_array(colors)
+    
+    gray_names = np.select(
+        [v < 0.2, v < 0.4, v < 0.6, v < 0.8],
+        ["Black", "Dark Gray", "Gray", "Light Gray"], "White"
+    )
+    hue_names = np.select(
+        [(h < 15) | (h >= 345), h < 45, h < 75, h < 150, h < 210, h < 270, h < 330],
+        ["Red", "Orange", "Yellow", "Green", "Blue", "Purple", "Pink"], "Red"
+    )
+    return np.where(s < 0.1, gray_names, hue_names).astype(object)
+
+def rgb_to_hsv_accurate(r, g, b):
+    """Convert RGB to HSV accurately"""
+    r, g, b = r/255.0, g/255.0, b/255.0
+    
+    max_val = max(r, g, b)
+    min_val = min(r, g, b)
+    diff = max_val - min_val
+    
+    # Value
+    v = max_val
+    
+    # Saturation
+    if max_val == 0:
+        s = 0
+    else:
+        s = diff / max_val
+    
+    # Hue
+    if diff == 0:
+        h = 0
+    elif max_val == r:
+        h = (60 * ((g - b) / diff) + 360) % 360
+    elif max_val == g:
+        h = (60 * ((b - r) / diff) + 120) % 360
+    else:
+        h = (60 * ((r - g) / diff) + 240) % 360
+    
+    return h, s, v
+
+def rgb_to_hsv_array(pixels):
+    """Vectorized rgb_to_hsv_accurate: (N, 3) RGB in 0-255 to hue degrees, saturation, value"""
+    rgb = np.asarray(pixels, dtype=np.float64).reshape(-1, 3) / 255.0
+    r, g, b = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+    
+    max_val = rgb.max(axis=1)
+    min_val = rgb.min(axis=1)
+    diff = max_val - min_val
+    
+    v = max_val
+    s = np.divide(diff, max_val, out=np.zeros_like(max_val), where=max_val != 0)
+    
+    safe_diff = np.where(diff == 0, 1.0, diff)
+    h = np.where(
+        max_val == r, (60 * ((g - b) / safe_diff) + 360) % 360,
+        np.where(max_val == g, (60 * ((b - r) / safe_diff) + 120) % 360,
+                 (60 * ((r - g) / safe_diff) + 240) % 360)
+    )
+    h = np.where(diff == 0, 0.0, h)
+    
+    return h, s, v
+
+# ===== COLOR SPACE ENGINE =====
+# Vectorized sRGB -> linear RGB -> CIE XYZ -> CIELAB -> LCh conversions
+# (D65 white, 2° observer) over (..., 3) arrays: whole pixel arrays, distinct
+# colours or cube bin centres. uint8 input is linearized through a 256-entry
+# lookup table; float input (0-255, e.g. bin centres) uses the formula.
+
+# Linear sRGB -> XYZ (IEC 61966-2-1, D65)
+SRGB_TO_XYZ = (
+    (0.4124564, 0.3575761, 0.1804375),
+    (0.2126729, 0.7151522, 0.0721750),
+    (0.0193339, 0.1191920, 0.9503041)
+)
+# D65 reference white in XYZ
+D65_WHITE = (0.95047, 1.0, 1.08883)
+
+_LAB_EPSILON = (6 / 29) ** 3
+_LAB_SLOPE = 1 / (3 * (6 / 29) ** 2)
+
+_COLOR_SPACE_TABLES = {}
+
+def srgb_linear_table():
+    """Linear-light value of every 8-bit sRGB level, built once"""
+    table = _COLOR_SPACE_TABLES.get('srgb_linear')
+    if table is None:
+        table = srgb_to_linear(np.arange(256, dtype=np.float64))
+        _COLOR_SPACE_TABLES['srgb_linear'] = table
+    return table
+
+def srgb_to_linear(rgb):
+    """(..., 3) sRGB in 0-255 to linear RGB in 0-1"""
+    rgb = np.asarray(rgb)
+    if rgb.dtype == np.uint8:
+        return srgb_linear_table()[rgb]
+    c = rgb.astype(np.float64) / 255.0
+    return np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+
+def linear_rgb_to_xyz(linear):
+    """(..., 3) linear RGB to CIE XYZ (Y of white = 1)"""
+    return linear @ np.asarray(SRGB_TO_XYZ).T
+
+def xyz_to_lab(xyz):
+    """(..., 3) CIE XYZ to CIELAB relative to D65"""
+    t = xyz / np.asarray(D65_WHITE)
+    f = np.where(t > _LAB_EPSILON, np.cbrt(t), t * _LAB_SLOPE + 4 / 29)
+    lab = np.empty_like(f)
+    lab[..., 0] = 116 * f[..., 1] - 16
+    lab[..., 1] = 500 * (f[..., 0] - f[..., 1])
+    lab[..., 2] = 200 * (f[..., 1] - f[..., 2])
+    return lab
+
+def lab_to_lch(lab):
+    """(..., 3) CIELAB to LCh: lightness, chroma and hue angle in degrees"""
+    lch = np.empty_like(lab)
+    lch[..., 0] = lab[..., 0]
+    lch[..., 1] = np.hypot(lab[..., 1], lab[..., 2])
+    lch[..., 2] = np.degrees(np.arctan2(lab[..., 2], lab[..., 1])) % 360
+    return lch
+
+def rgb_to_lab_array(pixels):
+    """(..., 3) sRGB in 0-255 to CIELAB"""
+    return xyz_to_lab(linear_rgb_to_xyz(srgb_to_linear(pixels)))
+
+def ciede2000(lab1, lab2):
+    """CIEDE2000 colour difference between LAB arrays, broadcast like lab1 - lab2 (kL = kC = kH = 1)"""
+    lab1 = np.asarray(lab1, dtype=np.float64)
+    lab2 = np.asarray(lab2, dtype=np.float64)
+    L1, a1, b1 = lab1[..., 0], lab1[..., 1], lab1[..., 2]
+    L2, a2, b2 = lab2[..., 0], lab2[..., 1], lab2[..., 2]
+    
+    # a' rescaled by chroma so neutral colours are not over-weighted
+    c_mean = (np.hypot(a1, b1) + np.hypot(a2, b2)) / 2
+    c_mean7 = c_mean ** 7
+    g = 0.5 * (1 - np.sqrt(c_mean7 / (c_mean7 + 25.0 ** 7)))
+    a1p, a2p = a1 * (1 + g), a2 * (1 + g)
+    c1p, c2p = np.hypot(a1p, b1), np.hypot(a2p, b2)
+    h1p = np.degrees(np.arctan2(b1, a1p)) % 360
+    h2p = np.degrees(np.arctan2(b2, a2p)) % 360
+    
+    delta_l = L2 - L1
+    delta_c = c2p - c1p
+    chroma_product = c1p * c2p
+    dh = h2p - h1p
+    dh = np.where(dh > 180, dh - 360, np.where(dh < -180, dh + 360, dh))
+    dh = np.where(chroma_product == 0, 0.0, dh)
+    delta_h = 2 * np.sqrt(chroma_product) * np.sin(np.radians(dh / 2))
+    
+    l_mean = (L1 + L2) / 2
+    c_mean_p = (c1p + c2p) / 2
+    h_sum = h1p + h2p
+    h_mean = np.where(np.abs(h1p - h2p) > 180, np.where(h_sum < 360, h_sum + 360, h_sum - 360), h_sum) / 2
+    h_mean = np.where(chroma_product == 0, h_sum, h_mean)
+    
+    t = (1 - 0.17 * np.cos(np.radians(h_mean - 30)) + 0.24 * np.cos(np.radians(2 * h_mean))
+         + 0.32 * np.cos(np.radians(3 * h_mean + 6)) - 0.20 * np.cos(np.radians(4 * h_mean - 63)))
+    l_offset = (l_mean - 50) ** 2
+    s_l = 1 + 0.015 * l_offset / np.sqrt(20 + l_offset)
+    s_c = 1 + 0.045 * c_mean_p
+    s_h = 1 + 0.015 * c_mean_p * t
+    c_mean_p7 = c_mean_p ** 7
+    r_t = (-2 * np.sqrt(c_mean_p7 / (c_mean_p7 + 25.0 ** 7))
+           * np.sin(np.radians(60 * np.exp(-(((h_mean - 275) / 25) ** 2)))))
+    
+    return np.sqrt(
+        (delta_l / s_l) ** 2 + (delta_c / s_c) ** 2 + (delta_h / s_h) ** 2
+        + r_t * (delta_c / s_c) * (delta_h / s_h)
+    )
+
+def weighted_channel_statistics(values, weights, names, digits=2):
+    """{name: {min, max, avg, std}} for each column of (N, k) values weighted by pixel counts"""
+    total = weights.sum()
+    mean = weights @ values / total
+    std = np.sqrt(np.maximum(weights @ (values - mean) ** 2 / total, 0))
+    low, high = values.min(axis=0), values.max(axis=0)
+    return {
+        name: {"min": round(float(low[i]), digits), "max": round(float(high[i]), digits),
+               "avg": round(float(mean[i]), digits), "std": round(float(std[i]), digits)}
+        for i, name in enumerate(names)
+    }
+
+def weighted_hue_statistics(hue_degrees, weights):
+    """Circular mean hue and its concentration (0 = spread evenly, 1 = a single hue)"""
+    radians = np.radians(hue_degrees)
+    total = weights.sum()
+    x, y = weights @ np.cos(radians), weights @ np.sin(radians)
+    if total <= 0:
+        return {"mean": 0.0, "concentration": 0.0}
+    return {
+        "mean": round(float(np.degrees(np.arctan2(y, x)) % 360), 1),
+        "concentration": round(float(np.hypot(x, y) / total), 3)
+    }
+
+# ===== COLOR NAME INDEX =====
+
+# Bits per channel of the naming index cells (5 bits -> 32x32x32 cells of 8x8x8 colours)
+COLOR_NAME_INDEX_BITS = 5
+
+def build_color_name_index(bits=COLOR_NAME_INDEX_BITS):
+    """Precompute the palette entries that can be the nearest name anywhere in each RGB cell
+    
+    For every cell the smallest worst-case distance to any palette entry bounds
+    the distance to the true nearest entry, so only entries whose best-case
+    distance is within that bound can win. Rows are padded with their first
+    candidate so they stay in ascending database order.
+    """
+    palette = np.array(list(COLOR_DATABASE.keys()), dtype=np.int64)
+    levels = 1 << bits
+    width = 256 >> bits
+    low = (np.arange(levels) * width)[:, None]
+    high = low + width
+    
+    # Per-channel best/worst-case squared distances between each cell span and each palette entry
+    min_d2, max_d2 = [], []
+    for channel in range(3):
+        p = palette[None, :, channel]
+        gap = np.clip(low - p, 0, None) + np.clip(p - high, 0, None)
+        min_d2.append(gap ** 2)
+        max_d2.append(np.maximum((low - p) ** 2, (high - p) ** 2))
+    
+    min_d2 = (min_d2[0][:, None, None, :] + min_d2[1][None, :, None, :] + min_d2[2][None, None, :, :])
+    max_d2 = (max_d2[0][:, None, None, :] + max_d2[1][None, :, None, :] + max_d2[2][None, None, :, :])
+    min_d2 = min_d2.reshape(levels ** 3, -1)
+    bound = max_d2.reshape(levels ** 3, -1).min(axis=1)
+    
+    is_candidate = min_d2 <= bound[:, None]
+    width_needed = int(is_candidate.sum(axis=1).max())
+    order = np.argsort(~is_candidate, axis=1, kind='stable')[:, :width_needed]
+    valid = np.take_along_axis(is_candidate, order, axis=1)
+    candidates = np.where(valid, order, order[:, :1])
+    
+    return candidates.astype(np.int16)
+
+def _name_index_cell(r, g, b):
+    """Index cell of a single colour"""
+    shift = 8 - COLOR_NAME_INDEX_BITS
+    r, g, b = (min(max(int(c), 0), 255) >> shift for c in (r, g, b))
+    return (r << (2 * COLOR_NAME_INDEX_BITS)) | (g << COLOR_NAME_INDEX_BITS) | b
+
+def _name_index_cells(colors):
+    """Index cells of an (N, 3) array of colours"""
+    shift = 8 - COLOR_NAME_INDEX_BITS
+    quantized = np.clip(np.asarray(colors), 0, 255).astype(np.intp) >> shift
+    return (quantized[:, 0] << (2 * COLOR_NAME_INDEX_BITS)) | (quantized[:, 1] << COLOR_NAME_INDEX_BITS) | quantized[:, 2]
+
+# Precomputed naming index bundled with the function; regenerate with
+# `python lambda_function_colorlab_complete.py` after editing COLOR_DATABASE
+COLOR_INDEX_FILE = os.environ.get(
+    'COLORLAB_COLOR_INDEX_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'color_name_index.npz')
+)
+
+# Palette arrays and naming index are set up once per container by initialize_analysis_state
+_PALETTE_RGB = list(COLOR_DATABASE.keys())
+_PALETTE_NAMES = list(COLOR_DATABASE.values())
+_PALETTE_ARRAY = None
+_PALETTE_NAME_ARRAY = None
+_NAME_INDEX_CANDIDATES = None
+_INIT_LOCK = threading.Lock()
+
+def palette_digest():
+    """Identifies the palette and index layout a bundled index was built for"""
+    digest = hashlib.sha256(json.dumps([COLOR_NAME_INDEX_BITS, list(COLOR_DATABASE.items())]).encode('utf-8'))
+    return digest.hexdigest()
+
+def load_color_name_index(path=COLOR_INDEX_FILE):
+    """Bundled naming index, or None when it is missing or was built for another palette"""
+    try:
+        with np.load(path) as bundle:
+            if str(bundle['digest']) != palette_digest():
+                print("⚠️ Bundled color index is stale, rebuilding")
+                return None
+            return bundle['candidates']
+    except (OSError, KeyError, ValueError):
+        return None
+
+def save_color_name_index(path=COLOR_INDEX_FILE):
+    """Write the naming index for bundling with the function"""
+    np.savez_compressed(path, candidates=build_color_name_index(), digest=np.array(palette_digest()))
+
+def load_heavy_modules():
+    """Resolve the lazily imported NumPy and Pillow modules"""
+    np.ndarray
+    Image.open
+
+def initialize_analysis_state():
+    """Set up palette arrays and the naming index (from the bundled file when valid); idempotent"""
+    global _PALETTE_ARRAY, _PALETTE_NAME_ARRAY, _NAME_INDEX_CANDIDATES
+    with _INIT_LOCK:
+        if _NAME_INDEX_CANDIDATES is not None:
+            return
+        timings = OrderedDict()
+        
+        # Timed without tracemalloc, which would slow imports and setup several-fold
+        with timed_stage(timings, 'heavy_imports', trace_memory=False):
+            load_heavy_modules()
+        
+        with timed_stage(timings, 'analysis_state', trace_memory=False):
+            candidates = load_color_name_index()
+            _INIT_STATE['color_index_source'] = 'bundled' if candidates is not None else 'built'
+            if candidates is None:
+                candidates = build_color_name_index()
+            _PALETTE_ARRAY = np.array(_PALETTE_RGB, dtype=np.float64)
+            _PALETTE_NAME_ARRAY = np.array(_PALETTE_NAMES, dtype=object)
+            _NAME_INDEX_CANDIDATES = candidates
+        INIT_TIMINGS.update(timings)
+        emit_stage_metrics(timings)
+
+# ===== SHARED COLOR CUBE =====
+
+# Levels per channel in the quantized colour cube (5 bits -> 32x32x32 cells)
+COLOR_CUBE_BITS = 5
+# Bins per histogram unless options.histogram_bins asks for another count
+HISTOGRAM_BINS = 16
+
+def build_color_cube(pixels, bits=COLOR_CUBE_BITS):
+    """Count pixels into a quantized (L, L, L) RGB cube with a single bincount pass"""
+    pixels = as_pixel_array(pixels)
+    levels = 1 << bits
+    shift = 8 - bits
+    # 15-bit cell index built in place in a single uint16 buffer
+    index = (pixels[:, 0] >> shift).astype(np.uint16)
+    index <<= bits
+    index |= pixels[:, 1] >> shift
+    index <<= bits
+    index |= pixels[:, 2] >> shift
+    return np.bincount(index, minlength=levels ** 3).reshape(levels, levels, levels)
+
+def cube_bin_centers(cube):
+    """RGB centre of every cube cell as an (L**3, 3) float array, in cube.ravel() order"""
+    levels = cube.shape[0]
+    centers = (np.arange(levels) + 0.5) * (256 / levels)
+    r, g, b = np.meshgrid(centers, centers, centers, indexing='ij')
+    return np.stack([r.ravel(), g.ravel(), b.ravel()], axis=-1)
+
+def cube_channel_histogram(cube, axis, bins=16):
+    """Equal-width histogram of one channel (0=R, 1=G, 2=B) derived from the cube"""
+    levels = cube.shape[0]
+    per_level = cube.sum(axis=tuple(a for a in range(3) if a != axis))
+    if levels % bins == 0:
+        # Bins align with cube levels, so the result is exact
+        return per_level.reshape(bins, -1).sum(axis=1)
+    # Otherwise each level falls into the bin containing its centre
+    centers = (np.arange(levels) + 0.5) * (256 / levels)
+    bin_index = np.minimum((centers * bins / 256).astype(np.intp), bins - 1)
+    return np.bincount(bin_index, weights=per_level, minlength=bins).astype(np.int64)
+
+def cube_hsv_histograms(cube, hue_bins=12, bins=16):
+    """Hue, saturation and value histograms weighted by the cube cell counts"""
+    counts = cube.ravel()
+    occupied = counts > 0
+    h, s, v = rgb_to_hsv_array(cube_bin_centers(cube)[occupied])
+    weights = counts[occupied]
+    
+    # Hue is only meaningful for chromatic cells (same threshold as generic naming)
+    chromatic = s >= 0.1
+    # Rounded first: cell centres often sit exactly on a hue bin edge, and float
+    # error would otherwise drop some of them into the bin below
+    hue_index = np.minimum(np.floor(np.round(h[chromatic] / 360 * hue_bins, 9)).astype(np.intp), hue_bins - 1)
+    
+    def histogram(values, n):
+        index = np.minimum((values * n).astype(np.intp), n - 1)
+        return np.bincount(index, weights=weights, minlength=n).astype(np.int64).tolist()
+    
+    return {
+        "hue": np.bincount(hue_index, weights=weights[chromatic], minlength=hue_bins).astype(np.int64).tolist(),
+        "saturation": histogram(s, bins),
+        "value": histogram(v, bins),
+        "achromatic_pixels": int(weights[~chromatic].sum())
+    }
+
+# ===== ANALYSIS CONTEXT =====
+# Products derived from a request's extraction output (distinct colours and
+# their counts, per-colour luminance, saturation, HSV and LAB, the top colours
+# by count and colour names) are computed on first use and shared by every
+# stage of the request, instead of each stage deriving its own copy.
+
+class AnalysisContext:
+    """Inputs and memoized derived products of one analysis request
+    
+    Per-colour arrays are over unique_colors, in the order of
+    color_counts['codes'], so counts doubles as their pixel weights.
+    """
+    
+    def __init__(self, image_bytes, colors_data, options=None, results=None):
+        self.image_bytes = image_bytes
+        self.colors_data = colors_data
+        self.options = options or {}
+        self.results = dict(results or {})
+        self._top_order = None
+        self._names = {}
+    
+    @classmethod
+    def for_colors(cls, colors, color_counts=None):
+        """Context over bare pixels (or their count_colors table), for stage functions called directly"""
+        return cls(b'', {'colors': colors, 'color_counts': color_counts})
+    
+    @cached_property
+    def color_counts(self):
+        color_counts = self.colors_data.get('color_counts')
+        return color_counts if color_counts is not None else count_colors(as_pixel_array(self.colors_data['colors']))
+    
+    @cached_property
+    def unique_colors(self):
+        unique_colors = self.colors_data.get('unique_colors')
+        return unique_colors if unique_colors is not None else unpack_rgb(self.color_counts['codes'])
+    
+    @property
+    def counts(self):
+        return self.color_counts['counts']
+    
+    @cached_property
+    def weights(self):
+        """Pixel counts of the distinct colours as float64 weights"""
+        return self.counts.astype(np.float64)
+    
+    @cached_property
+    def luminance(self):
+        return calculate_luminance_array(self.unique_colors)
+    
+    @cached_property
+    def saturation(self):
+        return calculate_saturation_array(self.unique_colors)
+    
+    @cached_property
+    def hsv(self):
+        """(hue degrees, saturation, value) arrays"""
+        return rgb_to_hsv_array(self.unique_colors)
+    
+    @cached_property
+    def lab(self):
+        return rgb_to_lab_array(self.unique_colors)
+    
+    def most_common(self, n):
+        """most_common_from_counts(color_counts, n), selecting the top entries once for all callers"""
+        if self._top_order is None or len(self._top_order) < min(n, len(self.counts)):
+            color_counts = self.color_counts
+            self._top_order = top_count_order(color_counts['counts'], color_counts['first_index'], max(n, 16))
+        return most_common_from_counts(self.color_counts, n, self._top_order)
+    
+    def color_name(self, r, g, b):
+        """get_accurate_color_name, memoized per colour for the request"""
+        key = (int(r), int(g), int(b))
+        name = self._names.get(key)
+        if name is None:
+            name = self._names[key] = get_accurate_color_name(*key)
+        return name
+
+# ===== ANALYSIS STAGES =====
+# Each stage is (dependencies, function(context)) over the request's
+# AnalysisContext; a request's sections are resolved into a plan that runs
+# every needed stage once, dependencies first.
+
+def stage_pixel_stats(context):
+    """Shared per-pixel statistics for the characteristics and color space stages"""
+    pixel_stats = context.colors_data.get('pixel_stats')
+    return pixel_stats if pixel_stats is not None else compute_pixel_statistics(context.colors_data['colors'])
+
+def stage_color_cube(context):
+    """Shared colour cube for histogram-based stages"""
+    color_cube = context.colors_data.get('color_cube')
+    return color_cube if color_cube is not None else build_color_cube(context.colors_data['colors'])
+
+def stage_dominant_colors(context):
+    return generate_enhanced_dominant_colors(context.colors_data['colors'], context.color_counts, context)
+
+def stage_color_frequency(context):
+    return generate_color_frequency_analysis(
+        context.colors_data['colors'], context.unique_colors, context.color_counts, context
+    )
+
+def stage_kmeans_analysis(context):
+    return perform_kmeans_clustering(
+        context.colors_data['colors'], kmeans_clusters_option(context.options), context.color_counts, context
+    )
+
+def stage_regional_analysis(context):
+    colors_data = context.colors_data
+    return analyze_enhanced_regional_analysis(
+        context.image_bytes, colors_data['colors'], colors_data.get('width'), colors_data.get('height'),
+        grid_option(context.options), colors_data.get('regional_partials'), colors_data.get('regional_layout'),
+        context.color_name
+    )
+
+def stage_histograms(context):
+    bins = positive_int_option(context.options, 'histogram_bins', HISTOGRAM_BINS)
+    return generate_histograms(context.colors_data['colors'], bins, context.results['color_cube'])
+
+def stage_color_spaces(context):
+    return analyze_color_spaces(context.colors_data['colors'], context.results['pixel_stats'], context)
+
+def stage_characteristics(context):
+    return analyze_color_characteristics(
+        context.colors_data['colors'], context.unique_colors, context.results['dominant_colors'],
+        context.results['pixel_stats']
+    )
+
+def stage_ai_training_data(context):
+    return generate_training_data(context.colors_data['colors'], context.results['dominant_colors'], len(context.image_bytes))
+
+def stage_cnn_analysis(context):
+    return perform_cnn_analysis(context.image_bytes, context.colors_data['colors'], context.results['dominant_colors'])
+
+ANALYSIS_STAGES = {
+    'pixel_stats': ((), stage_pixel_stats),
+    'color_cube': ((), stage_color_cube),
+    'dominant_colors': ((), stage_dominant_colors),
+    'color_frequency': ((), stage_color_frequency),
+    'kmeans_analysis': ((), stage_kmeans_analysis),
+    'regional_analysis': ((), stage_regional_analysis),
+    'histograms': (('color_cube',), stage_histograms),
+    'color_spaces': (('pixel_stats',), stage_color_spaces),
+    'characteristics': (('dominant_colors', 'pixel_stats'), stage_characteristics),
+    'ai_training_data': (('dominant_colors',), stage_ai_training_data),
+    'cnn_analysis': (('dominant_colors',), stage_cnn_analysis)
+}
+
+# Response sections, in response order
+ANALYSIS_SECTIONS = [
+    'dominant_colors', 'color_frequency', 'kmeans_analysis', 'regional_analysis', 'histograms',
+    'color_spaces', 'characteristics', 'ai_training_data', 'cnn_analysis'
+]
+
+def requested_sections(options):
+    """Sections asked for in options (list or comma-separated string), in response order; None for all
     
-    max_val = max(r, g, b)
-    min_val = min(r, g, b)
-    diff = max_val - min_val
+    Compact requests default to every section except COMPACT_DROPPED_SECTIONS.
+    """
+    sections = (options or {}).get('sections')
+    if sections is None:
+        if (options or {}).get('compact'):
+            return [name for name in ANALYSIS_SECTIONS if name not in COMPACT_DROPPED_SECTIONS]
+        return None
+    if isinstance(sections, str):
+        sections = [name.strip() for name in sections.split(',') if name.strip()]
+    unknown = [str(name) for name in sections if name not in ANALYSIS_SECTIONS]
+    if unknown:
+        raise ValueError(f"Unknown analysis sections: {', '.join(unknown)}")
+    return [name for name in ANALYSIS_SECTIONS if name in sections]
+
+def positive_int_option(options, name, default):
+    """Integer option that must be at least 1, or default when absent"""
+    value = (options or {}).get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        value = 0
+    if value < 1:
+        raise ValueError(f"{name} must be a positive integer")
+    return value
+
+def grid_option(options):
+    """Custom (rows, cols) region grid from options.grid ([rows, cols] or "RxC"), or None"""
+    grid = (options or {}).get('grid')
+    if not grid:
+        return None
+    try:
+        if isinstance(grid, str):
+            grid = parse_option_value('grid', grid)
+        rows, cols = (int(part) for part in grid)
+    except (TypeError, ValueError):
+        rows = cols = 0
+    if rows < 1 or cols < 1:
+        raise ValueError("grid must be two positive integers [rows, cols]")
+    return rows, cols
+
+def validate_options(options):
+    """Raise ValueError for options a request cannot be analyzed with"""
+    if not isinstance(options, dict):
+        raise ValueError("options must be a JSON object")
+    requested_sections(options)
+    positive_int_option(options, 'max_dimension', DECODE_MAX_DIMENSION)
+    positive_int_option(options, 'histogram_bins', HISTOGRAM_BINS)
+    grid_option(options)
+    quality_tier(options)
+    kmeans_clusters_option(options)
+    stage_workers_option(options)
+    palette_image_id(options)
+    frame_sampling(options)
+
+def analysis_stage_plan(sections=None, completed=()):
+    """Stages needed for the given sections, each once and after its dependencies
     
-    # Value
-    v = max_val
+    Stages in completed are left out, along with dependencies that only they need.
+    """
+    plan = []
     
-    # Saturation
-    if max_val == 0:
-        s = 0
-    else:
-        s = diff / max_val
+    def visit(name):
+        if name in plan or name in completed:
+            return
+        for dependency in ANALYSIS_STAGES[name][0]:
+            visit(dependency)
+        plan.append(name)
     
-    # Hue
-    if diff == 0:
-        h = 0
-    elif max_val == r:
-        h = (60 * ((g - b) / diff) + 360) % 360
-    elif max_val == g:
-        h = (60 * ((b - r) / diff) + 120) % 360
-    else:
-        h = (60 * ((r - g) / diff) + 240) % 360
+    for name in (ANALYSIS_SECTIONS if sections is None else sections):
+        visit(name)
+    return plan
+
+# ===== STAGE EXECUTION =====
+# Once pixels are extracted, stages only depend on each other through
+# ANALYSIS_STAGES, so with more than one vCPU every stage whose dependencies
+# are done runs at once on a thread pool. Stage work is NumPy array code,
+# which releases the GIL; Lambda's vCPU count grows with its memory size
+# (one vCPU below 1769 MB), and with a single vCPU stages run in order on
+# the calling thread as before. A process pool is not used: Lambda has no
+# /dev/shm for multiprocessing's semaphores and shared memory, and stages
+# read compact extraction products rather than pixel buffers.
+
+# Threads per request for independent stages; 0 means one per available vCPU
+STAGE_WORKERS = int(os.environ.get('COLORLAB_STAGE_WORKERS', '0'))
+
+def stage_workers_option(options):
+    """Stage threads for a request: options.stage_workers, else STAGE_WORKERS, else one per vCPU
     
-    return h, s, v
+    Never more than the available vCPUs, since extra threads only contend.
+    """
+    value = (options or {}).get('stage_workers') or STAGE_WORKERS or available_workers()
+    try:
+        workers = int(value)
+    except (TypeError, ValueError):
+        workers = 0
+    if workers < 1:
+        raise ValueError("stage_workers must be a positive integer")
+    return min(workers, available_workers())
+
+def run_stage(context, name, timings):
+    """Run one stage against the context, recording it in timings"""
+    with timed_stage(timings, name):
+        return ANALYSIS_STAGES[name][1](context)
+
+def run_analysis_stages(plan, image_bytes, colors_data, options, timings=None, completed=None, checkpoint=None,
+                        context=None):
+    """Run planned stages, dependencies first, returning {stage: result} and recording each in timings
+    
+    Stages already in completed (e.g. a job's saved checkpoints) are not rerun;
+    checkpoint(name, result) is called as each response section finishes.
+    Pass context to keep the request's AnalysisContext after the run.
+    Independent stages run concurrently on stage_workers_option(options)
+    threads; timings are recorded in plan order either way.
+    """
+    if context is None:
+        context = AnalysisContext(image_bytes, colors_data, options, completed)
+    remaining = [name for name in plan if name not in context.results]
+    workers = min(stage_workers_option(options), len(remaining))
+    
+    def finish(name, result):
+        context.results[name] = result
+        if checkpoint is not None and name in ANALYSIS_SECTIONS:
+            checkpoint(name, result)
+    
+    if workers <= 1:
+        for name in remaining:
+            finish(name, run_stage(context, name, timings))
+        return context.results
+    
+    stage_timings = None if timings is None else {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='colorlab-stage') as executor:
+        running = {}
+        while remaining or running:
+            ready = [name for name in remaining if all(d in context.results for d in ANALYSIS_STAGES[name][0])]
+            for name in ready:
+                remaining.remove(name)
+                running[executor.submit(run_stage, context, name, stage_timings)] = name
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                finish(running.pop(future), future.result())
+    if timings is not None:
+        for name in plan:
+            if name in stage_timings:
+                timings[name] = stage_timings[name]
+    return context.results
 
-def generate_enhanced_colorlab_analysis(image_bytes, colors_data):
-    """Generate enhanced ColorLab analysis with accurate color names"""
+def generate_enhanced_colorlab_analysis(image_bytes, colors_data, options=None, timings=None, completed=None,
+                                        checkpoint=None, context=None):
+    """Generate enhanced ColorLab analysis with accurate color names
+    
+    options.sections limits the response to those sections; only the stages
+    they depend on are run. completed, checkpoint and context are passed to
+    run_analysis_stages.
+    """
     try:
         # Use actual image data characteristics
         image_size = len(image_bytes)
-        colors = colors_data['colors']
-        unique_colors = colors_data['unique_colors']
-        color_counter = colors_data['color_counter']
-        
-        # 1. Enhanced Dominant Colors with accurate names
-        dominant_colors = generate_enhanced_dominant_colors(colors, color_counter)
-        
-        # 2. Color Frequency Analysis
-        color_frequency = generate_color_frequency_analysis(colors, unique_colors, color_counter)
-        
-        # 3. K-Means Analysis
-        kmeans_analysis = perform_kmeans_clustering(colors)
-        
-        # 4. Enhanced Regional Analysis
-        regional_analysis = analyze_enhanced_regional_analysis(image_bytes, colors)
-        
-        # 5. Histograms
-        histograms = generate_histograms(colors)
-        
-        # 6. Color Spaces
-        color_spaces = analyze_color_spaces(colors)
+        options = options or {}
+        sections = requested_sections(options) or ANALYSIS_SECTIONS
+        timings = OrderedDict() if timings is None else timings
         
-        # 7. Characteristics
-        characteristics = analyze_color_characteristics(colors, unique_colors, dominant_colors)
-        
-        # 8. Training Data
-        ai_training_data = generate_training_data(colors, dominant_colors, image_size)
-        
-        # 9. CNN Analysis
-        cnn_analysis = perform_cnn_analysis(image_bytes, colors, dominant_colors)
+        results = run_analysis_stages(
+            analysis_stage_plan(sections, completed or ()), image_bytes, colors_data, options, timings, completed,
+            checkpoint, context
+        )
         
-        return {
-            "dominant_colors": dominant_colors,
-            "color_frequency": color_frequency,
-            "kmeans_analysis": kmeans_analysis,
-            "regional_analysis": regional_analysis,
-            "histograms": histograms,
-            "color_spaces": color_spaces,
-            "characteristics": characteristics,
-            "ai_training_data": ai_training_data,
-            "cnn_analysis": cnn_analysis,
-            "metadata": {
-                "timestamp": datetime.utcnow().isoformat() + "Z",
-                "version": "18.0.0-colorlab-enhanced",
-                "processing_time": "< 10 seconds",
-                "image_size_bytes": image_size,
-                "total_color_samples": len(colors),
-                "unique_colors_found": len(unique_colors),
-                "analysis_method": "enhanced_colorlab_analysis",
-                "improvements": ["accurate_color_names", "enhanced_regional_analysis"],
-                "color_database_size": len(COLOR_DATABASE)
-            }
+        analysis = {name: results[name] for name in sections}
+        analysis["metadata"] = {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "version": "18.0.0-colorlab-enhanced",
+            "engine_version": ANALYSIS_ENGINE_VERSION,
+            "processing_time": f"{total_wall_ms(timings) / 1000:.3f} seconds",
+            "stage_timings": timings,
+            "image_size_bytes": image_size,
+            "total_color_samples": colors_data['total_samples'],
+            "unique_colors_found": len(colors_data['unique_colors']),
+            "analyzed_dimensions": {"width": colors_data.get('width'), "height": colors_data.get('height')},
+            "streamed": bool(colors_data.get('streamed')),
+            "stage_workers": stage_workers_option(options),
+            "sections": sections,
+            "analysis_method": "enhanced_colorlab_analysis",
+            "improvements": ["accurate_color_names", "enhanced_regional_analysis"],
+            "color_database_size": len(COLOR_DATABASE)
         }
+        return analysis
         
     except Exception as e:
         print(f"❌ Enhanced analysis generation failed: {str(e)}")
         return {"error": f"Enhanced analysis generation failed: {str(e)}"}
 
-# Continue with remaining functions...
-# (Due to length limits, I'll create the remaining functions in the next part)
-
-print("🎨 ColorLab enhanced Lambda function loaded")
 
 # Part 2 of Enhanced Lambda Function
 
-def generate_enhanced_dominant_colors(colors, color_counter):
-    """Generate enhanced dominant colors with accurate names"""
+def generate_enhanced_dominant_colors(colors, color_counts, context=None):
+    """Generate enhanced dominant colors with accurate names
+    
+    The distinct colours are binned to DOMINANT_COLORS_BITS per channel and
+    clustered with weighted k-means; each colour's percentage and pixel_count
+    are the pixels assigned to its cluster.
+    """
     try:
         print("🎨 Generating enhanced dominant colors with accurate names...")
+        context = context or AnalysisContext.for_colors(colors, color_counts)
+        if not len(context.unique_colors):
+            return []
         
-        # Get most common colors
-        most_common = color_counter.most_common(15)
-        
-        # Apply K-Means++ for better clustering
-        if len(most_common) > 6:
-            clustered_colors = kmeans_plus_plus([color for color, _ in most_common], k=8)
-        else:
-            clustered_colors = [color for color, _ in most_common]
+        bins, bin_weights = color_bins(context.unique_colors, context.weights, DOMINANT_COLORS_BITS)
+        result = weighted_kmeans(bins, bin_weights, DOMINANT_COLORS_K, KMEANS_AUTO_ITERATIONS)
+        order = [int(i) for i in np.argsort(-result['cluster_weights'], kind='stable') if result['cluster_weights'][i] > 0]
+        clustered_colors = [tuple(int(round(c)) for c in result['centers'][i]) for i in order]
         
         dominant_colors = []
-        total_samples = len(colors)
+        total_samples = float(bin_weights.sum())
         
-        for i, color in enumerate(clustered_colors):
-            r, g, b = [int(c) for c in color]
+        for i, (cluster, color) in enumerate(zip(order, clustered_colors)):
+            r, g, b = color
+            pixel_count = int(round(result['cluster_weights'][cluster]))
             
             # Get accurate color name
-            accurate_name = get_accurate_color_name(r, g, b)
+            accurate_name = context.color_name(r, g, b)
             
             # Calculate quality metrics
             quality_score = calculate_quality_score(color, clustered_colors)
             
-            # Estimate percentage
-            percentage = max(1.0, (100 / len(clustered_colors)))
-            
             dominant_colors.append({
                 "rank": i + 1,
                 "hex": f"#{r:02x}{g:02x}{b:02x}",
                 "rgb": {"r": r, "g": g, "b": b},
                 "name": accurate_name,
-                "percentage": round(percentage, 2),
-                "pixel_count": max(1, total_samples // len(clustered_colors)),
+                "percentage": round(pixel_count / total_samples * 100, 2),
+                "pixel_count": pixel_count,
                 "quality_score": quality_score,
                 "luminance": calculate_luminance(r, g, b),
                 "saturation": calculate_saturation(r, g, b)
@@ -443,26 +3441,46 @@ def generate_enhanced_dominant_colors(colors, color_counter):
         print(f"❌ Enhanced dominant colors failed: {str(e)}")
         return []
 
-def analyze_enhanced_regional_analysis(image_bytes, colors):
-    """Enhanced regional analysis with better algorithms"""
+def analyze_enhanced_regional_analysis(image_bytes, colors, width=None, height=None, grid=None,
+                                       partials=None, layout=None, name_color=None):
+    """Enhanced regional analysis with better algorithms
+    
+    Pass partials and layout accumulated strip by strip (see
+    accumulate_regional_strip) to finalize without the pixel array.
+    name_color(r, g, b) names colours, e.g. a request's AnalysisContext.color_name.
+    """
     try:
         print("🗺️ Starting enhanced regional analysis...")
         
-        # Calculate image dimensions estimation
         total_bytes = len(image_bytes)
-        estimated_pixels = len(colors)
+        name_color = name_color or get_accurate_color_name
         
-        # Estimate image dimensions (assuming square-ish image)
-        estimated_width = int(math.sqrt(estimated_pixels))
-        estimated_height = estimated_pixels // estimated_width if estimated_width > 0 else 1
+        if partials is None:
+            estimated_pixels = len(as_pixel_array(colors))
+            if width and height:
+                # Decoded dimensions are known exactly
+                estimated_width, estimated_height = width, height
+            else:
+                # Estimate image dimensions (assuming square-ish image)
+                estimated_width = int(math.sqrt(estimated_pixels))
+                estimated_height = estimated_pixels // estimated_width if estimated_width > 0 else 1
+            
+            # The whole image is a single strip
+            image = as_pixel_array(colors)[:estimated_width * estimated_height].reshape(estimated_height, estimated_width, 3)
+            layout = regional_layout(estimated_width, estimated_height, grid)
+            partials = new_regional_partials(layout)
+            accumulate_regional_strip(partials, layout, image, 0)
+        else:
+            estimated_width, estimated_height = layout['width'], layout['height']
+            estimated_pixels = estimated_width * estimated_height
         
-        print(f"📐 Estimated dimensions: {estimated_width}x{estimated_height} ({estimated_pixels} pixels)")
+        print(f"📐 Analysis dimensions: {estimated_width}x{estimated_height} ({estimated_pixels} pixels)")
         
         # Enhanced 3x3 grid analysis
-        regions = analyze_3x3_grid_enhanced(colors, estimated_width, estimated_height)
+        regions = finalize_grid_regions(layout['grids']['3x3'], partials['grids']['3x3'], name_color)
         
         # Additional analysis: center vs edges
-        center_edge_analysis = analyze_center_vs_edges(colors, estimated_width, estimated_height)
+        center_edge_analysis = finalize_center_vs_edges(layout, partials['center_edge_counts'], name_color)
         
         # Color distribution analysis
         distribution_analysis = analyze_color_distribution(colors, regions)
@@ -470,7 +3488,7 @@ def analyze_enhanced_regional_analysis(image_bytes, colors):
         # Visual balance analysis
         balance_analysis = analyze_visual_balance(regions)
         
-        return {
+        result = {
             "regions": regions,
             "center_edge_analysis": center_edge_analysis,
             "distribution_analysis": distribution_analysis,
@@ -484,99 +3502,279 @@ def analyze_enhanced_regional_analysis(image_bytes, colors):
             "total_regions": len(regions)
         }
         
+        # Optional finer grid (e.g. 8x8 dashboard heatmaps) from the same strips
+        if 'custom' in layout['grids']:
+            spec = layout['grids']['custom']
+            result["grid_analysis"] = {
+                "rows": spec['rows'],
+                "cols": spec['cols'],
+                "regions": finalize_grid_regions(spec, partials['grids']['custom'], name_color)
+            }
+        
+        return result
+        
     except Exception as e:
         print(f"❌ Enhanced regional analysis failed: {str(e)}")
         return {"regions": [], "error": str(e)}
 
-def analyze_3x3_grid_enhanced(colors, width, height):
-    """Enhanced 3x3 grid analysis with better pixel mapping"""
-    regions = []
-    region_names = [
-        "Top-Left", "Top-Center", "Top-Right",
-        "Middle-Left", "Center", "Middle-Right", 
-        "Bottom-Left", "Bottom-Center", "Bottom-Right"
-    ]
+# ===== SUMMED-AREA TABLES =====
+
+def build_integral_images(image):
+    """Summed-area tables of R, G, B and saturation for an (H, W, 3) image, shaped (H+1, W+1, 4)"""
+    height, width = image.shape[:2]
+    integral = np.zeros((height + 1, width + 1, 4), dtype=np.float64)
+    
+    # Built in row blocks: each block's 2-D prefix sums plus the running totals of
+    # the row above, so temporaries stay block-sized
+    rows_per_block = max(1, STATS_CHUNK_PIXELS // max(width, 1))
+    for start in range(0, height, rows_per_block):
+        block = image[start:start + rows_per_block]
+        planes = np.empty(block.shape[:2] + (4,), dtype=np.float64)
+        planes[..., :3] = block
+        planes[..., 3] = calculate_saturation_array(block).reshape(block.shape[:2])
+        np.cumsum(planes, axis=1, out=planes)
+        np.cumsum(planes, axis=0, out=planes)
+        planes += integral[start, 1:]
+        integral[start + 1:start + 1 + len(block), 1:] = planes
+    return integral
+
+def integral_region_sums(integral, start_y, end_y, start_x, end_x):
+    """R, G, B and saturation sums over image[start_y:end_y, start_x:end_x] from four lookups"""
+    return (integral[end_y, end_x] - integral[start_y, end_x]
+            - integral[end_y, start_x] + integral[start_y, start_x])
+
+def region_statistics_from_sums(sums, pixel_count):
+    """compute_pixel_statistics-style summary from summed-area sums"""
+    return {
+        'count': pixel_count,
+        'channel_sum': [int(round(v)) for v in sums[:3]],
+        'saturation_sum': float(sums[3])
+    }
+
+# ===== REGIONAL PARTIALS =====
+
+REGION_NAMES_3X3 = [
+    "Top-Left", "Top-Center", "Top-Right",
+    "Middle-Left", "Center", "Middle-Right", 
+    "Bottom-Left", "Bottom-Center", "Bottom-Right"
+]
+
+def grid_boundaries(length, parts):
+    """Region start offsets for `parts` regions, the last one absorbing the remainder"""
+    size = length // parts
+    return [i * size for i in range(parts)] + [length]
+
+def grid_layout(width, height, rows, cols, region_names=None):
+    """Region rectangles of an rows x cols grid over a width x height image"""
+    return {
+        'rows': rows, 'cols': cols, 'names': region_names,
+        'y_bounds': grid_boundaries(height, rows), 'x_bounds': grid_boundaries(width, cols)
+    }
+
+def regional_layout(width, height, grid=None):
+    """Region sets analyzed for an image: the 3x3 grid, center vs edges and an optional custom grid"""
+    center_margin = min(width, height) // 4
+    layout = {
+        'width': width,
+        'height': height,
+        'grids': {'3x3': grid_layout(width, height, 3, 3, REGION_NAMES_3X3)},
+        # (start_y, end_y, start_x, end_x) of the center rectangle
+        'center': (center_margin, max(center_margin, height - center_margin),
+                   center_margin, max(center_margin, width - center_margin))
+    }
+    if grid:
+        layout['grids']['custom'] = grid_layout(width, height, int(grid[0]), int(grid[1]))
+    return layout
+
+def new_grid_partials(spec):
+    """Empty mergeable state for one grid: per-region sums and per-region colour counts"""
+    return {'sums': np.zeros((spec['rows'] * spec['cols'], 4)), 'counts': []}
+
+def new_regional_partials(layout):
+    """Empty mergeable state for every region set in a layout"""
+    return {
+        'grids': {name: new_grid_partials(spec) for name, spec in layout['grids'].items()},
+        'center_edge_counts': []
+    }
+
+def accumulate_grid_strip(grid_partials, spec, strip, start_y, integral, offset=None):
+    """Add an (h, W, 3) strip starting at image row start_y to one grid's partials"""
+    strip_height, width = strip.shape[:2]
+    end_y = start_y + strip_height
+    rows, cols = spec['rows'], spec['cols']
+    y_bounds, x_bounds = spec['y_bounds'], spec['x_bounds']
+    
+    # Summed-area sums of the part of each region inside this strip
+    for i in range(rows * cols):
+        row, col = divmod(i, cols)
+        region_start, region_end = max(y_bounds[row], start_y), min(y_bounds[row + 1], end_y)
+        if region_start < region_end and x_bounds[col] < x_bounds[col + 1]:
+            grid_partials['sums'][i] += integral_region_sums(
+                integral, region_start - start_y, region_end - start_y, x_bounds[col], x_bounds[col + 1]
+            )
+    
+    # Region label for every pixel, then per-region colour counts in one pass
+    row_of_y = np.searchsorted(y_bounds[1:rows], np.arange(start_y, end_y), side='right').astype(np.int16)
+    col_of_x = np.searchsorted(x_bounds[1:cols], np.arange(width), side='right').astype(np.int16)
+    labels = row_of_y[:, None] * np.int16(cols) + col_of_x[None, :]
+    offset = start_y * width if offset is None else offset
+    append_color_counts(grid_partials['counts'], count_colors(strip, labels.reshape(-1), offset))
+
+def accumulate_center_edge_strip(center_edge_counts, layout, strip, start_y, offset=None):
+    """Add a strip's colour counts, labelled 0 = center and 1 = edge"""
+    strip_height, width = strip.shape[:2]
+    center_start_y, center_end_y, center_start_x, center_end_x = layout['center']
     
-    # Calculate region boundaries
-    region_width = width // 3
-    region_height = height // 3
-    
-    for i, region_name in enumerate(region_names):
-        # Calculate region coordinates
-        row = i // 3
-        col = i % 3
-        
-        start_x = col * region_width
-        end_x = (col + 1) * region_width if col < 2 else width
-        start_y = row * region_height
-        end_y = (row + 1) * region_height if row < 2 else height
-        
-        # Extract colors from this region
-        region_colors = []
-        for y in range(start_y, min(end_y, height)):
-            for x in range(start_x, min(end_x, width)):
-                pixel_index = y * width + x
-                if pixel_index < len(colors):
-                    region_colors.append(colors[pixel_index])
-        
-        if region_colors:
-            # Analyze region colors
-            region_analysis = analyze_region_colors(region_colors, region_name)
-            regions.append(region_analysis)
+    labels = np.ones((strip_height, width), dtype=np.int8)
+    top = min(max(center_start_y - start_y, 0), strip_height)
+    bottom = min(max(center_end_y - start_y, 0), strip_height)
+    labels[top:bottom, center_start_x:center_end_x] = 0
+    offset = start_y * width if offset is None else offset
+    append_color_counts(center_edge_counts, count_colors(strip, labels.reshape(-1), offset))
+
+def accumulate_regional_strip(partials, layout, strip, start_y, integral=None, offset=None):
+    """Add an (h, W, 3) strip starting at image row start_y to the regional partials
+    
+    offset is the strip's first pixel index, as for accumulate_analysis_strip.
+    """
+    if integral is None:
+        integral = build_integral_images(strip)
+    for name, spec in layout['grids'].items():
+        accumulate_grid_strip(partials['grids'][name], spec, strip, start_y, integral, offset)
+    accumulate_center_edge_strip(partials['center_edge_counts'], layout, strip, start_y, offset)
+
+def top_colors_by_group(color_counts, group_count, top_n=5):
+    """Most common colours and distinct colour count per group of a grouped count_colors table
+    
+    Ties are broken by first occurrence in row-major order, matching Counter
+    over each group's pixels.
+    """
+    unique_keys, first_index, counts = color_counts['codes'], color_counts['first_index'], color_counts['counts']
+    boundaries = np.searchsorted(unique_keys >> 24, np.arange(group_count + 1))
+    
+    results = []
+    for group in range(group_count):
+        lo, hi = boundaries[group], boundaries[group + 1]
+        order = top_count_order(counts[lo:hi], first_index[lo:hi], top_n) + lo
+        colors = unpack_rgb(unique_keys[order] & 0xFFFFFF)
+        top = [(tuple(int(v) for v in rgb), int(count)) for rgb, count in zip(colors, counts[order])]
+        results.append((top, int(hi - lo)))
+    return results
+
+def finalize_grid_regions(spec, grid_partials, name_color=get_accurate_color_name):
+    """Region reports for one grid from its accumulated partials"""
+    rows, cols = spec['rows'], spec['cols']
+    y_bounds, x_bounds = spec['y_bounds'], spec['x_bounds']
+    top_colors = top_colors_by_group(merge_color_counts(grid_partials['counts']), rows * cols)
+    
+    regions = []
+    for i in range(rows * cols):
+        row, col = divmod(i, cols)
+        region_name = spec['names'][i] if spec['names'] else f"R{row + 1}C{col + 1}"
+        pixel_count = (y_bounds[row + 1] - y_bounds[row]) * (x_bounds[col + 1] - x_bounds[col])
+        
+        if pixel_count > 0:
+            most_common, unique_colors = top_colors[i]
+            regions.append(summarize_region(
+                region_name, region_statistics_from_sums(grid_partials['sums'][i], pixel_count),
+                most_common, unique_colors, name_color
+            ))
         else:
-            # Fallback for empty regions
+            # Empty regions (grids finer than the image) keep the report schema, with neutral gray values
+            gray = {"hex": "#808080", "rgb": {"r": 128, "g": 128, "b": 128}, "name": "Gray"}
             regions.append({
                 "region": region_name,
-                "dominant_color": {
-                    "hex": "#808080", 
-                    "rgb": {"r": 128, "g": 128, "b": 128},
-                    "name": "Gray"
+                "dominant_color": dict(gray, percentage=0),
+                "average_color": gray,
+                "statistics": {
+                    "pixel_count": 0,
+                    "unique_colors": 0,
+                    "color_diversity": 0,
+                    "brightness": 0.5,
+                    "saturation": 0.5
                 },
-                "color_count": 0,
-                "brightness": 0.5,
-                "saturation": 0.5,
-                "pixel_count": 0
+                "top_colors": []
             })
     
     return regions
 
+def finalize_center_vs_edges(layout, center_edge_counts, name_color=get_accurate_color_name):
+    """Center vs edge report from accumulated colour counts"""
+    center_start_y, center_end_y, center_start_x, center_end_x = layout['center']
+    (center_top, center_unique), (edge_top, edge_unique) = top_colors_by_group(
+        merge_color_counts(center_edge_counts), 2, top_n=1
+    )
+    
+    center_pixels = (center_end_y - center_start_y) * (center_end_x - center_start_x)
+    edge_pixels = layout['width'] * layout['height'] - center_pixels
+    
+    def group_analysis(top, pixel_count, unique_colors):
+        if pixel_count == 0:
+            return {}
+        (r, g, b), count = top[0]
+        return {
+            "dominant_color": {
+                "hex": f"#{r:02x}{g:02x}{b:02x}",
+                "name": name_color(r, g, b),
+                "count": count
+            },
+            "pixel_count": pixel_count,
+            "unique_colors": unique_colors
+        }
+    
+    # Analyze center and edge colors
+    center_analysis = group_analysis(center_top, center_pixels, center_unique)
+    edge_analysis = group_analysis(edge_top, edge_pixels, edge_unique)
+    
+    return {
+        "center": center_analysis,
+        "edges": edge_analysis,
+        "center_edge_contrast": calculate_color_contrast(
+            center_analysis.get("dominant_color", {}).get("hex", "#808080"),
+            edge_analysis.get("dominant_color", {}).get("hex", "#808080")
+        )
+    }
+
+def analyze_grid_regions(image, rows, cols, integral=None, region_names=None):
+    """Analyze an rows x cols grid of regions using summed-area tables"""
+    height, width = image.shape[:2]
+    if integral is None:
+        integral = build_integral_images(image)
+    spec = grid_layout(width, height, rows, cols, region_names)
+    grid_partials = new_grid_partials(spec)
+    accumulate_grid_strip(grid_partials, spec, image, 0, integral)
+    return finalize_grid_regions(spec, grid_partials)
+
+def analyze_3x3_grid_enhanced(colors, width, height, integral=None):
+    """Enhanced 3x3 grid analysis with better pixel mapping"""
+    image = as_pixel_array(colors)[:width * height].reshape(height, width, 3)
+    return analyze_grid_regions(image, 3, 3, integral, REGION_NAMES_3X3)
+
 def analyze_region_colors(region_colors, region_name):
     """Analyze colors within a specific region"""
-    # Count color frequencies
-    color_counter = Counter(region_colors)
-    most_common = color_counter.most_common(5)
+    pixels = as_pixel_array(region_colors)
+    most_common, unique_colors = most_common_colors(pixels, 5)
+    return summarize_region(region_name, compute_pixel_statistics(pixels), most_common, unique_colors)
+
+def summarize_region(region_name, stats, most_common, unique_colors, name_color=get_accurate_color_name):
+    """Build a region report from its statistics and most common colours"""
+    pixel_count = stats['count']
     
     # Get dominant color
     dominant = most_common[0] if most_common else ((128, 128, 128), 1)
     dominant_rgb = dominant[0]
     
     # Calculate region statistics
-    avg_r = sum(c[0] for c in region_colors) / len(region_colors)
-    avg_g = sum(c[1] for c in region_colors) / len(region_colors)
-    avg_b = sum(c[2] for c in region_colors) / len(region_colors)
-    
-    # Calculate brightness and saturation
-    brightness_values = [(r + g + b) / (3 * 255) for r, g, b in region_colors]
-    avg_brightness = sum(brightness_values) / len(brightness_values)
-    
-    saturation_values = []
-    for r, g, b in region_colors:
-        max_val = max(r, g, b)
-        min_val = min(r, g, b)
-        if max_val > 0:
-            saturation_values.append((max_val - min_val) / max_val)
-        else:
-            saturation_values.append(0)
-    
-    avg_saturation = sum(saturation_values) / len(saturation_values) if saturation_values else 0
+    avg_r, avg_g, avg_b = channel_means(stats)
+    avg_brightness = mean_brightness(stats)
+    avg_saturation = mean_saturation(stats) if pixel_count else 0
     
     # Color diversity in region
-    unique_colors = len(set(region_colors))
-    color_diversity = unique_colors / len(region_colors) if region_colors else 0
+    color_diversity = unique_colors / pixel_count if pixel_count else 0
     
     # Get accurate color names
-    dominant_name = get_accurate_color_name(int(dominant_rgb[0]), int(dominant_rgb[1]), int(dominant_rgb[2]))
-    average_name = get_accurate_color_name(int(avg_r), int(avg_g), int(avg_b))
+    dominant_name = name_color(int(dominant_rgb[0]), int(dominant_rgb[1]), int(dominant_rgb[2]))
+    average_name = name_color(int(avg_r), int(avg_g), int(avg_b))
     
     return {
         "region": region_name,
@@ -584,7 +3782,7 @@ def analyze_region_colors(region_colors, region_name):
             "hex": f"#{int(dominant_rgb[0]):02x}{int(dominant_rgb[1]):02x}{int(dominant_rgb[2]):02x}",
             "rgb": {"r": int(dominant_rgb[0]), "g": int(dominant_rgb[1]), "b": int(dominant_rgb[2])},
             "name": dominant_name,
-            "percentage": round((dominant[1] / len(region_colors)) * 100, 2)
+            "percentage": round((dominant[1] / pixel_count) * 100, 2)
         },
         "average_color": {
             "hex": f"#{int(avg_r):02x}{int(avg_g):02x}{int(avg_b):02x}",
@@ -592,7 +3790,7 @@ def analyze_region_colors(region_colors, region_name):
             "name": average_name
         },
         "statistics": {
-            "pixel_count": len(region_colors),
+            "pixel_count": pixel_count,
             "unique_colors": unique_colors,
             "color_diversity": round(color_diversity, 3),
             "brightness": round(avg_brightness, 3),
@@ -602,9 +3800,9 @@ def analyze_region_colors(region_colors, region_name):
             {
                 "hex": f"#{color[0]:02x}{color[1]:02x}{color[2]:02x}",
                 "rgb": {"r": color[0], "g": color[1], "b": color[2]},
-                "name": get_accurate_color_name(color[0], color[1], color[2]),
+                "name": name_color(color[0], color[1], color[2]),
                 "count": count,
-                "percentage": round((count / len(region_colors)) * 100, 2)
+                "percentage": round((count / pixel_count) * 100, 2)
             }
             for color, count in most_common[:3]
         ]
@@ -612,60 +3810,11 @@ def analyze_region_colors(region_colors, region_name):
 
 def analyze_center_vs_edges(colors, width, height):
     """Analyze center vs edge color distribution"""
-    center_colors = []
-    edge_colors = []
-    
-    center_margin = min(width, height) // 4
-    
-    for y in range(height):
-        for x in range(width):
-            pixel_index = y * width + x
-            if pixel_index < len(colors):
-                # Check if pixel is in center or edge
-                if (center_margin <= x < width - center_margin and 
-                    center_margin <= y < height - center_margin):
-                    center_colors.append(colors[pixel_index])
-                else:
-                    edge_colors.append(colors[pixel_index])
-    
-    # Analyze center colors
-    center_analysis = {}
-    if center_colors:
-        center_counter = Counter(center_colors)
-        center_dominant = center_counter.most_common(1)[0]
-        center_analysis = {
-            "dominant_color": {
-                "hex": f"#{center_dominant[0][0]:02x}{center_dominant[0][1]:02x}{center_dominant[0][2]:02x}",
-                "name": get_accurate_color_name(center_dominant[0][0], center_dominant[0][1], center_dominant[0][2]),
-                "count": center_dominant[1]
-            },
-            "pixel_count": len(center_colors),
-            "unique_colors": len(set(center_colors))
-        }
-    
-    # Analyze edge colors
-    edge_analysis = {}
-    if edge_colors:
-        edge_counter = Counter(edge_colors)
-        edge_dominant = edge_counter.most_common(1)[0]
-        edge_analysis = {
-            "dominant_color": {
-                "hex": f"#{edge_dominant[0][0]:02x}{edge_dominant[0][1]:02x}{edge_dominant[0][2]:02x}",
-                "name": get_accurate_color_name(edge_dominant[0][0], edge_dominant[0][1], edge_dominant[0][2]),
-                "count": edge_dominant[1]
-            },
-            "pixel_count": len(edge_colors),
-            "unique_colors": len(set(edge_colors))
-        }
-    
-    return {
-        "center": center_analysis,
-        "edges": edge_analysis,
-        "center_edge_contrast": calculate_color_contrast(
-            center_analysis.get("dominant_color", {}).get("hex", "#808080"),
-            edge_analysis.get("dominant_color", {}).get("hex", "#808080")
-        )
-    }
+    image = as_pixel_array(colors)[:width * height].reshape(height, width, 3)
+    layout = regional_layout(width, height)
+    center_edge_counts = []
+    accumulate_center_edge_strip(center_edge_counts, layout, image, 0)
+    return finalize_center_vs_edges(layout, center_edge_counts)
 
 def analyze_color_distribution(colors, regions):
     """Analyze overall color distribution across regions"""
@@ -764,26 +3913,11 @@ def kmeans_plus_plus(colors, k=6, max_iterations=20):
         if len(colors) <= k:
             return colors
         
-        # K-Means++ initialization
-        centers = []
-        centers.append(random.choice(colors))
+        points = as_pixel_array(colors).astype(np.float64)
+        rng = np.random.default_rng(KMEANS_SEED)
+        seeds = weighted_kmeans_plus_plus(points, np.ones(len(points)), k, rng, return_indices=True)
         
-        # Choose remaining centers
-        for _ in range(k - 1):
-            distances = []
-            for color in colors:
-                min_dist = min(euclidean_distance(color, center) for center in centers)
-                distances.append(min_dist ** 2)
-            
-            # Weighted random selection
-            total_dist = sum(distances)
-            if total_dist == 0:
-                centers.append(random.choice(colors))
-            else:
-                probabilities = [d / total_dist for d in distances]
-                centers.append(weighted_random_choice(colors, probabilities))
-        
-        return centers
+        return [colors[i] for i in seeds]
         
     except Exception as e:
         print(f"❌ K-Means++ failed: {str(e)}")
@@ -793,17 +3927,6 @@ def euclidean_distance(color1, color2):
     """Calculate Euclidean distance between two colors"""
     return math.sqrt(sum((a - b) ** 2 for a, b in zip(color1, color2)))
 
-def weighted_random_choice(items, weights):
-    """Choose item based on weights"""
-    total = sum(weights)
-    r = random.uniform(0, total)
-    cumulative = 0
-    for item, weight in zip(items, weights):
-        cumulative += weight
-        if r <= cumulative:
-            return item
-    return items[-1]
-
 def calculate_quality_score(color, all_colors):
     """Calculate quality score for color clustering"""
     if len(all_colors) <= 1:
@@ -830,122 +3953,590 @@ def calculate_saturation(r, g, b):
     
     return (max_val - min_val) / max_val
 
-print("🎨 ColorLab enhanced functions part 2 loaded")
+# ===== VECTORIZED PIXEL STATISTICS =====
+
+def as_pixel_array(colors):
+    """View colors (RGB tuples or a pixel array) as an (N, 3) uint8 array"""
+    if isinstance(colors, np.ndarray):
+        return colors.reshape(-1, 3)
+    if not colors:
+        return np.zeros((0, 3), dtype=np.uint8)
+    return np.asarray(colors, dtype=np.uint8).reshape(-1, 3)
+
+def pack_rgb(pixels):
+    """Pack (N, 3) uint8 pixels into 24-bit 0xRRGGBB uint32 codes"""
+    pixels = as_pixel_array(pixels)
+    # Built in place in a single uint32 buffer
+    codes = pixels[:, 0].astype(np.uint32)
+    codes <<= 8
+    codes |= pixels[:, 1]
+    codes <<= 8
+    codes |= pixels[:, 2]
+    return codes
+
+def unpack_rgb(codes):
+    """Unpack 0xRRGGBB codes into an (N, 3) uint8 array"""
+    codes = np.asarray(codes, dtype=np.uint32)
+    return np.stack([(codes >> 16) & 0xFF, (codes >> 8) & 0xFF, codes & 0xFF], axis=-1).astype(np.uint8)
+
+def calculate_luminance_array(pixels):
+    """Vectorized calculate_luminance over (N, 3) pixels"""
+    pixels = as_pixel_array(pixels)
+    return (
+        0.299 * (pixels[:, 0] / 255.0)
+        + 0.587 * (pixels[:, 1] / 255.0)
+        + 0.114 * (pixels[:, 2] / 255.0)
+    )
+
+def calculate_saturation_array(pixels):
+    """Vectorized calculate_saturation over (N, 3) pixels"""
+    pixels = as_pixel_array(pixels)
+    max_val = pixels.max(axis=1).astype(np.float64)
+    min_val = pixels.min(axis=1)
+    return np.divide(max_val - min_val, max_val, out=np.zeros_like(max_val), where=max_val > 0)
+
+# Pixels processed per block by the statistics engine, bounding temporary arrays
+STATS_CHUNK_PIXELS = 1 << 20
+
+def compute_pixel_statistics(pixels):
+    """Compute per-pixel colour statistics for an (N, 3) uint8 array in a few array passes
+    
+    Only sums, counts and extrema are returned; averages are derived from them,
+    and luminance and brightness are linear in the channels so their means
+    follow from the channel sums.
+    """
+    pixels = as_pixel_array(pixels)
+    stats = {
+        'count': 0, 'channel_sum': [0, 0, 0], 'channel_min': [0, 0, 0], 'channel_max': [255, 255, 255],
+        'warm_count': 0, 'saturation_sum': 0.0
+    }
+    
+    for start in range(0, len(pixels), STATS_CHUNK_PIXELS):
+        block = pixels[start:start + STATS_CHUNK_PIXELS]
+        wide = block.astype(np.int16)
+        # (r + g/2) - b > 0, kept in integers
+        warm_count = int(np.count_nonzero(2 * wide[:, 0] + wide[:, 1] - 2 * wide[:, 2] > 0))
+        
+        stats = merge_pixel_statistics(stats, {
+            'count': len(block),
+            'channel_sum': [int(v) for v in block.sum(axis=0, dtype=np.uint64)],
+            'channel_min': [int(v) for v in block.min(axis=0)],
+            'channel_max': [int(v) for v in block.max(axis=0)],
+            'warm_count': warm_count,
+            'saturation_sum': float(calculate_saturation_array(block).sum())
+        })
+    
+    return stats
+
+def merge_pixel_statistics(a, b):
+    """Combine compute_pixel_statistics results of two disjoint pixel sets"""
+    if a['count'] == 0:
+        return b
+    if b['count'] == 0:
+        return a
+    return {
+        'count': a['count'] + b['count'],
+        'channel_sum': [x + y for x, y in zip(a['channel_sum'], b['channel_sum'])],
+        'channel_min': [min(x, y) for x, y in zip(a['channel_min'], b['channel_min'])],
+        'channel_max': [max(x, y) for x, y in zip(a['channel_max'], b['channel_max'])],
+        'warm_count': a['warm_count'] + b['warm_count'],
+        'saturation_sum': a['saturation_sum'] + b['saturation_sum']
+    }
+
+def channel_means(stats):
+    """Mean R, G, B from compute_pixel_statistics output"""
+    count = stats['count']
+    return [s / count for s in stats['channel_sum']] if count else [128.0, 128.0, 128.0]
+
+def mean_luminance(stats):
+    """Mean calculate_luminance from compute_pixel_statistics output"""
+    avg_r, avg_g, avg_b = channel_means(stats)
+    return calculate_luminance(avg_r, avg_g, avg_b)
+
+def mean_brightness(stats):
+    """Mean (r + g + b) / (3 * 255) from compute_pixel_statistics output"""
+    return sum(channel_means(stats)) / (3 * 255)
+
+def mean_saturation(stats):
+    """Mean calculate_saturation from compute_pixel_statistics output"""
+    return stats['saturation_sum'] / stats['count'] if stats['count'] else 0.5
+
+def count_colors(pixels, groups=None, offset=0):
+    """Distinct packed colours of (N, 3) pixels with their counts and first occurrence
+    
+    With an (N,) array of group labels the codes become (label << 24) | colour,
+    so colours are counted per group. Pixels are counted block by block and
+    the partial tables merged, keeping temporaries bounded. offset is the
+    index of the first pixel within the whole image, for strip-wise counting.
+    """
+    pixels = as_pixel_array(pixels)
+    partials = []
+    for start in range(0, max(len(pixels), 1), STATS_CHUNK_PIXELS):
+        codes = pack_rgb(pixels[start:start + STATS_CHUNK_PIXELS])
+        if groups is not None:
+            keys = groups[start:start + STATS_CHUNK_PIXELS].astype(np.int64)
+            keys <<= 24
+            keys |= codes
+            codes = keys
+        codes, first_index, counts = np.unique(codes, return_index=True, return_counts=True)
+        partials.append({'codes': codes, 'counts': counts, 'first_index': first_index + (offset + start)})
+    return merge_color_counts(partials)
+
+def merge_color_counts(partials):
+    """Merge count_colors tables from consecutive pixel blocks into one"""
+    if len(partials) == 1:
+        return partials[0]
+    codes, index, inverse = np.unique(
+        np.concatenate([p['codes'] for p in partials]), return_index=True, return_inverse=True
+    )
+    counts = np.bincount(inverse, weights=np.concatenate([p['counts'] for p in partials]))
+    # Blocks are in pixel order, so the first block holding a colour has its first occurrence
+    first_index = np.concatenate([p['first_index'] for p in partials])[index]
+    return {'codes': codes, 'counts': counts.astype(np.int64), 'first_index': first_index}
+
+# Pending partial count tables are merged once they hold this many entries
+COUNT_MERGE_ENTRIES = 1 << 21
+
+def append_color_counts(pending, color_counts):
+    """Queue a strip's count table, merging the queue when it grows past COUNT_MERGE_ENTRIES
+    
+    Once the merged table itself is that large, the queue is merged when the
+    entries queued after it outgrow it, so each entry is re-merged a bounded
+    number of times however many strips (or frames) follow.
+    """
+    pending.append(color_counts)
+    queued = sum(len(p['codes']) for p in pending[1:])
+    if len(pending) > 1 and len(pending[0]['codes']) + queued > COUNT_MERGE_ENTRIES and \
+            queued >= min(len(pending[0]['codes']), COUNT_MERGE_ENTRIES):
+        pending[:] = [merge_color_counts(pending)]
+
+def top_count_order(counts, first_index, n=None):
+    """Indices of the n largest counts, largest first and ties broken by smaller first_index
+    
+    Uses partial selection: the n-th largest count is found with
+    np.partition and only the entries above it, plus the earliest of those
+    tied with it, are sorted. Without n every entry is sorted.
+    """
+    size = len(counts)
+    if n is None or n >= size:
+        return np.lexsort((first_index, -counts))
+    if n <= 0:
+        return np.zeros(0, dtype=np.intp)
+    threshold = np.partition(counts, size - n)[size - n]
+    above = np.flatnonzero(counts > threshold)
+    tied = np.flatnonzero(counts == threshold)
+    needed = n - len(above)
+    if needed < len(tied):
+        tied = tied[np.argpartition(first_index[tied], needed - 1)[:needed]]
+    candidates = np.concatenate([above, tied])
+    return candidates[np.lexsort((first_index[candidates], -counts[candidates]))]
+
+def most_common_from_counts(color_counts, n=None, order=None):
+    """Counter.most_common equivalent over count_colors output, ties broken by first occurrence
+    
+    order is a precomputed top_count_order covering at least n entries.
+    """
+    if order is None:
+        order = top_count_order(color_counts['counts'], color_counts['first_index'], n)
+    if n is not None:
+        order = order[:n]
+    return [(tuple(int(v) for v in rgb), int(count))
+            for rgb, count in zip(unpack_rgb(color_counts['codes'][order]), color_counts['counts'][order])]
+
+def most_common_colors(pixels, n=None):
+    """Most common colours of (N, 3) pixels plus the distinct colour count"""
+    color_counts = count_colors(pixels)
+    return most_common_from_counts(color_counts, n), len(color_counts['codes'])
+
+# ===== WEIGHTED K-MEANS =====
+
+# Fixed seed so clustering (and anything cached from it) is reproducible
+KMEANS_SEED = int(os.environ.get('COLORLAB_KMEANS_SEED', '42'))
+KMEANS_MAX_ITERATIONS = 300
+KMEANS_TOLERANCE = 1e-4
+# Above this many distinct colours Lloyd iterations run on a weighted sample
+KMEANS_MAX_POINTS = 20000
+
+def squared_distances(points, centers):
+    """Squared Euclidean distances between (N, D) points and (K, D) centers as an (N, K) array"""
+    d2 = (
+        (points ** 2).sum(axis=1)[:, None]
+        - 2 * points @ centers.T
+        + (centers ** 2).sum(axis=1)[None, :]
+    )
+    return np.maximum(d2, 0)
+
+def weighted_kmeans_plus_plus(points, weights, k, rng, return_indices=False):
+    """K-Means++ seeding over weighted points in O(N * k) array operations"""
+    n = len(points)
+    probabilities = weights / weights.sum()
+    indices = [int(rng.choice(n, p=probabilities))]
+    closest_d2 = ((points - points[indices[0]]) ** 2).sum(axis=1)
+    
+    for _ in range(k - 1):
+        potential = weights * closest_d2
+        total = potential.sum()
+        if total > 0:
+            index = int(rng.choice(n, p=potential / total))
+        else:
+            index = int(rng.choice(n, p=probabilities))
+        indices.append(index)
+        closest_d2 = np.minimum(closest_d2, ((points - points[index]) ** 2).sum(axis=1))
+    
+    return indices if return_indices else points[indices].copy()
+
+def weighted_kmeans(points, weights, k, max_iterations=KMEANS_MAX_ITERATIONS,
+                    tolerance=KMEANS_TOLERANCE, seed=KMEANS_SEED, initial_centers=None):
+    """Weighted Lloyd k-means over (N, 3) points such as unique colours with pixel counts
+    
+    Returns centers, per-point labels, per-cluster weights, inertia and iteration
+    count. Large inputs are clustered on a weighted sample (mini-batch style)
+    and then assigned in one final full pass.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    k = min(k, len(points))
+    rng = np.random.default_rng(seed)
+    
+    if len(points) > KMEANS_MAX_POINTS:
+        sample = rng.choice(len(points), KMEANS_MAX_POINTS, p=weights / weights.sum())
+        fit_points, fit_weights = np.unique(sample, return_counts=True)
+        fit_points, fit_weights = points[fit_points], fit_weights.astype(np.float64)
+    else:
+        fit_points, fit_weights = points, weights
+    
+    if initial_centers is None:
+        centers = weighted_kmeans_plus_plus(fit_points, fit_weights, k, rng)
+    else:
+        centers = np.asarray(initial_centers, dtype=np.float64)[:k].copy()
+    
+    iterations = 0
+    converged = False
+    for iterations in range(1, max_iterations + 1):
+        labels = squared_distances(fit_points, centers).argmin(axis=1)
+        cluster_weights = np.bincount(labels, weights=fit_weights, minlength=k)
+        sums = np.stack([
+            np.bincount(labels, weights=fit_weights * fit_points[:, c], minlength=k) for c in range(3)
+        ], axis=1)
+        # Empty clusters keep their previous center
+        new_centers = np.where(
+            cluster_weights[:, None] > 0, sums / np.maximum(cluster_weights, 1e-12)[:, None], centers
+        )
+        shift = ((new_centers - centers) ** 2).sum(axis=1).max()
+        centers = new_centers
+        if shift <= tolerance:
+            converged = True
+            break
+    
+    # Final full assignment, in blocks to bound the distance matrix
+    labels = np.empty(len(points), dtype=np.intp)
+    inertia = 0.0
+    for start in range(0, len(points), STATS_CHUNK_PIXELS):
+        d2 = squared_distances(points[start:start + STATS_CHUNK_PIXELS], centers)
+        block_labels = d2.argmin(axis=1)
+        labels[start:start + len(block_labels)] = block_labels
+        inertia += float((d2[np.arange(len(block_labels)), block_labels] * weights[start:start + len(block_labels)]).sum())
+    
+    return {
+        'centers': centers,
+        'labels': labels,
+        'cluster_weights': np.bincount(labels, weights=weights, minlength=k),
+        'inertia': inertia,
+        'iterations': iterations,
+        'converged': converged
+    }
+
+# Clusters when the request does not set options.clusters: a number, or "auto"
+KMEANS_DEFAULT_CLUSTERS = os.environ.get('COLORLAB_KMEANS_CLUSTERS', '6')
+# Candidate cluster counts for automatic selection
+KMEANS_AUTO_K_RANGE = (5, 10)
+# Lloyd iterations per candidate k (warm-started, so few are needed)
+KMEANS_AUTO_ITERATIONS = 30
+# Bits per channel of the bins candidates are fitted on
+KMEANS_AUTO_BITS = 5
+# Dominant colours: clusters, and bits per channel of the RGB bins they are fitted on
+DOMINANT_COLORS_K = 8
+DOMINANT_COLORS_BITS = 4
+# Weighted points the silhouette is estimated on (pairwise cost grows with its square)
+KMEANS_SILHOUETTE_SAMPLE = 800
+
+def kmeans_clusters_option(options):
+    """Requested cluster count (int) or "auto" from options.clusters"""
+    value = (options or {}).get('clusters', KMEANS_DEFAULT_CLUSTERS)
+    if isinstance(value, str) and value.strip().lower() == 'auto':
+        return 'auto'
+    k = int(value)
+    if k < 1:
+        raise ValueError("clusters must be a positive number or \"auto\"")
+    return k
+
+def color_bins(points, weights, bits=KMEANS_AUTO_BITS):
+    """Weighted mean colour and total weight of each occupied (2**bits)**3 RGB bin"""
+    points = np.asarray(points)
+    shift = 8 - bits
+    cells = ((points[:, 0].astype(np.intp) >> shift) << (2 * bits)) | \
+            ((points[:, 1].astype(np.intp) >> shift) << bits) | (points[:, 2].astype(np.intp) >> shift)
+    cells, index = np.unique(cells, return_inverse=True)
+    bin_weights = np.bincount(index, weights=weights)
+    sums = np.stack([np.bincount(index, weights=weights * points[:, c]) for c in range(3)], axis=1)
+    return sums / bin_weights[:, None], bin_weights
+
+def weighted_sample(points, weights, size, rng):
+    """Up to size points drawn with probability proportional to weight, as (points, multiplicities)"""
+    if len(points) <= size:
+        return points, weights
+    draws = rng.choice(len(points), size, p=weights / weights.sum())
+    chosen, multiplicity = np.unique(draws, return_counts=True)
+    return points[chosen], multiplicity.astype(np.float64)
+
+def weighted_silhouette(points, weights, labels, k):
+    """Mean silhouette of weighted points (weights act as multiplicities), vectorized over the pairwise distances"""
+    distances = np.sqrt(squared_distances(points, points))
+    membership = np.zeros((len(points), k))
+    membership[np.arange(len(points)), labels] = weights
+    cluster_weights = membership.sum(axis=0)
+    # Weighted distance sums from every point to every cluster
+    sums = distances @ membership
+    
+    own = cluster_weights[labels] - 1
+    a = np.divide(sums[np.arange(len(points)), labels], own, out=np.zeros(len(points)), where=own > 0)
+    others = np.where(cluster_weights > 0, sums / np.maximum(cluster_weights, 1e-12), np.inf)
+    others[np.arange(len(points)), labels] = np.inf
+    b = others.min(axis=1)
+    
+    denominator = np.maximum(a, b)
+    scores = np.divide(b - a, denominator, out=np.zeros(len(points)), where=(own > 0) & np.isfinite(b) & (denominator > 0))
+    return float(np.average(scores, weights=weights))
+
+def elbow_k(candidates):
+    """k at the knee of the inertia curve: farthest point below the line joining its ends"""
+    if len(candidates) < 3:
+        return candidates[-1]['k'] if candidates else None
+    ks = np.array([c['k'] for c in candidates], dtype=np.float64)
+    inertia = np.array([c['inertia'] for c in candidates])
+    x = (ks - ks[0]) / (ks[-1] - ks[0])
+    span = inertia[0] - inertia[-1]
+    y = (inertia - inertia[-1]) / span if span > 0 else np.zeros_like(inertia)
+    return int(ks[np.argmax((1 - x) - y)])
+
+def clustering_quality(silhouette):
+    """Verbal rating of a silhouette score (Kaufman & Rousseeuw)"""
+    if silhouette > 0.7:
+        return "Excellent"
+    if silhouette > 0.5:
+        return "Good"
+    if silhouette > 0.25:
+        return "Fair"
+    return "Weak"
+
+def select_kmeans_k(points, weights, k_range=KMEANS_AUTO_K_RANGE, seed=KMEANS_SEED):
+    """Pick k for weighted points by sampled silhouette, recording inertia for the elbow
+    
+    Candidates are fitted on weighted colour bins rather than every distinct
+    colour, each k starting from the previous k's centers plus the bin that
+    adds the most inertia. One weighted sample of the bins scores all
+    candidates. Work is bounded by the bin count, the candidate range,
+    KMEANS_AUTO_ITERATIONS and KMEANS_SILHOUETTE_SAMPLE rather than by a time
+    limit, so the same input always selects the same k.
+    Returns the selection summary and the winning centers.
+    """
+    rng = np.random.default_rng(seed)
+    bins, bin_weights = color_bins(points, np.asarray(weights, dtype=np.float64))
+    sample, sample_weights = weighted_sample(bins, bin_weights, KMEANS_SILHOUETTE_SAMPLE, rng)
+    low, high = k_range[0], min(k_range[1], len(bins))
+    
+    candidates, centers, best = [], None, None
+    for k in range(min(low, high), high + 1):
+        if centers is None:
+            initial = weighted_kmeans_plus_plus(bins, bin_weights, k, rng)
+        else:
+            # Warm start: previous centers plus the bin contributing the most inertia
+            d2 = squared_distances(bins, centers).min(axis=1)
+            initial = np.vstack([centers, bins[np.argmax(d2 * bin_weights)]])
+        fit = weighted_kmeans(bins, bin_weights, k, max_iterations=KMEANS_AUTO_ITERATIONS, initial_centers=initial)
+        centers = fit['centers']
+        labels = squared_distances(sample, centers).argmin(axis=1)
+        candidate = {'k': k, 'inertia': round(fit['inertia'], 2),
+                     'silhouette': round(weighted_silhouette(sample, sample_weights, labels, k), 4)}
+        candidates.append(candidate)
+        if best is None or candidate['silhouette'] > best[0]['silhouette']:
+            best = (candidate, centers)
+    
+    return {
+        'mode': 'auto',
+        'selected_k': best[0]['k'],
+        'elbow_k': elbow_k(candidates),
+        'candidates': candidates,
+        'sample_size': len(sample)
+    }, best[1]
+
 
 # Additional functions from original version
-def generate_color_frequency_analysis(colors, unique_colors, color_counter):
+def generate_color_frequency_analysis(colors, unique_colors, color_counts, context=None):
     """Generate color frequency analysis"""
-    most_common = color_counter.most_common(1)
+    context = context or AnalysisContext.for_colors(colors, color_counts)
+    counts = color_counts['counts']
+    total_pixels = int(counts.sum())
+    most_common = context.most_common(1)
     most_frequent = most_common[0] if most_common else ((128, 128, 128), 1)
     
     return {
-        "total_pixels": len(colors),
+        "total_pixels": total_pixels,
         "unique_colors": len(unique_colors),
-        "diversity_index": round(len(unique_colors) / len(colors), 3) if colors else 0,
+        "diversity_index": round(len(unique_colors) / total_pixels, 3) if total_pixels else 0,
         "most_frequent": {
             "color": f"#{most_frequent[0][0]:02x}{most_frequent[0][1]:02x}{most_frequent[0][2]:02x}",
-            "name": get_accurate_color_name(most_frequent[0][0], most_frequent[0][1], most_frequent[0][2]),
+            "name": context.color_name(*most_frequent[0]),
             "count": most_frequent[1],
-            "percentage": round((most_frequent[1] / len(colors)) * 100, 2) if colors else 0
+            "percentage": round((most_frequent[1] / total_pixels) * 100, 2) if total_pixels else 0
         },
         "frequency_distribution": {
-            "mean": statistics.mean([count for _, count in color_counter.most_common()]) if color_counter else 0,
-            "median": statistics.median([count for _, count in color_counter.most_common()]) if color_counter else 0,
-            "std_dev": statistics.stdev([count for _, count in color_counter.most_common()]) if len(color_counter) > 1 else 0
+            "mean": float(counts.mean()) if len(counts) else 0,
+            "median": float(np.median(counts)) if len(counts) else 0,
+            "std_dev": float(counts.std(ddof=1)) if len(counts) > 1 else 0
         },
-        "color_richness": "High" if len(unique_colors) / len(colors) > 0.1 else "Medium" if len(unique_colors) / len(colors) > 0.01 else "Low"
+        "color_richness": "High" if len(unique_colors) / total_pixels > 0.1 else "Medium" if len(unique_colors) / total_pixels > 0.01 else "Low"
     }
 
-def perform_kmeans_clustering(colors):
-    """Perform K-means clustering"""
+def perform_kmeans_clustering(colors, k=6, color_counts=None, context=None):
+    """Perform weighted K-means clustering over the distinct colours
+    
+    k="auto" chooses among KMEANS_AUTO_K_RANGE with select_kmeans_k. The
+    reported silhouette is measured on a weighted sample in either mode.
+    """
     try:
-        k = min(6, len(set(colors)))
-        clustered_colors = kmeans_plus_plus(list(set(colors)), k)
+        context = context or AnalysisContext.for_colors(colors, color_counts)
+        points, counts = context.unique_colors, context.counts
+        if k == 'auto':
+            # The bin-level fit is already close; refine it on the distinct colours
+            selection, initial_centers = select_kmeans_k(points, counts)
+            k, max_iterations = selection['selected_k'], KMEANS_AUTO_ITERATIONS
+        else:
+            selection, initial_centers = {'mode': 'fixed'}, None
+            k, max_iterations = min(k, len(points)), KMEANS_MAX_ITERATIONS
+        result = weighted_kmeans(points, counts, k, max_iterations, initial_centers=initial_centers)
+        
+        # Silhouette of the final clustering on a weighted sample of the distinct colours
+        sample, sample_weights = weighted_sample(
+            points.astype(np.float64), context.weights, KMEANS_SILHOUETTE_SAMPLE, np.random.default_rng(KMEANS_SEED)
+        )
+        silhouette = weighted_silhouette(sample, sample_weights, squared_distances(sample, result['centers']).argmin(axis=1), k)
+        
+        total = int(counts.sum())
+        # Per-pixel brightness sums (r + g + b) for within-cluster variance
+        brightness = points.astype(np.float64).sum(axis=1)
         
         clusters = []
-        for i, center in enumerate(clustered_colors):
-            r, g, b = [int(c) for c in center]
+        order = np.argsort(-result['cluster_weights'], kind='stable')
+        for i, cluster in enumerate(order):
+            r, g, b = [int(round(c)) for c in result['centers'][cluster]]
+            members = result['labels'] == cluster
+            size = int(counts[members].sum())
+            
+            # Weighted sample variance of r + g + b over the cluster's pixels
+            if size > 1:
+                member_weights = counts[members]
+                mean = np.average(brightness[members], weights=member_weights)
+                variance = float((member_weights * (brightness[members] - mean) ** 2).sum() / (size - 1))
+            else:
+                variance = 0
+            
             clusters.append({
                 "cluster_id": i + 1,
                 "center_color": {
                     "hex": f"#{r:02x}{g:02x}{b:02x}",
                     "rgb": {"r": r, "g": g, "b": b},
-                    "name": get_accurate_color_name(r, g, b)
+                    "name": context.color_name(r, g, b)
                 },
-                "size": len(colors) // k,
-                "percentage": round(100 / k, 2),
-                "variance": round(statistics.variance([c[0] + c[1] + c[2] for c in colors[:len(colors)//k]]) if len(colors) > k else 0, 2)
+                "size": size,
+                "percentage": round(size / total * 100, 2),
+                "variance": round(variance, 2)
             })
         
         return {
             "clusters": clusters,
             "optimal_k": k,
             "total_variance": sum(c["variance"] for c in clusters),
-            "silhouette_score": 0.85,
-            "clustering_quality": "Excellent"
+            "inertia": round(result['inertia'], 2),
+            "iterations": result['iterations'],
+            "converged": result['converged'],
+            "silhouette_score": round(silhouette, 3),
+            "clustering_quality": clustering_quality(silhouette),
+            "k_selection": selection
         }
         
     except Exception as e:
         return {"clusters": [], "optimal_k": 0, "error": str(e)}
 
-def generate_histograms(colors):
-    """Generate RGB histograms"""
-    try:
-        rgb_hist = {
-            "red": [len([c for c in colors if c[0] in range(i*16, (i+1)*16)]) for i in range(16)],
-            "green": [len([c for c in colors if c[1] in range(i*16, (i+1)*16)]) for i in range(16)],
-            "blue": [len([c for c in colors if c[2] in range(i*16, (i+1)*16)]) for i in range(16)]
-        }
-        
-        return {
-            "rgb": rgb_hist,
-            "statistics": {
-                "distribution_type": "RGB_Enhanced", 
-                "color_balance": {"score": 0.9, "status": "Excellent"},
-                "total_colors": len(colors)
-            }
-        }
-        
-    except Exception as e:
-        print(f"❌ Histogram generation error: {str(e)}")
-        return {
-            "rgb": {
-                "red": [5, 8, 12, 15, 10, 7, 9, 11, 6, 4, 8, 13, 9, 7, 5, 3],
-                "green": [10, 15, 20, 25, 18, 12, 8, 6, 9, 14, 16, 11, 7, 5, 4, 2],
-                "blue": [8, 12, 16, 20, 15, 10, 7, 9, 13, 11, 6, 8, 12, 9, 5, 3]
-            },
-            "statistics": {"distribution_type": "Fallback", "color_balance": {"score": 0.8, "status": "Good"}}
+def generate_histograms(colors, bins=HISTOGRAM_BINS, cube=None):
+    """Generate RGB and HSV histograms from the shared colour cube"""
+    if cube is None:
+        cube = build_color_cube(as_pixel_array(colors))
+    
+    rgb_hist = {
+        "red": cube_channel_histogram(cube, 0, bins).tolist(),
+        "green": cube_channel_histogram(cube, 1, bins).tolist(),
+        "blue": cube_channel_histogram(cube, 2, bins).tolist()
+    }
+    
+    return {
+        "rgb": rgb_hist,
+        "hsv": cube_hsv_histograms(cube, bins=bins),
+        "statistics": {
+            "distribution_type": "RGB_Enhanced", 
+            "color_balance": {"score": 0.9, "status": "Excellent"},
+            "total_colors": int(cube.sum()),
+            "bins": bins
         }
+    }
 
-def analyze_color_spaces(colors):
-    """Analyze color spaces"""
+def analyze_color_spaces(colors, stats=None, context=None):
+    """Analyze color spaces
+    
+    LAB, LCh and HSV statistics are computed over the distinct colours
+    weighted by their pixel counts, so their cost follows the palette size
+    rather than the pixel count.
+    """
     try:
-        # RGB analysis
-        rgb_values = {
-            "red": [c[0] for c in colors],
-            "green": [c[1] for c in colors],
-            "blue": [c[2] for c in colors]
-        }
+        stats = stats or compute_pixel_statistics(as_pixel_array(colors))
+        context = context or AnalysisContext.for_colors(colors)
         
+        # RGB analysis
         rgb_stats = {}
-        for channel, values in rgb_values.items():
-            if values:
+        for i, channel in enumerate(["red", "green", "blue"]):
+            if stats['count']:
                 rgb_stats[channel] = {
-                    "min": min(values),
-                    "max": max(values),
-                    "avg": round(sum(values) / len(values), 1)
+                    "min": stats['channel_min'][i],
+                    "max": stats['channel_max'][i],
+                    "avg": round(stats['channel_sum'][i] / stats['count'], 1)
                 }
             else:
                 rgb_stats[channel] = {"min": 0, "max": 255, "avg": 128}
         
-        return {
-            "rgb": rgb_stats,
-            "color_space_analysis": {
-                "dominant_space": "RGB",
-                "color_gamut": "Enhanced",
-                "accuracy_improvement": "+50%"
-            }
+        analysis = {"rgb": rgb_stats}
+        if len(context.unique_colors):
+            weights, lab = context.weights, context.lab
+            lch = lab_to_lch(lab)
+            h, s, v = context.hsv
+            
+            analysis["lab"] = weighted_channel_statistics(lab, weights, ("L", "a", "b"))
+            # Hue averages are weighted by chroma (saturation), so near-greys barely count
+            analysis["lch"] = dict(
+                weighted_channel_statistics(lch[:, :2], weights, ("L", "C")),
+                h=weighted_hue_statistics(lch[:, 2], weights * lch[:, 1])
+            )
+            analysis["hsv"] = dict(
+                h=weighted_hue_statistics(h, weights * s),
+                **weighted_channel_statistics(np.stack([s, v], axis=1), weights, ("s", "v"), 3)
+            )
+        
+        analysis["color_space_analysis"] = {
+            "dominant_space": "RGB",
+            "color_gamut": "Enhanced",
+            "accuracy_improvement": "+50%",
+            "reference_white": "D65"
         }
+        return analysis
         
     except Exception as e:
         print(f"❌ Color spaces analysis error: {str(e)}")
@@ -954,23 +4545,16 @@ def analyze_color_spaces(colors):
             "color_space_analysis": {"dominant_space": "RGB", "color_gamut": "Enhanced", "accuracy_improvement": "+50%"}
         }
 
-def analyze_color_characteristics(colors, unique_colors, dominant_colors):
+def analyze_color_characteristics(colors, unique_colors, dominant_colors, stats=None):
     """Analyze color characteristics"""
     try:
-        # Calculate color temperature
-        warm_colors = 0
-        cool_colors = 0
+        stats = stats or compute_pixel_statistics(as_pixel_array(colors))
         
-        for color in colors:
-            r, g, b = color
-            # Simple warm/cool classification
-            warmth = (r + g/2) - b
-            if warmth > 0:
-                warm_colors += 1
-            else:
-                cool_colors += 1
+        # Calculate color temperature (simple warm/cool classification)
+        total_colors = stats['count']
+        warm_colors = stats['warm_count']
+        cool_colors = total_colors - warm_colors
         
-        total_colors = len(colors)
         warm_percentage = (warm_colors / total_colors * 100) if total_colors > 0 else 50
         cool_percentage = (cool_colors / total_colors * 100) if total_colors > 0 else 50
         
@@ -986,8 +4570,7 @@ def analyze_color_characteristics(colors, unique_colors, dominant_colors):
             temp_score = 0.5
         
         # Calculate brightness
-        brightness_values = [calculate_luminance(c[0], c[1], c[2]) for c in colors]
-        avg_brightness = sum(brightness_values) / len(brightness_values) if brightness_values else 0.5
+        avg_brightness = mean_luminance(stats) if total_colors else 0.5
         
         if avg_brightness > 0.7:
             brightness_level = "High"
@@ -997,8 +4580,7 @@ def analyze_color_characteristics(colors, unique_colors, dominant_colors):
             brightness_level = "Low"
         
         # Calculate saturation
-        saturation_values = [calculate_saturation(c[0], c[1], c[2]) for c in colors]
-        avg_saturation = sum(saturation_values) / len(saturation_values) if saturation_values else 0.5
+        avg_saturation = mean_saturation(stats)
         
         if avg_saturation > 0.7:
             saturation_level = "High"
@@ -1074,4 +4656,16 @@ def perform_cnn_analysis(image_bytes, colors, dominant_colors):
         "accuracy": {"color_naming": "Enhanced", "regional_analysis": "Professional"}
     }
 
-print("🎨 ColorLab complete enhanced Lambda function ready")
+# ===== MODULE INIT =====
+
+INIT_TIMINGS['module_load'] = {
+    'wall_ms': round((time.perf_counter() - _MODULE_LOAD_STARTED[0]) * 1000, 3),
+    'cpu_ms': round((time.process_time() - _MODULE_LOAD_STARTED[1]) * 1000, 3)
+}
+if EAGER_INIT:
+    initialize_analysis_state()
+
+if __name__ == '__main__':
+    # Regenerate the bundled naming index
+    save_color_name_index()
+    print(f"Wrote {COLOR_INDEX_FILE}")
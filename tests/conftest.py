@@ -0,0 +1,32 @@
+"""
+ColorLab - shared test fixtures
+
+The Lambda module is imported from the repository root with metric log
+lines off, the way the benchmarks import it. Allocation tracing is off by
+default; tests that check it turn it on.
+"""
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+os.environ.setdefault('COLORLAB_EMF_METRICS', '0')
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import lambda_function_colorlab_complete
+
+
+@pytest.fixture
+def colorlab():
+    return lambda_function_colorlab_complete
+
+
+@pytest.fixture
+def quiet():
+    """Context manager factory swallowing the module's progress prints"""
+    return lambda: contextlib.redirect_stdout(io.StringIO())
@@ -0,0 +1,12 @@
+"""Batch analysis: request validation"""
+import json
+
+import pytest
+
+
+@pytest.mark.parametrize('budget', ['abc', None, [], -5, 0, 'nan', 'inf'])
+def test_invalid_time_budget_is_bad_request(colorlab, budget):
+    event = {'body': json.dumps({'images': [{'image_data': ''}], 'time_budget_ms': budget})}
+    response = colorlab.handle_batch_analysis(event, None, {})
+    assert response['statusCode'] == 400
+    assert 'time_budget_ms' in json.loads(response['body'])['error']
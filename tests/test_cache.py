@@ -0,0 +1,65 @@
+"""Analysis result cache: content-addressed keys, LRU tier and disk tier"""
+import pytest
+from bench_stages import synthetic_jpeg
+
+
+@pytest.fixture
+def cache(colorlab, monkeypatch, tmp_path):
+    """Empty memory tier with its statistics reset, and a disk tier under tmp_path"""
+    monkeypatch.setattr(colorlab, '_RESULT_CACHE', colorlab.OrderedDict())
+    monkeypatch.setattr(colorlab, '_CACHE_STATS', dict.fromkeys(colorlab._CACHE_STATS, 0))
+    monkeypatch.setattr(colorlab, 'CACHE_DIR', str(tmp_path))
+    return tmp_path
+
+
+def analyze(colorlab, quiet, image_bytes, **options):
+    with quiet():
+        return colorlab.analyze_image_bytes(image_bytes, dict(options, index=False))
+
+
+def test_key_follows_image_and_result_options(colorlab):
+    image = synthetic_jpeg('photo', 0.1)
+    key = colorlab.analysis_cache_key(image, {'sections': 'histograms'})
+    assert colorlab.analysis_cache_key(image, {'sections': 'histograms'}) == key
+    assert colorlab.analysis_cache_key(image, {'sections': 'histograms', 'histogram_bins': 8}) != key
+    assert colorlab.analysis_cache_key(image + b'\0', {'sections': 'histograms'}) != key
+    # Execution options do not change the result, so they share the entry
+    assert colorlab.analysis_cache_key(image, {'sections': 'histograms', 'stage_workers': 2, 'cache': True}) == key
+
+
+def test_repeat_is_a_memory_hit(colorlab, quiet, cache):
+    image = synthetic_jpeg('photo', 0.1)
+    first = analyze(colorlab, quiet, image)
+    second = analyze(colorlab, quiet, image)
+    assert first['metadata']['cache']['hit'] is False
+    assert second['metadata']['cache']['tier'] == 'memory'
+    assert second['dominant_colors'] == first['dominant_colors']
+    # Different result options are a different entry
+    assert analyze(colorlab, quiet, image, histogram_bins=8)['metadata']['cache']['hit'] is False
+
+
+def test_disk_tier_serves_entries_evicted_from_memory(colorlab, quiet, cache, monkeypatch):
+    monkeypatch.setattr(colorlab, 'CACHE_MAX_ENTRIES', 1)
+    first, second = synthetic_jpeg('photo', 0.1), synthetic_jpeg('gradient', 0.1)
+    expected = analyze(colorlab, quiet, first)
+    analyze(colorlab, quiet, second)
+    assert len(colorlab._RESULT_CACHE) == 1 and len(list(cache.glob('*.json'))) == 2
+    
+    again = analyze(colorlab, quiet, first)
+    assert again['metadata']['cache']['tier'] == 'disk'
+    assert again['kmeans_analysis'] == expected['kmeans_analysis']
+    # Read back into memory on the way
+    assert analyze(colorlab, quiet, first)['metadata']['cache']['tier'] == 'memory'
+
+
+def test_corrupt_disk_entry_is_ignored(colorlab, quiet, cache):
+    image = synthetic_jpeg('photo', 0.1)
+    key = colorlab.analysis_cache_key(image, {'index': False})
+    (cache / f"{key}.json").write_text('{"dominant_colors": [', encoding='utf-8')
+    
+    assert colorlab.cache_get(key) == (None, None)
+    analysis = analyze(colorlab, quiet, image)
+    assert analysis['metadata']['cache']['hit'] is False and analysis['dominant_colors']
+    # The fresh result replaces the corrupt file
+    colorlab._RESULT_CACHE.clear()
+    assert colorlab.cache_get(key)[1] == 'disk'
@@ -0,0 +1,37 @@
+"""Cold start: light routes and the warm-up event"""
+import json
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+
+LIGHT_ROUTES = """
+import contextlib, io, json, sys
+with contextlib.redirect_stdout(io.StringIO()):
+    import lambda_function_colorlab_complete as colorlab
+    heavy = lambda: sorted(name for name in ('numpy', 'PIL') if name in sys.modules)
+    loaded = {'import': heavy()}
+    health = colorlab.lambda_handler({'httpMethod': 'GET', 'path': '/health'}, None)
+    loaded['health'] = heavy()
+    warmup = colorlab.lambda_handler({'warmup': True}, None)
+    loaded['warmup'] = heavy()
+print(json.dumps({'loaded': loaded, 'health': json.loads(health['body']), 'warmup': json.loads(warmup['body'])}))
+"""
+
+
+def test_health_does_not_import_heavy_modules():
+    # A fresh interpreter: this one has already imported NumPy and Pillow
+    env = dict(os.environ, COLORLAB_EMF_METRICS='0', COLORLAB_EAGER_INIT='0')
+    output = subprocess.run([sys.executable, '-c', LIGHT_ROUTES], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    report = json.loads(output.strip().splitlines()[-1])
+    
+    assert report['loaded']['import'] == []
+    assert report['loaded']['health'] == []
+    assert report['health']['init']['modules_loaded'] == {'numpy': False, 'PIL.Image': False}
+    # Warm-up is what loads them, so the first real request does not have to
+    assert report['loaded']['warmup'] == ['PIL', 'numpy']
+    assert report['warmup']['success']
+    assert report['warmup']['init']['modules_loaded'] == {'numpy': True, 'PIL.Image': True}
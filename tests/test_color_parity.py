@@ -0,0 +1,151 @@
+"""Vectorized colour conversions and naming against scalar references
+
+HSV, luminance, saturation and colour names are checked against the
+per-colour functions the vectorized versions replaced; LAB and LCh against
+a scalar transcription of the sRGB/CIELAB formulas; CIEDE2000 against the
+Sharma, Wu & Dalal (2005) test data.
+"""
+import math
+
+import numpy as np
+import pytest
+
+# (L1, a1, b1), (L2, a2, b2), ΔE00 — Sharma, Wu & Dalal, Color Res. Appl. 30 (2005), table 1
+CIEDE2000_PAIRS = [
+    ((50.0000, 2.6772, -79.7751), (50.0000, 0.0000, -82.7485), 2.0425),
+    ((50.0000, 3.1571, -77.2803), (50.0000, 0.0000, -82.7485), 2.8615),
+    ((50.0000, 2.8361, -74.0200), (50.0000, 0.0000, -82.7485), 3.4412),
+    ((50.0000, -1.3802, -84.2814), (50.0000, 0.0000, -82.7485), 1.0000),
+    ((50.0000, -1.1848, -84.8006), (50.0000, 0.0000, -82.7485), 1.0000),
+    ((50.0000, -0.9009, -85.5211), (50.0000, 0.0000, -82.7485), 1.0000),
+    ((50.0000, 0.0000, 0.0000), (50.0000, -1.0000, 2.0000), 2.3669),
+    ((50.0000, -1.0000, 2.0000), (50.0000, 0.0000, 0.0000), 2.3669),
+    ((50.0000, 2.4900, -0.0010), (50.0000, -2.4900, 0.0009), 7.1792),
+    ((50.0000, 2.4900, -0.0010), (50.0000, -2.4900, 0.0010), 7.1792),
+    ((50.0000, 2.4900, -0.0010), (50.0000, -2.4900, 0.0011), 7.2195),
+    ((50.0000, 2.4900, -0.0010), (50.0000, -2.4900, 0.0012), 7.2195),
+    ((50.0000, -0.0010, 2.4900), (50.0000, 0.0009, -2.4900), 4.8045),
+    ((50.0000, -0.0010, 2.4900), (50.0000, 0.0010, -2.4900), 4.8045),
+    ((50.0000, -0.0010, 2.4900), (50.0000, 0.0011, -2.4900), 4.7461),
+    ((50.0000, 2.5000, 0.0000), (50.0000, 0.0000, -2.5000), 4.3065),
+    ((50.0000, 2.5000, 0.0000), (73.0000, 25.0000, -18.0000), 27.1492),
+    ((50.0000, 2.5000, 0.0000), (61.0000, -5.0000, 29.0000), 22.8977),
+    ((50.0000, 2.5000, 0.0000), (56.0000, -27.0000, -3.0000), 31.9030),
+    ((50.0000, 2.5000, 0.0000), (58.0000, 24.0000, 15.0000), 19.4535),
+    ((50.0000, 2.5000, 0.0000), (50.0000, 3.1736, 0.5854), 1.0000),
+    ((50.0000, 2.5000, 0.0000), (50.0000, 3.2972, 0.0000), 1.0000),
+    ((50.0000, 2.5000, 0.0000), (50.0000, 1.8634, 0.5757), 1.0000),
+    ((50.0000, 2.5000, 0.0000), (50.0000, 3.2592, 0.3350), 1.0000),
+    ((60.2574, -34.0099, 36.2677), (60.4626, -34.1751, 39.4387), 1.2644),
+    ((63.0109, -31.0961, -5.8663), (62.8187, -29.7946, -4.0864), 1.2630),
+    ((61.2901, 3.7196, -5.3901), (61.4292, 2.2480, -4.9620), 1.8731),
+    ((35.0831, -44.1164, 3.7933), (35.0232, -40.0716, 1.5901), 1.8645),
+    ((22.7233, 20.0904, -46.6940), (23.0331, 14.9730, -42.5619), 2.0373),
+    ((36.4612, 47.8580, 18.3852), (36.2715, 50.5065, 21.2231), 1.4146),
+    ((90.8027, -2.0831, 1.4410), (91.1528, -1.6435, 0.0447), 1.4441),
+    ((90.9257, -0.5406, -0.9208), (88.6381, -0.8985, -0.7239), 1.5381),
+    ((6.7747, -0.2908, -2.4247), (5.8714, -0.0985, -2.2286), 0.6377),
+    ((2.0776, 0.0795, -1.1350), (0.9033, -0.0636, -0.5514), 0.9082),
+]
+
+
+@pytest.fixture(scope='module')
+def colors():
+    """Random colours plus greys, primaries and channel extremes"""
+    rng = np.random.default_rng(0)
+    levels = np.array([0, 1, 127, 128, 254, 255])
+    corners = np.stack(np.meshgrid(levels, levels, levels, indexing='ij'), axis=-1).reshape(-1, 3)
+    greys = np.repeat(np.arange(256)[:, None], 3, axis=1)
+    return np.vstack([rng.integers(0, 256, (20000, 3)), corners, greys]).astype(np.uint8)
+
+
+def scalar_rgb_to_lab(r, g, b, colorlab):
+    """sRGB (0-255) to CIELAB, one colour at a time"""
+    def linear(c):
+        c /= 255.0
+        return c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
+
+    rgb = [linear(float(c)) for c in (r, g, b)]
+    xyz = [sum(m * c for m, c in zip(row, rgb)) for row in colorlab.SRGB_TO_XYZ]
+
+    def f(t):
+        return t ** (1 / 3) if t > (6 / 29) ** 3 else t / (3 * (6 / 29) ** 2) + 4 / 29
+
+    fx, fy, fz = (f(v / w) for v, w in zip(xyz, colorlab.D65_WHITE))
+    return 116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz)
+
+
+def linear_scan_color_name(r, g, b, colorlab):
+    """The original per-colour naming: exact match, else the first nearest COLOR_DATABASE entry within 100, else generic"""
+    if (r, g, b) in colorlab.COLOR_DATABASE:
+        return colorlab.COLOR_DATABASE[(r, g, b)]
+    min_distance, closest = float('inf'), None
+    for (cr, cg, cb), name in colorlab.COLOR_DATABASE.items():
+        distance = math.sqrt((r - cr) ** 2 + (g - cg) ** 2 + (b - cb) ** 2)
+        if distance < min_distance:
+            min_distance, closest = distance, name
+    return colorlab.get_generic_color_name(r, g, b) if min_distance > 100 else closest
+
+
+def test_hsv_matches_scalar(colorlab, colors):
+    h, s, v = colorlab.rgb_to_hsv_array(colors)
+    expected = np.array([colorlab.rgb_to_hsv_accurate(*c) for c in colors.tolist()])
+    assert np.allclose(h, expected[:, 0], rtol=0, atol=1e-9)
+    assert np.allclose(s, expected[:, 1], rtol=0, atol=1e-12)
+    assert np.allclose(v, expected[:, 2], rtol=0, atol=1e-12)
+
+
+def test_luminance_and_saturation_match_scalar(colorlab, colors):
+    rows = colors.tolist()
+    assert np.allclose(colorlab.calculate_luminance_array(colors),
+                       [colorlab.calculate_luminance(*c) for c in rows], rtol=0, atol=1e-12)
+    assert np.allclose(colorlab.calculate_saturation_array(colors),
+                       [colorlab.calculate_saturation(*c) for c in rows], rtol=0, atol=1e-12)
+
+
+def test_lab_and_lch_match_scalar(colorlab, colors):
+    expected = np.array([scalar_rgb_to_lab(*c, colorlab) for c in colors.tolist()])
+    # uint8 input goes through the lookup table, float input through the formula
+    for pixels in (colors, colors.astype(np.float64)):
+        lab = colorlab.rgb_to_lab_array(pixels)
+        assert np.allclose(lab, expected, rtol=0, atol=1e-9)
+    lch = colorlab.lab_to_lch(colorlab.rgb_to_lab_array(colors))
+    assert np.allclose(lch[:, 1], np.hypot(expected[:, 1], expected[:, 2]), rtol=0, atol=1e-9)
+    chromatic = lch[:, 1] > 1e-6
+    hue = np.array([math.degrees(math.atan2(b, a)) % 360 for _, a, b in expected])
+    hue_error = np.abs((lch[:, 2] - hue + 180) % 360 - 180)
+    assert hue_error[chromatic].max() < 1e-6
+
+
+def test_lab_reference_colours(colorlab):
+    lab = colorlab.rgb_to_lab_array(np.array([[255, 255, 255], [255, 0, 0], [0, 0, 0]], dtype=np.uint8))
+    assert np.allclose(lab[0], (100.0, 0.0, 0.0), atol=0.01)
+    assert np.allclose(lab[1], (53.24, 80.09, 67.20), atol=0.01)
+    assert np.allclose(lab[2], (0.0, 0.0, 0.0), atol=1e-9)
+
+
+def test_ciede2000_reference_data(colorlab):
+    lab1 = np.array([pair[0] for pair in CIEDE2000_PAIRS])
+    lab2 = np.array([pair[1] for pair in CIEDE2000_PAIRS])
+    expected = np.array([pair[2] for pair in CIEDE2000_PAIRS])
+    assert np.allclose(colorlab.ciede2000(lab1, lab2), expected, rtol=0, atol=1e-4)
+    assert np.allclose(colorlab.ciede2000(lab2, lab1), expected, rtol=0, atol=1e-4)
+    assert np.allclose(colorlab.ciede2000(lab1, lab1), 0.0, atol=1e-12)
+
+
+def test_color_names_match_scalar_references(colorlab, colors):
+    names = colorlab.get_accurate_color_names(colors)
+    rows = colors.tolist()
+    assert names == [colorlab.get_accurate_color_name(*c) for c in rows]
+    assert names == [linear_scan_color_name(*c, colorlab) for c in rows]
+
+
+def test_names_of_database_colours_and_neighbours(colorlab):
+    database = np.array(list(colorlab.COLOR_DATABASE), dtype=np.int16)
+    offsets = np.array([[0, 0, 0], [1, 0, 0], [0, -1, 0], [0, 0, 1], [3, -3, 3]])
+    colors = np.clip(database[:, None, :] + offsets, 0, 255).reshape(-1, 3).astype(np.uint8)
+    assert colorlab.get_accurate_color_names(colors) == [linear_scan_color_name(*c, colorlab) for c in colors.tolist()]
+
+
+def test_generic_names_match_scalar(colorlab, colors):
+    assert list(colorlab.get_generic_color_names(colors)) == [colorlab.get_generic_color_name(*c) for c in colors.tolist()]
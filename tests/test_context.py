@@ -0,0 +1,46 @@
+"""Per-request analysis context: each derived product is computed once"""
+from collections import Counter
+from functools import cached_property
+
+import pytest
+from bench_stages import synthetic_jpeg
+
+PRODUCTS = ('color_counts', 'unique_colors', 'weights', 'luminance', 'saturation', 'hsv', 'lab')
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_every_product_is_computed_once_per_request(colorlab, quiet, monkeypatch, workers):
+    monkeypatch.setattr(colorlab, 'available_workers', lambda: 4)
+    computed, named = Counter(), Counter()
+    
+    def counting(name, compute):
+        def product(self):
+            computed[name] += 1
+            return compute(self)
+        return product
+    
+    for name in PRODUCTS:
+        product = cached_property(counting(name, colorlab.AnalysisContext.__dict__[name].func))
+        product.__set_name__(colorlab.AnalysisContext, name)
+        monkeypatch.setattr(colorlab.AnalysisContext, name, product)
+    
+    get_accurate_color_name = colorlab.get_accurate_color_name
+    
+    def counting_name(r, g, b):
+        named[(r, g, b)] += 1
+        return get_accurate_color_name(r, g, b)
+    
+    monkeypatch.setattr(colorlab, 'get_accurate_color_name', counting_name)
+    
+    plan = colorlab.analysis_stage_plan()
+    image_bytes = synthetic_jpeg('photo', 0.1)
+    with quiet():
+        colors_data = colorlab.extract_colors_from_image_bytes(image_bytes, stages=plan)
+        context = colorlab.AnalysisContext(image_bytes, colors_data, {'stage_workers': workers})
+        colorlab.run_analysis_stages(plan, image_bytes, colors_data, context.options, context=context)
+    
+    assert set(context.results) == set(plan)
+    assert computed and max(computed.values()) == 1, computed
+    # Names are memoized without a lock, so concurrent stages may race to name the same colour
+    if workers == 1:
+        assert named and max(named.values()) == 1, [key for key, count in named.items() if count > 1]
@@ -0,0 +1,22 @@
+"""Decoding: images are fitted to exactly max_dimension on the longest side"""
+import io
+
+import pytest
+from PIL import Image
+
+
+@pytest.mark.parametrize('size, fmt', [((300, 200), 'JPEG'), ((300, 200), 'PNG'), ((4000, 3000), 'JPEG'), ((63, 40), 'PNG')])
+def test_longest_side_fits_max_dimension(colorlab, quiet, size, fmt):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 10, 30)).save(buffer, fmt)
+    with quiet():
+        image = colorlab.open_image_for_analysis(buffer.getvalue(), 32)
+    assert max(image.size) == 32
+    assert abs(image.size[0] / image.size[1] - size[0] / size[1]) < 0.1
+
+
+def test_small_images_are_not_upscaled(colorlab, quiet):
+    buffer = io.BytesIO()
+    Image.new('RGB', (20, 10)).save(buffer, 'PNG')
+    with quiet():
+        assert colorlab.open_image_for_analysis(buffer.getvalue(), 32).size == (20, 10)
@@ -0,0 +1,84 @@
+"""Multi-frame images: frame sampling, stride, frame cap and the timeline"""
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+FRAME_COLORS = [(200, 30, 30), (30, 200, 30), (30, 30, 200), (200, 200, 30), (30, 200, 200), (200, 30, 200)]
+
+
+def animation(fmt, colors=FRAME_COLORS, size=(40, 30), sizes=None, **save_options):
+    """Encoded image with one flat frame per colour"""
+    frames = [Image.fromarray(np.full(((sizes or {}).get(i, size))[::-1] + (3,), color, dtype=np.uint8))
+              for i, color in enumerate(colors)]
+    buffer = io.BytesIO()
+    frames[0].save(buffer, fmt, save_all=True, append_images=frames[1:], **save_options)
+    return buffer.getvalue()
+
+
+def analyze(colorlab, quiet, data, **options):
+    with quiet():
+        analysis = colorlab.analyze_image_bytes(data, dict(options, cache=False, index=False))
+    assert 'error' not in analysis
+    return analysis
+
+
+def timeline_colors(frames):
+    return [entry['dominant_colors'][0]['hex'] for entry in frames['timeline']]
+
+
+def hexes(colors):
+    return ['#%02x%02x%02x' % color for color in colors]
+
+
+def test_gif_frames_are_merged_with_a_timeline(colorlab, quiet):
+    analysis = analyze(colorlab, quiet, animation('GIF', duration=50, loop=0))
+    frames = analysis['frames']
+    assert (frames['frame_count'], frames['sampled_frames'], frames['frame_stride']) == (6, 6, 1)
+    assert [entry['timestamp_ms'] for entry in frames['timeline']] == [0, 50, 100, 150, 200, 250]
+    assert all(entry['duration_ms'] == 50 for entry in frames['timeline'])
+    assert timeline_colors(frames) == hexes(FRAME_COLORS)
+    assert all(entry['dominant_colors'][0]['percentage'] == 100.0 for entry in frames['timeline'])
+    # Every sampled frame's pixels count towards the whole-image sections
+    assert analysis['metadata']['total_color_samples'] == 6 * 40 * 30
+    assert sorted(color['hex'] for color in analysis['dominant_colors']) == sorted(hexes(FRAME_COLORS))
+    assert all(color['percentage'] == pytest.approx(100 / 6, abs=0.01) for color in analysis['dominant_colors'])
+
+
+def test_frame_stride_samples_every_nth_frame(colorlab, quiet):
+    frames = analyze(colorlab, quiet, animation('GIF', duration=50), frame_stride=2)['frames']
+    assert [entry['frame'] for entry in frames['timeline']] == [0, 2, 4]
+    assert (frames['requested_stride'], frames['frame_stride']) == (2, 2)
+    assert timeline_colors(frames) == hexes(FRAME_COLORS[::2])
+
+
+def test_max_frames_widens_the_stride(colorlab, quiet):
+    analysis = analyze(colorlab, quiet, animation('GIF', duration=50), max_frames=2)
+    frames = analysis['frames']
+    assert [entry['frame'] for entry in frames['timeline']] == [0, 3]
+    assert (frames['requested_stride'], frames['frame_stride'], frames['max_frames']) == (1, 3, 2)
+    assert analysis['metadata']['total_color_samples'] == 2 * 40 * 30
+
+
+def test_multi_frame_off_analyzes_the_first_frame(colorlab, quiet):
+    analysis = analyze(colorlab, quiet, animation('GIF', duration=50), multi_frame=False)
+    assert 'frames' not in analysis
+    assert analysis['metadata']['total_color_samples'] == 40 * 30
+    assert [color['hex'] for color in analysis['dominant_colors']] == hexes(FRAME_COLORS[:1])
+
+
+def test_tiff_pages_of_other_sizes_are_resized(colorlab, quiet):
+    data = animation('TIFF', FRAME_COLORS[:3], sizes={2: (20, 15)})
+    analysis = analyze(colorlab, quiet, data)
+    frames = analysis['frames']
+    assert frames['frame_count'] == 3 and timeline_colors(frames) == hexes(FRAME_COLORS[:3])
+    # TIFF pages carry no timing
+    assert all(entry['timestamp_ms'] is None and entry['duration_ms'] is None for entry in frames['timeline'])
+    assert analysis['metadata']['total_color_samples'] == 3 * 40 * 30
+
+
+@pytest.mark.parametrize('options', [{'frame_stride': 0}, {'max_frames': 'x'}, {'max_frames': -1}])
+def test_invalid_frame_sampling_is_rejected(colorlab, options):
+    with pytest.raises(ValueError):
+        colorlab.validate_options(options)
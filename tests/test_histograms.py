@@ -0,0 +1,64 @@
+"""Colour cube histograms against plain NumPy"""
+import numpy as np
+import pytest
+
+
+@pytest.fixture(params=['noise', 'every_cell'])
+def pixels(request):
+    if request.param == 'every_cell':
+        # One pixel in every cube cell, including cells whose hue sits on a bin edge
+        levels = np.arange(0, 256, 8, dtype=np.uint8)
+        return np.stack(np.meshgrid(levels, levels, levels, indexing='ij'), axis=-1).reshape(-1, 3)
+    rng = np.random.default_rng(3)
+    # Noise plus a few flat patches and the extremes of every channel
+    noise = rng.integers(0, 256, (3000, 3), dtype=np.uint8)
+    flats = np.repeat(np.array([[0, 0, 0], [255, 255, 255], [128, 128, 128], [255, 0, 0]], dtype=np.uint8), 50, axis=0)
+    return np.vstack([noise, flats])
+
+
+def test_color_cube_matches_histogramdd(colorlab, pixels):
+    bits = colorlab.COLOR_CUBE_BITS
+    levels = 1 << bits
+    expected, _ = np.histogramdd(pixels >> (8 - bits), bins=levels, range=[(0, levels)] * 3)
+    cube = colorlab.build_color_cube(pixels)
+    assert cube.shape == (levels,) * 3
+    np.testing.assert_array_equal(cube, expected.astype(np.int64))
+
+
+@pytest.mark.parametrize('bins', [8, 16, 32])
+def test_channel_histograms_match_numpy(colorlab, pixels, bins):
+    histograms = colorlab.generate_histograms(pixels, bins)
+    for channel, name in enumerate(('red', 'green', 'blue')):
+        expected, _ = np.histogram(pixels[:, channel], bins=bins, range=(0, 256))
+        assert histograms['rgb'][name] == expected.tolist()
+    assert histograms['statistics']['total_colors'] == len(pixels)
+
+
+def test_unaligned_bins_count_cube_levels_by_centre(colorlab, pixels):
+    # 10 bins do not align with cube levels: each level goes to the bin holding its centre
+    shift = 8 - colorlab.COLOR_CUBE_BITS
+    centres = ((pixels >> shift) + 0.5) * (1 << shift)
+    histograms = colorlab.generate_histograms(pixels, 10)
+    for channel, name in enumerate(('red', 'green', 'blue')):
+        expected, _ = np.histogram(centres[:, channel], bins=10, range=(0, 256))
+        assert histograms['rgb'][name] == expected.tolist()
+    assert all(sum(counts) == len(pixels) for counts in histograms['rgb'].values())
+
+
+def test_hsv_histograms_match_exact_bins_of_cell_centres(colorlab, pixels):
+    # Cell centres are integers, so their HSV bins have exact integer forms
+    shift = 8 - colorlab.COLOR_CUBE_BITS
+    rgb = ((pixels >> shift).astype(np.int64) << shift) + (1 << shift) // 2
+    r, g, b = rgb.T
+    high, low = rgb.max(axis=1), rgb.min(axis=1)
+    diff = np.maximum(high - low, 1)
+    # Hue in 30-degree sectors: 2 * (g - b) / diff sectors from red, and so on
+    sector = np.where(high == r, (2 * (g - b)) // diff % 12,
+                      np.where(high == g, 4 + (2 * (b - r)) // diff, 8 + (2 * (r - g)) // diff))
+    chromatic = 10 * (high - low) >= high
+    
+    histograms = colorlab.generate_histograms(pixels)['hsv']
+    assert histograms['hue'] == np.bincount(sector[chromatic], minlength=12).tolist()
+    assert histograms['saturation'] == np.bincount(16 * (high - low) // high, minlength=16).tolist()
+    assert histograms['value'] == np.bincount(16 * high // 255, minlength=16).tolist()
+    assert histograms['achromatic_pixels'] == int((~chromatic).sum())
@@ -0,0 +1,83 @@
+"""Stage instrumentation: peak allocation tracing and CloudWatch metric records"""
+import contextlib
+import io
+import json
+import threading
+import tracemalloc
+
+import numpy as np
+from bench_stages import synthetic_jpeg
+
+
+def test_sequential_stage_peaks_are_exact(colorlab):
+    timings = {}
+    with colorlab.timed_stage(timings, 'big', trace_memory=True):
+        np.ones(1 << 20).sum()
+    with colorlab.timed_stage(timings, 'small', trace_memory=True):
+        np.ones(1 << 10).sum()
+    assert timings['big']['peak_alloc_bytes'] >= 8 << 20
+    # The earlier stage's peak does not leak into the next one
+    assert timings['small']['peak_alloc_bytes'] < 1 << 20
+    assert not any('peak_alloc_approximate' in record for record in timings.values())
+
+
+def test_overlapping_stage_peaks_are_marked_approximate(colorlab):
+    timings = {}
+    both_started, first_done = threading.Barrier(2), threading.Event()
+    
+    def stage(name):
+        with colorlab.timed_stage(timings, name, trace_memory=True):
+            both_started.wait()
+            if name == 'second':
+                first_done.wait()
+            np.ones(1 << 16).sum()
+        if name == 'first':
+            first_done.set()
+    
+    threads = [threading.Thread(target=stage, args=(name,)) for name in ('first', 'second')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert timings['first']['peak_alloc_approximate'] and timings['second']['peak_alloc_approximate']
+    # Overlapping peaks are upper bounds: neither was reset by the other
+    assert timings['first']['peak_alloc_bytes'] >= 1 << 19
+
+
+def test_trace_memory_records_stage_peaks(colorlab, quiet, monkeypatch):
+    monkeypatch.setattr(colorlab, 'TRACE_MEMORY', True)
+    with quiet():
+        analysis = colorlab.analyze_image_bytes(synthetic_jpeg('photo', 0.1), {'cache': False, 'index': False})
+    timings = analysis['metadata']['stage_timings']
+    assert all('peak_alloc_bytes' in timings[name] for name in ('decode', 'extraction', 'dominant_colors'))
+
+
+def test_emf_records_declare_every_metric(colorlab, monkeypatch):
+    monkeypatch.setattr(colorlab, 'EMF_METRICS', True)
+    timings = {
+        'exact': {'wall_ms': 1.0, 'cpu_ms': 1.0, 'peak_alloc_bytes': 2048},
+        'overlapping': {'wall_ms': 1.0, 'cpu_ms': 1.0, 'peak_alloc_bytes': 4096, 'peak_alloc_approximate': True},
+        'untraced': {'wall_ms': 1.0, 'cpu_ms': 1.0}
+    }
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        colorlab.emit_stage_metrics(timings)
+    records = {record['Stage']: record for record in map(json.loads, output.getvalue().splitlines())}
+    for name, record in records.items():
+        directive = record['_aws']['CloudWatchMetrics'][0]
+        declared = {metric['Name'] for metric in directive['Metrics']}
+        values = set(record) - {'_aws', 'Stage'}
+        assert declared == values
+        assert all(key in record for dimensions in directive['Dimensions'] for key in dimensions)
+    assert records['exact']['PeakAllocation'] == 2048
+    assert 'PeakAllocation' not in records['overlapping'] and 'PeakAllocation' not in records['untraced']
+
+
+def test_stage_tracing_leaves_outside_tracing_running(colorlab):
+    tracemalloc.start()
+    try:
+        with colorlab.timed_stage({}, 'stage', trace_memory=True):
+            pass
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
@@ -0,0 +1,48 @@
+"""Async jobs: resuming from checkpoints"""
+import base64
+
+import pytest
+from bench_stages import synthetic_jpeg
+
+
+@pytest.fixture
+def job_store(colorlab):
+    store, queue = colorlab.MemoryJobStore(), colorlab.MemoryJobQueue()
+    colorlab.set_job_backends(store, queue)
+    yield store
+    colorlab.set_job_backends(None, None)
+
+
+def test_resume_skips_stages_only_completed_sections_need(colorlab, quiet, job_store, monkeypatch):
+    request = {'image_data': base64.b64encode(synthetic_jpeg('photo', 0.1)).decode(),
+               'options': {'cache': False, 'index': False}}
+    with quiet():
+        fresh = colorlab.analyze_image_bytes(base64.b64decode(request['image_data']), request['options'])
+        job = colorlab.submit_job(request)
+    
+    # First attempt dies while checkpointing the first section after characteristics
+    save_checkpoint = job_store.save_checkpoint
+    
+    def failing_checkpoint(job_id, name, result):
+        if name == 'ai_training_data':
+            raise RuntimeError('worker lost')
+        save_checkpoint(job_id, name, result)
+    
+    monkeypatch.setattr(job_store, 'save_checkpoint', failing_checkpoint)
+    with quiet(), pytest.raises(RuntimeError):
+        colorlab.run_job(job['job_id'])
+    assert 'characteristics' in job_store.checkpoints(job['job_id'])
+    monkeypatch.setattr(job_store, 'save_checkpoint', save_checkpoint)
+    
+    ran = []
+    for name, (dependencies, stage) in list(colorlab.ANALYSIS_STAGES.items()):
+        monkeypatch.setitem(colorlab.ANALYSIS_STAGES, name,
+                            (dependencies, lambda context, name=name, stage=stage: ran.append(name) or stage(context)))
+    with quiet():
+        job = colorlab.run_job(job['job_id'])
+    
+    assert job['status'] == 'succeeded' and job['attempts'] == 2
+    assert ran == ['ai_training_data', 'cnn_analysis']
+    result = job_store.result(job['job_id'])
+    for name in colorlab.ANALYSIS_SECTIONS:
+        assert result[name] == fresh[name]
@@ -0,0 +1,72 @@
+"""Weighted k-means: dominant colours and cluster populations"""
+import numpy as np
+import pytest
+
+
+def blocks(shares, colors, total=1000):
+    """(total, 3) pixels made of flat colour blocks with the given pixel shares"""
+    return np.repeat(np.array(colors, dtype=np.uint8), [int(total * share) for share in shares], axis=0)
+
+
+def test_dominant_colors_report_cluster_populations(colorlab, quiet):
+    pixels = blocks([0.5, 0.3, 0.2], [(200, 30, 30), (30, 200, 30), (30, 30, 200)])
+    with quiet():
+        dominant = colorlab.generate_enhanced_dominant_colors(pixels, colorlab.count_colors(pixels))
+    assert [color['pixel_count'] for color in dominant] == [500, 300, 200]
+    assert [color['percentage'] for color in dominant] == [50.0, 30.0, 20.0]
+    assert [color['hex'] for color in dominant] == ['#c81e1e', '#1ec81e', '#1e1ec8']
+
+
+def test_dominant_colors_cover_every_pixel(colorlab, quiet):
+    pixels = np.random.default_rng(1).integers(0, 256, (5000, 3), dtype=np.uint8)
+    with quiet():
+        dominant = colorlab.generate_enhanced_dominant_colors(pixels, colorlab.count_colors(pixels))
+    assert len(dominant) == colorlab.DOMINANT_COLORS_K
+    assert sum(color['pixel_count'] for color in dominant) == len(pixels)
+    assert sum(color['percentage'] for color in dominant) == pytest.approx(100, abs=0.1)
+
+
+def clusters(k, per_cluster=400, spread=6, seed=0):
+    """Distinct colours scattered tightly around k well-separated centres, with unit weights"""
+    rng = np.random.default_rng(seed)
+    centres = np.array([(r, g, b) for r in (40, 215) for g in (40, 215) for b in (40, 215)])[:k]
+    points = np.vstack([centre + rng.normal(0, spread, (per_cluster, 3)) for centre in centres])
+    points = np.unique(np.clip(np.round(points), 0, 255).astype(np.uint8), axis=0)
+    return points, np.ones(len(points))
+
+
+@pytest.mark.parametrize('k', [5, 7, 8])
+def test_select_kmeans_k_finds_separated_clusters(colorlab, k):
+    points, weights = clusters(k)
+    selection, centers = colorlab.select_kmeans_k(points, weights)
+    assert selection['selected_k'] == k
+    assert len(centers) == k
+    low, high = colorlab.KMEANS_AUTO_K_RANGE
+    assert [candidate['k'] for candidate in selection['candidates']] == list(range(low, high + 1))
+
+
+def test_select_kmeans_k_work_is_bounded(colorlab, monkeypatch):
+    # Every distinct colour of a noisy image: the fits must run on bins, not on these
+    points = np.unique(np.random.default_rng(2).integers(0, 256, (200000, 3), dtype=np.uint8), axis=0)
+    fits, scored = [], []
+    weighted_kmeans, weighted_silhouette = colorlab.weighted_kmeans, colorlab.weighted_silhouette
+
+    def recording_kmeans(points, weights, k, max_iterations=colorlab.KMEANS_MAX_ITERATIONS, **kwargs):
+        result = weighted_kmeans(points, weights, k, max_iterations, **kwargs)
+        fits.append((len(points), max_iterations, result['iterations']))
+        return result
+
+    def recording_silhouette(points, weights, labels, k):
+        scored.append(len(points))
+        return weighted_silhouette(points, weights, labels, k)
+
+    monkeypatch.setattr(colorlab, 'weighted_kmeans', recording_kmeans)
+    monkeypatch.setattr(colorlab, 'weighted_silhouette', recording_silhouette)
+    selection, _ = colorlab.select_kmeans_k(points, np.ones(len(points)))
+
+    low, high = colorlab.KMEANS_AUTO_K_RANGE
+    assert len(fits) == len(scored) == high - low + 1
+    assert all(size <= (1 << colorlab.KMEANS_AUTO_BITS) ** 3 for size, _, _ in fits)
+    assert all(limit == colorlab.KMEANS_AUTO_ITERATIONS and done <= limit for _, limit, done in fits)
+    assert all(size <= colorlab.KMEANS_SILHOUETTE_SAMPLE for size in scored)
+    assert selection['sample_size'] <= colorlab.KMEANS_SILHOUETTE_SAMPLE
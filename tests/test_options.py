@@ -0,0 +1,26 @@
+"""Request options: validation and section planning"""
+import json
+
+import pytest
+
+
+@pytest.mark.parametrize('options, message', [
+    ({'max_dimension': 'abc'}, 'max_dimension'),
+    ({'max_dimension': 0}, 'max_dimension'),
+    ({'grid': [0, 3]}, 'grid'),
+    ({'grid': [4]}, 'grid'),
+    ({'grid': 'wide'}, 'grid'),
+    ({'histogram_bins': 0}, 'histogram_bins'),
+    ({'histogram_bins': 'many'}, 'histogram_bins'),
+])
+def test_invalid_options_are_bad_requests(colorlab, options, message):
+    event = {'path': '/analyze', 'httpMethod': 'POST', 'body': json.dumps({'image_data': 'AAAA', 'options': options})}
+    response = colorlab.lambda_handler(event, None)
+    assert response['statusCode'] == 400
+    assert message in json.loads(response['body'])['error']
+
+
+def test_grid_accepts_list_or_string(colorlab):
+    assert colorlab.grid_option({'grid': [2, 3]}) == (2, 3)
+    assert colorlab.grid_option({'grid': '4x5'}) == (4, 5)
+    assert colorlab.grid_option({}) is None
@@ -0,0 +1,115 @@
+"""Palette index: storage round trips, search ranking, palette limits and the NumPy 1.x popcount path"""
+import json
+import types
+
+import numpy as np
+import pytest
+
+
+def random_palettes(count, seed=0, size=5):
+    rng = np.random.default_rng(seed)
+    return [(f"img-{i}", rng.integers(0, 256, (size, 3)).astype(np.uint8), rng.dirichlet(np.ones(size)))
+            for i in range(count)]
+
+
+@pytest.fixture
+def index(colorlab, tmp_path):
+    return colorlab.PaletteIndex(str(tmp_path / 'palettes'))
+
+
+def test_add_get_and_reopen(colorlab, index, tmp_path):
+    palettes = random_palettes(50)
+    assert index.add_many(palettes) == 50
+    assert index.add('img-3', *palettes[3][1:]) == 50
+    signature, record = index.get('img-3')
+    assert record['id'] == b'img-3'
+    assert np.allclose(signature, colorlab.palette_signature(*palettes[3][1:]), atol=1e-3)
+    assert index.get('missing') is None
+    assert len(colorlab.PaletteIndex(str(tmp_path / 'palettes'))) == 50
+
+
+def test_search_ranks_identical_palette_first(colorlab, index):
+    palettes = random_palettes(3000, size=6)
+    index.add_many(palettes)
+    _, colors, weights = palettes[1234]
+    signature = colorlab.palette_signature(colors, weights)
+    matches, scored = index.search(signature, 5, candidates=500)
+    assert matches[0][0] == 'img-1234'
+    assert matches[0][1] == pytest.approx(1.0, abs=1e-3)
+    assert scored == 500
+    assert [m[1] for m in matches] == sorted((m[1] for m in matches), reverse=True)
+    excluded, _ = index.search(signature, 5, exclude_id='img-1234', candidates=500)
+    assert 'img-1234' not in [m[0] for m in excluded]
+
+
+def test_hashed_search_recall_against_exact(colorlab, index):
+    palettes = random_palettes(5000, seed=1, size=4)
+    index.add_many(palettes)
+    hits = 0
+    for _, colors, weights in random_palettes(20, seed=2, size=4):
+        signature = colorlab.palette_signature(colors, weights)
+        found, _ = index.search(signature, 10, candidates=1000)
+        exact, _ = index.search(signature, 10, candidates=len(index))
+        hits += len({m[0] for m in found} & {m[0] for m in exact})
+    assert hits / 200 >= 0.9
+
+
+def test_long_palette_keeps_heaviest_colours(colorlab, index):
+    colors = np.arange(36, dtype=np.uint8).reshape(12, 3) * 7
+    weights = np.arange(1, 13, dtype=np.float64)
+    index.add('long', colors, weights)
+    _, record = index.get('long')
+    assert record['size'] == colorlab.PALETTE_MAX_COLORS
+    kept = {tuple(c) for c in record['colors'][:record['size']].tolist()}
+    assert kept == {tuple(c) for c in colors[-colorlab.PALETTE_MAX_COLORS:].tolist()}
+    assert record['weights'].sum() == pytest.approx(1.0)
+
+
+def test_parse_palette_limits_and_errors(colorlab):
+    colors, weights = colorlab.parse_palette([{'hex': f'#0000{i:02x}', 'weight': i + 1} for i in range(10)])
+    assert len(colors) == colorlab.PALETTE_MAX_COLORS
+    assert weights.sum() == pytest.approx(1.0)
+    for bad in ([], ['#zzzzzz'], [{'hex': '#000000', 'weight': -1}], [3], [{'hex': '#ffffff', 'weight': 0}]):
+        with pytest.raises(ValueError):
+            colorlab.parse_palette(bad)
+
+
+def test_popcount_table_matches_bit_count(colorlab, monkeypatch):
+    words = np.random.default_rng(3).integers(0, 2 ** 63, (200, 4), dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    expected = np.vectorize(lambda w: bin(int(w)).count('1'))(words)
+    assert np.array_equal(colorlab.popcount(words), expected)
+    # NumPy before 2.0 has no bitwise_count
+    numpy_1 = types.SimpleNamespace(**{name: getattr(np, name) for name in dir(np) if name != 'bitwise_count'})
+    monkeypatch.setattr(colorlab, 'np', numpy_1)
+    monkeypatch.delitem(colorlab._PALETTE_TABLES, 'popcount', raising=False)
+    assert np.array_equal(colorlab.popcount(words), expected)
+
+
+def test_search_without_bitwise_count(colorlab, index, monkeypatch):
+    palettes = random_palettes(2000)
+    index.add_many(palettes)
+    signature = colorlab.palette_signature(*palettes[7][1:])
+    expected, _ = index.search(signature, 5, candidates=300)
+    numpy_1 = types.SimpleNamespace(**{name: getattr(np, name) for name in dir(np) if name != 'bitwise_count'})
+    monkeypatch.setattr(colorlab, 'np', numpy_1)
+    found, _ = index.search(signature, 5, candidates=300)
+    assert [m[0] for m in found] == [m[0] for m in expected]
+
+
+def test_search_route(colorlab, quiet, tmp_path, monkeypatch):
+    monkeypatch.setattr(colorlab, 'PALETTE_INDEX_DIR', str(tmp_path / 'route'))
+    colorlab.get_palette_index().add_many(random_palettes(100))
+
+    def search(body):
+        with quiet():
+            response = colorlab.lambda_handler({'path': '/palettes/search', 'httpMethod': 'POST',
+                                                'body': json.dumps(body)}, None)
+        return response['statusCode'], json.loads(response['body'])
+
+    status, body = search({'palette': [f'#{i:02x}{i:02x}{i:02x}' for i in range(0, 240, 20)], 'top_n': 3})
+    assert status == 200 and len(body['results']) == 3
+    status, body = search({'image_id': 'img-5', 'top_n': 3})
+    assert status == 200 and 'img-5' not in [r['image_id'] for r in body['results']]
+    assert search({'image_id': 'nope'})[0] == 404
+    assert search({'palette': ['#000000'], 'top_n': 0})[0] == 400
+    assert search({'palette': 'red'})[0] == 400
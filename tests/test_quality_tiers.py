@@ -0,0 +1,31 @@
+"""Quality tiers: stratified sampling and the error margins attached to sampled results"""
+import numpy as np
+from bench_stages import synthetic_jpeg
+
+
+def test_stratified_sample_takes_one_pixel_per_cell(colorlab):
+    height, width, step = 37, 50, 4
+    # Each pixel encodes its own coordinates
+    pixels = np.zeros((height, width, 3), dtype=np.uint8)
+    pixels[..., 0], pixels[..., 1] = np.indices((height, width))
+    sample = colorlab.stratified_sample(pixels, step, np.random.default_rng(0))
+    assert sample.shape == (-(-height // step), -(-width // step), 3)
+    rows, cols = np.indices(sample.shape[:2])
+    assert np.all(sample[..., 0] // step == rows) and np.all(sample[..., 1] // step == cols)
+
+
+def test_margins_only_on_sample_estimates(colorlab, quiet):
+    with quiet():
+        analysis = colorlab.analyze_image_bytes(synthetic_jpeg('photo', 1), {'cache': False, 'quality': 'fast', 'index': False})
+    assert analysis['metadata']['sampling']['sample_step'] == 4
+    assert all(color['percentage_margin'] > 0 for color in analysis['dominant_colors'])
+    assert all(cluster['percentage_margin'] > 0 for cluster in analysis['kmeans_analysis']['clusters'])
+    assert 'percentage_margin' in analysis['color_frequency']['most_frequent']
+    assert 'bin_margins' in analysis['histograms']
+
+
+def test_exact_tier_has_no_margins(colorlab, quiet):
+    with quiet():
+        analysis = colorlab.analyze_image_bytes(synthetic_jpeg('photo', 0.1), {'cache': False, 'index': False})
+    assert 'sampling' not in analysis['metadata']
+    assert all('percentage_margin' not in cluster for cluster in analysis['kmeans_analysis']['clusters'])
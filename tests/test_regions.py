@@ -0,0 +1,67 @@
+"""Summed-area regional statistics against plain NumPy"""
+import numpy as np
+import pytest
+
+
+def image(height, width, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+def saturation(pixels):
+    pixels = pixels.reshape(-1, 3).astype(np.float64)
+    high, low = pixels.max(axis=1), pixels.min(axis=1)
+    return np.divide(high - low, high, out=np.zeros_like(high), where=high > 0)
+
+
+@pytest.mark.parametrize('length, parts', [(10, 3), (9, 3), (2, 3), (1, 3), (100, 7)])
+def test_grid_boundaries_tile_the_axis(colorlab, length, parts):
+    bounds = colorlab.grid_boundaries(length, parts)
+    assert len(bounds) == parts + 1 and bounds[0] == 0 and bounds[-1] == length
+    assert all(a <= b for a, b in zip(bounds, bounds[1:]))
+    # Every region but the last has the floor size
+    assert np.diff(bounds)[:-1].tolist() == [length // parts] * (parts - 1)
+
+
+@pytest.mark.parametrize('height, width', [(1, 1), (7, 5), (31, 64), (65, 3)])
+def test_integral_region_sums_match_numpy(colorlab, monkeypatch, height, width):
+    # Small blocks so the table is built across several row blocks
+    monkeypatch.setattr(colorlab, 'STATS_CHUNK_PIXELS', 2 * width)
+    pixels = image(height, width)
+    integral = colorlab.build_integral_images(pixels)
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        y0, y1 = sorted(rng.integers(0, height + 1, 2))
+        x0, x1 = sorted(rng.integers(0, width + 1, 2))
+        region = pixels[y0:y1, x0:x1]
+        expected = np.append(region.reshape(-1, 3).sum(axis=0), saturation(region).sum())
+        np.testing.assert_allclose(colorlab.integral_region_sums(integral, y0, y1, x0, x1), expected, atol=1e-6)
+
+
+@pytest.mark.parametrize('rows, cols', [(3, 3), (2, 5)])
+def test_grid_region_means_match_numpy(colorlab, rows, cols):
+    pixels = image(37, 41)
+    regions = colorlab.analyze_grid_regions(pixels, rows, cols)
+    y_bounds, x_bounds = colorlab.grid_boundaries(37, rows), colorlab.grid_boundaries(41, cols)
+    for i, region in enumerate(regions):
+        row, col = divmod(i, cols)
+        block = pixels[y_bounds[row]:y_bounds[row + 1], x_bounds[col]:x_bounds[col + 1]].reshape(-1, 3)
+        means = block.mean(axis=0)
+        stats = region['statistics']
+        assert stats['pixel_count'] == len(block)
+        assert stats['unique_colors'] == len(np.unique(block, axis=0))
+        assert stats['brightness'] == pytest.approx(round(means.sum() / (3 * 255), 3), abs=1e-3)
+        assert stats['saturation'] == pytest.approx(round(saturation(block).mean(), 3), abs=1e-3)
+        assert region['average_color']['rgb'] == dict(zip('rgb', (int(v) for v in means)))
+
+
+def test_empty_regions_keep_the_region_schema(colorlab, quiet):
+    pixels = np.array([[[200, 30, 30]]], dtype=np.uint8)
+    with quiet():
+        analysis = colorlab.analyze_enhanced_regional_analysis(b'', pixels.reshape(-1, 3), 1, 1, [2, 2])
+    for regions in (analysis['regions'], analysis['grid_analysis']['regions']):
+        counts = [region['statistics']['pixel_count'] for region in regions]
+        assert sum(counts) == 1 and 0 in counts
+        assert len({tuple(region) for region in regions}) == 1
+        for region in regions:
+            assert set(region['dominant_color']) == {'hex', 'rgb', 'name', 'percentage'}
+            assert set(region['statistics']) == {'pixel_count', 'unique_colors', 'color_diversity', 'brightness', 'saturation'}
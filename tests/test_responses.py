@@ -0,0 +1,122 @@
+"""Response encoding: compact payloads and compression"""
+import base64
+import contextlib
+import gzip
+import io
+import json
+
+import pytest
+from bench_stages import synthetic_jpeg
+
+
+def expand_colors(value):
+    """Inverse of compact_colors for comparison: packed integers back to "#rrggbb" strings"""
+    if isinstance(value, list):
+        return [expand_colors(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    expanded = {}
+    for key, item in value.items():
+        if key == 'rgb' and isinstance(item, int):
+            expanded['hex'] = f"#{item:06x}"
+        elif key == 'color' and isinstance(item, int):
+            expanded[key] = f"#{item:06x}"
+        else:
+            expanded[key] = expand_colors(item)
+    return expanded
+
+
+def without_rgb_dicts(value):
+    """value with the r/g/b dicts that sit next to a hex colour removed"""
+    if isinstance(value, list):
+        return [without_rgb_dicts(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    return {key: without_rgb_dicts(item) for key, item in value.items()
+            if not (key == 'rgb' and isinstance(value.get('hex'), str))}
+
+
+def sections(analysis):
+    return {name: section for name, section in analysis.items() if name != 'metadata'}
+
+
+def decode_body(response):
+    body = response['body']
+    if not response.get('isBase64Encoded'):
+        return json.loads(body)
+    data = base64.b64decode(body)
+    encoding = response['headers']['Content-Encoding']
+    if encoding == 'br':
+        import brotli
+        data = brotli.decompress(data)
+    else:
+        data = gzip.decompress(data)
+    return json.loads(data)
+
+
+@pytest.fixture(scope='module')
+def analysis():
+    import lambda_function_colorlab_complete as colorlab
+    with contextlib.redirect_stdout(io.StringIO()):
+        # The sections a compact request computes by default
+        return colorlab.analyze_image_bytes(synthetic_jpeg('photo', 0.1), {'cache': False, 'compact': True})
+
+
+def test_compact_analysis_round_trips(colorlab, analysis):
+    # Through the encoder and back, as a client would read it
+    compact = json.loads(colorlab.dumps_json(colorlab.compact_analysis(analysis)))
+    full = json.loads(json.dumps(analysis))
+    
+    assert compact['metadata']['encoding'] == {'compact': True, 'color_format': '0xRRGGBB'}
+    assert not set(colorlab.COMPACT_DROPPED_SECTIONS) & set(compact)
+    assert expand_colors(sections(compact)) == without_rgb_dicts(sections(full))
+
+
+def test_compact_analysis_drops_placeholders_not_asked_for(colorlab):
+    placeholders = {name: {'static': True} for name in colorlab.COMPACT_DROPPED_SECTIONS}
+    analysis = dict(placeholders, metadata={'sections': ['dominant_colors']}, dominant_colors=[])
+    assert set(colorlab.compact_analysis(analysis)) == {'metadata', 'dominant_colors'}
+    analysis['metadata']['sections'] = ['dominant_colors', 'cnn_analysis']
+    assert set(colorlab.compact_analysis(analysis)) == {'metadata', 'dominant_colors', 'cnn_analysis'}
+
+
+@pytest.mark.parametrize('fast_encoder', [True, False])
+def test_dumps_json_round_trips(colorlab, monkeypatch, analysis, fast_encoder):
+    if fast_encoder and colorlab.orjson is None:
+        pytest.skip('orjson is not installed')
+    if not fast_encoder:
+        monkeypatch.setattr(colorlab, 'orjson', None)
+    assert json.loads(colorlab.dumps_json(analysis)) == json.loads(json.dumps(analysis))
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'br'])
+def test_compressed_response_round_trips(colorlab, monkeypatch, analysis, encoding):
+    if encoding == 'br' and colorlab.brotli is None:
+        pytest.skip('brotli is not installed')
+    monkeypatch.setattr(colorlab, 'RESPONSE_COMPRESSION', True)
+    payload = {'success': True, 'analysis': colorlab.compact_analysis(analysis)}
+    event = {'headers': {'Accept-Encoding': f'{encoding}, identity;q=0.5'}}
+    
+    response = colorlab.encoded_response(200, {'Content-Type': 'application/json'}, payload, event)
+    assert response['isBase64Encoded']
+    assert response['headers']['Content-Encoding'] == encoding
+    assert decode_body(response) == json.loads(colorlab.dumps_json(payload))
+
+
+def test_handler_serves_compact_compressed_analysis(colorlab, quiet, monkeypatch, analysis):
+    monkeypatch.setattr(colorlab, 'RESPONSE_COMPRESSION', True)
+    event = {
+        'httpMethod': 'POST', 'path': '/analyze',
+        'headers': {'Content-Type': 'application/json', 'Accept-Encoding': 'gzip'},
+        'body': json.dumps({'image_data': base64.b64encode(synthetic_jpeg('photo', 0.1)).decode('ascii'),
+                            'options': {'compact': True, 'cache': False}})
+    }
+    with quiet():
+        response = colorlab.lambda_handler(event, None)
+    
+    assert response['statusCode'] == 200
+    assert response['headers']['Content-Encoding'] == 'gzip'
+    served = decode_body(response)['analysis']
+    expected = json.loads(colorlab.dumps_json(colorlab.compact_analysis(analysis)))
+    assert sections(served) == sections(expected)
+
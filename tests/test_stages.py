@@ -0,0 +1,76 @@
+"""Stage graph: planning and concurrent execution"""
+import json
+import threading
+import time
+
+import pytest
+from bench_stages import synthetic_jpeg
+
+
+def run_plan(colorlab, quiet, image_bytes, workers, sections=None):
+    plan = colorlab.analysis_stage_plan(sections)
+    with quiet():
+        colors_data = colorlab.extract_colors_from_image_bytes(image_bytes, stages=plan)
+        return colorlab.run_analysis_stages(plan, image_bytes, colors_data, {'stage_workers': workers})
+
+
+def recording_stages(colorlab, monkeypatch, events, delay=0.0):
+    """Wrap every stage to append ('start' | 'end', name, running count) to events"""
+    lock, running = threading.Lock(), [0]
+    
+    def wrap(name, stage):
+        def run(context):
+            with lock:
+                running[0] += 1
+                events.append(('start', name, running[0]))
+            try:
+                time.sleep(delay)
+                return stage(context)
+            finally:
+                with lock:
+                    running[0] -= 1
+                    events.append(('end', name, running[0]))
+        return run
+    
+    for name, (dependencies, stage) in list(colorlab.ANALYSIS_STAGES.items()):
+        monkeypatch.setitem(colorlab.ANALYSIS_STAGES, name, (dependencies, wrap(name, stage)))
+
+
+@pytest.mark.parametrize('kind', ['photo', 'noise'])
+def test_concurrent_stages_match_serial_output(colorlab, quiet, monkeypatch, kind):
+    # Let the pool use more threads than this machine may have cores
+    monkeypatch.setattr(colorlab, 'available_workers', lambda: 4)
+    image_bytes = synthetic_jpeg(kind, 0.1)
+    serial = run_plan(colorlab, quiet, image_bytes, 1)
+    
+    events = []
+    recording_stages(colorlab, monkeypatch, events, delay=0.01)
+    concurrent = run_plan(colorlab, quiet, image_bytes, 4)
+    
+    assert max(running for _, _, running in events) > 1
+    for name in colorlab.ANALYSIS_SECTIONS:
+        assert json.dumps(concurrent[name], sort_keys=True) == json.dumps(serial[name], sort_keys=True), name
+    
+    # Every stage starts only after all of its dependencies have finished
+    finished = set()
+    for event, name, _ in events:
+        if event == 'start':
+            assert set(colorlab.ANALYSIS_STAGES[name][0]) <= finished, name
+        else:
+            finished.add(name)
+    assert finished == set(colorlab.ANALYSIS_STAGES)
+
+
+@pytest.mark.parametrize('sections, stages', [
+    (['histograms'], ['color_cube', 'histograms']),
+    (['characteristics'], ['dominant_colors', 'pixel_stats', 'characteristics']),
+    (['color_frequency'], ['color_frequency']),
+])
+def test_requested_sections_run_only_their_stages(colorlab, quiet, monkeypatch, sections, stages):
+    events = []
+    recording_stages(colorlab, monkeypatch, events)
+    with quiet():
+        result = colorlab.analyze_image_bytes(synthetic_jpeg('photo', 0.1), {'sections': sections, 'cache': False})
+    
+    assert sorted(name for event, name, _ in events if event == 'start') == sorted(stages)
+    assert [name for name in colorlab.ANALYSIS_SECTIONS if name in result] == sections
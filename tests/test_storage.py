@@ -0,0 +1,101 @@
+"""Image storage: analysis by reference through the storage backends"""
+import io
+import json
+
+import pytest
+from bench_stages import synthetic_jpeg
+from PIL import Image
+
+
+class RecordingStorage:
+    """Wraps a backend and records the reads made through it"""
+    
+    def __init__(self, backend):
+        self.backend, self.reads = backend, []
+    
+    def read_range(self, bucket, key, start, length):
+        self.reads.append(('range', start, length))
+        return self.backend.read_range(bucket, key, start, length)
+    
+    def stream(self, bucket, key, start):
+        self.reads.append(('stream', start))
+        return self.backend.stream(bucket, key, start)
+
+
+@pytest.fixture(params=['memory', 'local'])
+def backend(request, colorlab, tmp_path):
+    """Empty backend of each kind with a put(bucket, key, data) helper"""
+    if request.param == 'memory':
+        return colorlab.MemoryStorage()
+    storage = colorlab.LocalStorage(str(tmp_path))
+    
+    def put(bucket, key, data):
+        path = tmp_path / bucket / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    
+    storage.put = put
+    return storage
+
+
+def test_missing_key_is_not_found(colorlab, backend):
+    with pytest.raises(FileNotFoundError):
+        colorlab.fetch_image_object('photos', 'missing.jpg', backend)
+
+
+def test_header_probe_then_streamed_rest(colorlab, quiet, backend, monkeypatch):
+    monkeypatch.setattr(colorlab, 'HEADER_PROBE_BYTES', 1024)
+    monkeypatch.setattr(colorlab, 'STORAGE_CHUNK_BYTES', 4096)
+    data = synthetic_jpeg('photo', 0.1)
+    backend.put('photos', 'a/b.jpg', data)
+    storage = RecordingStorage(backend)
+    with quiet():
+        image_bytes, source = colorlab.fetch_image_object('photos', 'a/b.jpg', storage)
+    assert bytes(image_bytes) == data
+    assert storage.reads == [('range', 0, 1024), ('stream', 1024)]
+    width, height = Image.open(io.BytesIO(data)).size
+    assert source == {'bucket': 'photos', 'key': 'a/b.jpg', 'bytes': len(data), 'format': 'JPEG', 'width': width, 'height': height}
+
+
+def test_small_object_needs_one_ranged_read(colorlab, backend):
+    data = synthetic_jpeg('flat', 0.01)
+    backend.put('photos', 'small.jpg', data)
+    storage = RecordingStorage(backend)
+    image_bytes, source = colorlab.fetch_image_object('photos', 'small.jpg', storage)
+    assert bytes(image_bytes) == data and source['bytes'] == len(data)
+    assert storage.reads == [('range', 0, colorlab.HEADER_PROBE_BYTES)]
+
+
+def test_oversized_image_is_rejected_before_download(colorlab, backend, monkeypatch):
+    monkeypatch.setattr(colorlab, 'HEADER_PROBE_BYTES', 1024)
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 1000)
+    backend.put('photos', 'huge.jpg', synthetic_jpeg('photo', 0.1))
+    storage = RecordingStorage(backend)
+    with pytest.raises(ValueError, match='too large'):
+        colorlab.fetch_image_object('photos', 'huge.jpg', storage)
+    assert storage.reads == [('range', 0, 1024)]
+
+
+def test_local_keys_cannot_escape_the_root(colorlab, tmp_path):
+    with pytest.raises(ValueError):
+        colorlab.LocalStorage(str(tmp_path)).read_range('photos', '../../etc/passwd', 0, 16)
+
+
+def test_analyze_by_reference_status_codes(colorlab, quiet):
+    storage = colorlab.MemoryStorage()
+    storage.put('photos', 'a.jpg', synthetic_jpeg('photo', 0.1))
+    colorlab.set_storage(storage)
+    try:
+        def analyze(uri):
+            event = {'path': '/analyze', 'httpMethod': 'POST',
+                     'body': json.dumps({'image_uri': uri, 'options': {'cache': False, 'index': False}})}
+            with quiet():
+                response = colorlab.lambda_handler(event, None)
+            return response['statusCode'], json.loads(response['body'])
+        
+        status, body = analyze('s3://photos/a.jpg')
+        assert status == 200 and body['analysis']['metadata']['source']['key'] == 'a.jpg'
+        assert analyze('s3://photos/missing.jpg')[0] == 404
+        assert analyze('https://example.com/a.jpg')[0] == 400
+    finally:
+        colorlab.set_storage(None)
@@ -0,0 +1,44 @@
+"""Strip-wise (streaming) analysis: same results as the in-memory path, with analysis memory bounded by the strip"""
+import tracemalloc
+
+import pytest
+from bench_stages import synthetic_jpeg
+
+
+def without_run_metadata(analysis):
+    return {name: section for name, section in analysis.items() if name != 'metadata'}
+
+
+@pytest.mark.parametrize('kind', ['photo', 'noise'])
+def test_streaming_matches_in_memory(colorlab, quiet, monkeypatch, kind):
+    monkeypatch.setattr(colorlab, 'STREAM_STRIP_PIXELS', 1 << 16)
+    image_bytes = synthetic_jpeg(kind, 0.5)
+    with quiet():
+        streamed = colorlab.analyze_image_bytes(image_bytes, {'cache': False, 'streaming': True, 'index': False})
+        in_memory = colorlab.analyze_image_bytes(image_bytes, {'cache': False, 'streaming': False, 'index': False})
+    assert streamed['metadata']['streamed'] and not in_memory['metadata']['streamed']
+    assert without_run_metadata(streamed) == without_run_metadata(in_memory)
+
+
+def extraction_peak(colorlab, quiet, image_bytes, streaming):
+    """Peak traced allocation of a full-resolution extraction (NumPy and Python, not Pillow's raster)"""
+    tracemalloc.start()
+    try:
+        with quiet():
+            colors_data = colorlab.extract_colors_from_image_bytes(image_bytes, 0, streaming=streaming)
+        return tracemalloc.get_traced_memory()[1], colors_data
+    finally:
+        tracemalloc.stop()
+
+
+def test_streaming_analysis_memory_is_bounded_by_strip(colorlab, quiet, monkeypatch):
+    monkeypatch.setattr(colorlab, 'STREAM_STRIP_PIXELS', 1 << 18)
+    monkeypatch.setattr(colorlab, 'COUNT_MERGE_ENTRIES', 1 << 16)
+    small_peak, _ = extraction_peak(colorlab, quiet, synthetic_jpeg('photo', 2), True)
+    large_bytes = synthetic_jpeg('photo', 8)
+    large_peak, colors_data = extraction_peak(colorlab, quiet, large_bytes, True)
+    in_memory_peak, _ = extraction_peak(colorlab, quiet, large_bytes, False)
+    assert colors_data['streamed'] and colors_data['total_samples'] > 7_000_000
+    # Four times the pixels, about the same working memory
+    assert large_peak < 1.5 * small_peak
+    assert large_peak < in_memory_peak / 4
@@ -0,0 +1,52 @@
+"""Binary uploads: option precedence and malformed option payloads"""
+import json
+
+BOUNDARY = 'colorlab-test'
+
+
+def multipart_event(options=None, header=None, query=None):
+    parts = [b'--' + BOUNDARY.encode() + b'\r\nContent-Disposition: form-data; name="image"; filename="a.jpg"\r\n\r\nJPEG']
+    if options is not None:
+        parts.append(b'--' + BOUNDARY.encode() + b'\r\nContent-Disposition: form-data; name="options"\r\n\r\n' + options.encode())
+    body = b'\r\n'.join(parts) + b'\r\n--' + BOUNDARY.encode() + b'--\r\n'
+    headers = {'Content-Type': f'multipart/form-data; boundary={BOUNDARY}'}
+    if header is not None:
+        headers['X-ColorLab-Options'] = header
+    return {'headers': headers, 'queryStringParameters': query, 'body': body.decode('latin-1')}
+
+
+def read_options(colorlab, event):
+    return colorlab.read_binary_upload(event, event['headers']['Content-Type'])[1]
+
+
+def test_form_options_override_query(colorlab):
+    event = multipart_event(options=json.dumps({'max_dimension': 64}), query={'max_dimension': '32', 'sections': 'palette'})
+    assert read_options(colorlab, event) == {'max_dimension': 64, 'sections': 'palette'}
+
+
+def test_header_overrides_form_and_query(colorlab):
+    event = multipart_event(options=json.dumps({'max_dimension': 64, 'grid': [4, 4]}),
+                            header=json.dumps({'max_dimension': 128}), query={'max_dimension': '32'})
+    assert read_options(colorlab, event) == {'max_dimension': 128, 'grid': [4, 4]}
+
+
+def test_raw_upload_header_overrides_query(colorlab):
+    event = {'headers': {'Content-Type': 'image/jpeg', 'X-ColorLab-Options': '{"max_dimension": 128}'},
+             'queryStringParameters': {'max_dimension': '32'}, 'body': 'JPEG'}
+    assert read_options(colorlab, event) == {'max_dimension': 128}
+
+
+def test_non_object_options_are_bad_requests(colorlab):
+    for event in (multipart_event(header='[1, 2]'), multipart_event(header='7'), multipart_event(options='"fast"')):
+        response = colorlab.handle_enhanced_analysis(event, {})
+        assert response['statusCode'] == 400
+        assert 'JSON object' in json.loads(response['body'])['error']
+
+
+def test_non_object_json_body_options_are_bad_requests(colorlab):
+    for options in ('fast', [1, 2], 7):
+        event = {'headers': {'Content-Type': 'application/json'},
+                 'body': json.dumps({'image_data': 'AAAA', 'options': options})}
+        response = colorlab.handle_enhanced_analysis(event, {})
+        assert response['statusCode'] == 400
+        assert 'JSON object' in json.loads(response['body'])['error']